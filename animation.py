@@ -0,0 +1,139 @@
+from PIL import Image, ImageSequence
+from PIL.PngImagePlugin import Blend
+
+from image_roi import check_decode_budget, get_preview_size, open_image
+
+# Frames sampled to build the single GIF palette, and the largest size each
+# sample is reduced to first
+PALETTE_SAMPLE_FRAMES = 16
+PALETTE_SAMPLE_SIZE = 512
+WEBP_QUALITY = 90
+
+# Alpha below this becomes the GIF transparency index
+TRANSPARENCY_THRESHOLD = 128
+TRANSPARENT_INDEX = 255
+
+# Multi-frame formats that are animations (not TIFF pages or MPO pairs)
+ANIMATED_FORMATS = {"GIF", "PNG", "WEBP"}
+
+
+def is_animated(path):
+    try:
+        with open_image(path) as img:
+            return img.format in ANIMATED_FORMATS and getattr(img, "n_frames", 1) > 1
+    except OSError:
+        return False
+
+
+def get_sample_indices(frame_count, num_samples):
+    if frame_count <= num_samples:
+        return list(range(frame_count))
+    return [int(i * frame_count / num_samples) for i in range(num_samples)]
+
+
+def get_frame_timing(img):
+    # Duration and disposal of every frame; Pillow composites frames while
+    # seeking, so this touches each one once without keeping any
+    durations, disposals = [], []
+    for frame in ImageSequence.Iterator(img):
+        # WebP only reports a frame's duration once it is decoded
+        if "duration" not in frame.info:
+            frame.load()
+        durations.append(frame.info.get("duration", 0))
+        disposals.append(
+            getattr(frame, "disposal_method", frame.info.get("disposal", 0))
+        )
+    img.seek(0)
+    return durations, disposals
+
+
+def build_palette(img, box):
+    # One adaptive palette for the whole output, from frames spread over the
+    # animation; the last index is left free for transparency
+    samples = []
+    for index in get_sample_indices(img.n_frames, PALETTE_SAMPLE_FRAMES):
+        img.seek(index)
+        sample = img.crop(box).convert("RGB")
+        sample.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+        samples.append(sample)
+    img.seek(0)
+
+    width = max(sample.width for sample in samples)
+    sheet = Image.new("RGB", (width, sum(sample.height for sample in samples)))
+    top = 0
+    for sample in samples:
+        sheet.paste(sample, (0, top))
+        top += sample.height
+    return sheet.quantize(colors=TRANSPARENT_INDEX, method=Image.Quantize.MEDIANCUT)
+
+
+def to_palette_frame(frame, palette):
+    rgba = frame.convert("RGBA")
+    quantized = rgba.convert("RGB").quantize(palette=palette)
+    transparent = rgba.getchannel("A").point(
+        lambda alpha: 255 if alpha < TRANSPARENCY_THRESHOLD else 0
+    )
+    if transparent.getbbox():
+        quantized.paste(TRANSPARENT_INDEX, mask=transparent)
+        quantized.info["transparency"] = TRANSPARENT_INDEX
+    return quantized
+
+
+def crop_frames(img, box, palette=None):
+    # Decode, crop and convert one frame at a time
+    for frame in ImageSequence.Iterator(img):
+        cropped = frame.crop(box)
+        if palette is not None:
+            yield to_palette_frame(cropped, palette)
+        else:
+            yield cropped.convert("RGBA")
+
+
+def crop_animation(source_path, output_path, box):
+    # Crop every frame of an animated GIF, WebP or APNG, keeping frame
+    # durations, disposal and the loop count. Returns the number of frames.
+    with open_image(source_path) as img:
+        check_decode_budget(img.width * img.height, "Animation frame")
+        durations, disposals = get_frame_timing(img)
+        options = {
+            "save_all": True,
+            "duration": durations,
+            "loop": img.info.get("loop", 0),
+        }
+
+        palette = None
+        if img.format == "GIF":
+            palette = build_palette(img, box)
+            options["disposal"] = disposals
+            # Frames already share one palette, don't let the writer split it
+            options["optimize"] = False
+        elif img.format == "PNG":
+            # Frames come out fully composited, so each one replaces the last
+            options["disposal"] = disposals
+            options["blend"] = Blend.OP_SOURCE
+        elif img.format == "WEBP":
+            options["quality"] = WEBP_QUALITY
+            if "background" in img.info:
+                options["background"] = img.info["background"]
+
+        frames = crop_frames(img, box, palette)
+        first = next(frames)
+        # The GIF writer pulls frames as it goes; the APNG and WebP writers
+        # walk the list more than once. Either way only cropped frames are
+        # held, never the full-size source frames.
+        if img.format != "GIF":
+            frames = list(frames)
+        first.save(output_path, format=img.format, append_images=frames, **options)
+        return len(durations)
+
+
+def sample_animation_frames(path, num_frames, max_size):
+    # Evenly spaced preview frames for stepping through in the GUI
+    frames = []
+    with open_image(path) as img:
+        check_decode_budget(img.width * img.height, "Animation frame")
+        size = get_preview_size(img.size, max_size)
+        for index in get_sample_indices(img.n_frames, num_frames):
+            img.seek(index)
+            frames.append(img.convert("RGBA").resize(size))
+    return frames
@@ -0,0 +1,201 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from animation import sample_animation_frames
+from config_loader import config
+from frame_index import read_frames
+from image_roi import load_preview
+from media_source import MediaSource
+from scenes import sample_scene_frames
+from utils import MediaType
+
+# Spectral residual saliency is computed on a small square spectrum
+SALIENCY_SIZE = 64
+
+# Frontal face cascade shipped with opencv-python; some builds leave it out
+FACE_CASCADE_PATH = os.path.join(
+    getattr(getattr(cv2, "data", None), "haarcascades", ""),
+    "haarcascade_frontalface_default.xml",
+)
+
+# Cascade classifiers can't be shared between threads
+_detectors = threading.local()
+
+
+def sample_media_frames(path, media_type, media_info, count):
+    # Frames spread over a video or animation, or the still image itself
+    if media_type == MediaType.VIDEO:
+        with MediaSource(path) as source:
+            index = source.frame_index()
+            if config.SCENE_SAMPLING:
+                frame_numbers = sample_scene_frames(path, index, count)
+            else:
+                frame_numbers = index.sample(count)
+            frames = read_frames(path, index, frame_numbers)
+        return [frame for frame in frames if frame is not None]
+    if media_info.get("animated"):
+        return sample_animation_frames(path, count, config.PREVIEW_MAX_SIZE)
+    return [load_preview(path, config.PREVIEW_MAX_SIZE)]
+
+
+def get_content_span(bright_fraction):
+    # First and last line (row or column) with picture in any sample, from
+    # the share of bright pixels per sample and line
+    content = (bright_fraction > config.BLACK_BAR_NOISE).any(axis=0)
+    lines = np.flatnonzero(content)
+    if not len(lines):
+        return None
+    return int(lines[0]), int(lines[-1]) + 1
+
+
+def find_picture_area(frames, source_size):
+    # Tightest rectangle holding picture in every sample, in source pixels,
+    # or None when there are no bars (or no picture at all)
+    if not frames:
+        return None
+
+    # Luma of all samples at once: samples x rows x columns
+    luma = np.stack([np.asarray(frame.convert("L")) for frame in frames])
+    bright = luma > config.BLACK_BAR_LEVEL
+    rows = get_content_span(bright.mean(axis=2))
+    columns = get_content_span(bright.mean(axis=1))
+    if rows is None or columns is None:
+        return None
+
+    # Samples may be downscaled previews; round outwards so no picture is lost
+    frame_height, frame_width = luma.shape[1:]
+    scale_x = source_size[0] / frame_width
+    scale_y = source_size[1] / frame_height
+    left = int(np.floor(columns[0] * scale_x))
+    right = min(source_size[0], int(np.ceil(columns[1] * scale_x)))
+    top = int(np.floor(rows[0] * scale_y))
+    bottom = min(source_size[1], int(np.ceil(rows[1] * scale_y)))
+
+    if (left, top, right, bottom) == (0, 0, *source_size):
+        return None
+    if right - left < config.MIN_CROP_WIDTH or bottom - top < config.MIN_CROP_HEIGHT:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def detect_black_bars(path, media_type, media_info):
+    # Crop rectangle without letterbox/pillarbox bars; the whole frame when
+    # there are none
+    source_size = (media_info["width"], media_info["height"])
+    frames = sample_media_frames(
+        path, media_type, media_info, config.BLACK_BAR_SAMPLES
+    )
+    area = find_picture_area(frames, source_size)
+    for frame in frames:
+        frame.close()
+    if area is None:
+        print("No black bars found")
+        return (0, 0, *source_size)
+    print(f"Picture area without black bars: {area}")
+    return area
+
+
+def get_face_detector():
+    if not hasattr(_detectors, "faces"):
+        _detectors.faces = None
+        if os.path.exists(FACE_CASCADE_PATH):
+            _detectors.faces = cv2.CascadeClassifier(FACE_CASCADE_PATH)
+    return _detectors.faces
+
+
+def get_saliency(gray):
+    # Spectral residual saliency (Hou & Zhang), from opencv-contrib when it
+    # is installed and computed the same way with numpy otherwise
+    if hasattr(cv2, "saliency"):
+        if not hasattr(_detectors, "saliency"):
+            _detectors.saliency = cv2.saliency.StaticSaliencySpectralResidual_create()
+        found, saliency = _detectors.saliency.computeSaliency(gray)
+        if found:
+            return saliency.astype(np.float32)
+
+    small = cv2.resize(gray, (SALIENCY_SIZE, SALIENCY_SIZE)).astype(np.float32)
+    spectrum = np.fft.fft2(small)
+    log_amplitude = np.log(np.abs(spectrum) + 1e-6)
+    residual = log_amplitude - cv2.blur(log_amplitude, (3, 3))
+    saliency = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    saliency = cv2.GaussianBlur(saliency.astype(np.float32), (9, 9), 2.5)
+    return cv2.resize(saliency, (gray.shape[1], gray.shape[0]))
+
+
+def get_subject_map(frame):
+    # Where the subject is in one frame: saliency normalized to a total of
+    # 1, plus faces worth SUBJECT_FACE_WEIGHT between them
+    width = config.SUBJECT_ANALYSIS_WIDTH
+    height = max(1, round(frame.height * width / frame.width))
+    gray = np.asarray(frame.convert("L").resize((width, height)))
+
+    saliency = get_saliency(gray)
+    total = saliency.sum()
+    subject = saliency / total if total > 0 else np.zeros_like(saliency)
+
+    detector = get_face_detector()
+    if detector is not None:
+        faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5)
+        face_area = sum(w * h for _, _, w, h in faces)
+        for x, y, w, h in faces:
+            subject[y : y + h, x : x + w] += config.SUBJECT_FACE_WEIGHT / face_area
+    return subject
+
+
+def get_largest_rect_size(source_size, aspect_ratio):
+    # Biggest width and height of this shape that fit the source
+    source_width, source_height = source_size
+    if source_width / source_height > aspect_ratio:
+        return max(1, round(source_height * aspect_ratio)), source_height
+    return source_width, max(1, round(source_width / aspect_ratio))
+
+
+def get_best_offset(weights, window):
+    # Start of the window (in weight cells) holding the most weight; ties go
+    # to the most central position
+    sums = np.convolve(weights, np.ones(window), mode="valid")
+    best = np.flatnonzero(np.isclose(sums, sums.max()))
+    return int(best[np.argmin(np.abs(best - (len(sums) - 1) / 2))])
+
+
+def find_subject_area(frames, source_size, aspect_ratio):
+    # Largest rectangle of the given shape covering the most subject over all
+    # samples, in source pixels
+    if not frames:
+        return None
+    width, height = get_largest_rect_size(source_size, aspect_ratio)
+
+    # Frames are analysed in parallel; OpenCV and numpy release the GIL
+    workers = min(len(frames), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        subject = np.mean(list(pool.map(get_subject_map, frames)), axis=0)
+
+    # The rectangle spans the whole source along one axis; slide it along
+    # the other
+    x = y = 0
+    if width < source_size[0]:
+        scale = subject.shape[1] / source_size[0]
+        offset = get_best_offset(subject.sum(axis=0), max(1, round(width * scale)))
+        x = min(source_size[0] - width, round(offset / scale))
+    elif height < source_size[1]:
+        scale = subject.shape[0] / source_size[1]
+        offset = get_best_offset(subject.sum(axis=1), max(1, round(height * scale)))
+        y = min(source_size[1] - height, round(offset / scale))
+    return x, y, width, height
+
+
+def detect_subject_crop(path, media_type, media_info, aspect_ratio):
+    # Crop rectangle of the given shape around the subject
+    source_size = (media_info["width"], media_info["height"])
+    frames = sample_media_frames(path, media_type, media_info, config.SUBJECT_SAMPLES)
+    area = find_subject_area(frames, source_size, aspect_ratio)
+    for frame in frames:
+        frame.close()
+    if get_face_detector() is None:
+        print("Face cascade not available, placing the crop by saliency only")
+    print(f"Crop around the subject: {area}")
+    return area
@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    return results, {case["name"]: case for case in results["cases"]}
+
+
+def format_change(old, new):
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two benchmark result files"
+    )
+    parser.add_argument("baseline", help="Results from the older revision")
+    parser.add_argument("candidate", help="Results from the newer revision")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent slowdown reported as a regression (default: 10)",
+    )
+    parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="Also compare per-stage timings of end-to-end runs",
+    )
+    args = parser.parse_args()
+
+    baseline, baseline_cases = load_results(args.baseline)
+    candidate, candidate_cases = load_results(args.candidate)
+    print(f"Baseline:  {baseline.get('revision')} ({baseline.get('created')})")
+    print(f"Candidate: {candidate.get('revision')} ({candidate.get('created')})")
+    if baseline.get("environment") != candidate.get("environment"):
+        print("Warning: results were recorded in different environments")
+    print()
+
+    rows = []
+    regressions = []
+    for name, new in candidate_cases.items():
+        old = baseline_cases.get(name)
+        if not old:
+            rows.append((name, None, new["median"], "new"))
+            continue
+        rows.append(
+            (name, old["median"], new["median"], format_change(old["median"], new["median"]))
+        )
+        if (
+            old["median"]
+            and new["median"] is not None
+            and new["median"] > old["median"] * (1 + args.threshold / 100)
+        ):
+            regressions.append(name)
+
+        # Stage timings help pin a slowdown on download, encode, finalize...
+        if args.stages:
+            old_stages = old.get("stages", {})
+            for stage, seconds in new.get("stages", {}).items():
+                if stage in old_stages:
+                    rows.append(
+                        (
+                            f"  {stage}",
+                            old_stages[stage],
+                            seconds,
+                            format_change(old_stages[stage], seconds),
+                        )
+                    )
+    for name in baseline_cases.keys() - candidate_cases.keys():
+        rows.append((name, baseline_cases[name]["median"], None, "removed"))
+
+    width = max((len(row[0]) for row in rows), default=4)
+    print(f"{'case':<{width}}  {'baseline':>10}  {'candidate':>10}  {'change':>8}")
+    for name, old, new, change in rows:
+        old_text = f"{old:.3f}s" if old is not None else "-"
+        new_text = f"{new:.3f}s" if new is not None else "-"
+        print(f"{name:<{width}}  {old_text:>10}  {new_text:>10}  {change:>8}")
+
+    if regressions:
+        print()
+        print(f"{len(regressions)} case(s) slower by more than {args.threshold:g}%:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Run from the repository root so config.py and the project modules resolve
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+os.environ["QT_QPA_PLATFORM"] = "offscreen"
+
+import numpy as np  # noqa: E402
+from PyQt6.QtCore import QEvent, QPointF, Qt  # noqa: E402
+from PyQt6.QtGui import QMouseEvent  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+from benchmarks.media import ensure_media  # noqa: E402
+from benchmarks.run import (  # noqa: E402
+    DEFAULT_MEDIA_DIR,
+    DEFAULT_RESULTS_DIR,
+    get_environment,
+    git_revision,
+    quiet,
+)
+
+WINDOW_SIZE = (1280, 800)
+
+
+def wait_for_frame(app, stats, frames_before, timeout=1.0):
+    # Spin the event loop until the crop box has painted a new frame
+    deadline = time.perf_counter() + timeout
+    while stats.frames == frames_before and time.perf_counter() < deadline:
+        app.processEvents()
+    return stats.frames > frames_before
+
+
+def settle(app, seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        app.processEvents()
+
+
+def replay(app, stats, steps):
+    # Each step dispatches one input and times it until the frame it caused
+    latencies = []
+    for step in steps:
+        frames_before = stats.frames
+        start = time.perf_counter()
+        step()
+        if wait_for_frame(app, stats, frames_before):
+            latencies.append(stats.last_frame_end - start)
+    return latencies
+
+
+def send_mouse(widget, event_type, x, y):
+    button = Qt.MouseButton.LeftButton
+    buttons = (
+        Qt.MouseButton.NoButton
+        if event_type == QEvent.Type.MouseButtonRelease
+        else Qt.MouseButton.LeftButton
+    )
+    point = QPointF(x, y)
+    event = QMouseEvent(
+        event_type,
+        point,
+        widget.mapToGlobal(point),
+        button,
+        buttons,
+        Qt.KeyboardModifier.NoModifier,
+    )
+    QApplication.sendEvent(widget, event)
+
+
+def mouse_path(crop_box, start, offsets):
+    # Press at start, move through the offsets, release at the last point
+    x, y = start
+    steps = [lambda: send_mouse(crop_box, QEvent.Type.MouseButtonPress, x, y)]
+    for dx, dy in offsets:
+        steps.append(
+            lambda dx=dx, dy=dy: send_mouse(
+                crop_box, QEvent.Type.MouseMove, x + dx, y + dy
+            )
+        )
+    dx, dy = offsets[-1]
+    steps.append(
+        lambda: send_mouse(crop_box, QEvent.Type.MouseButtonRelease, x + dx, y + dy)
+    )
+    return steps
+
+
+def circle_offsets(radius, count):
+    angles = np.linspace(0, 4 * np.pi, count)
+    return [
+        (round(radius * np.cos(a) - radius), round(radius * np.sin(a)))
+        for a in angles
+    ]
+
+
+def reset_crop_box(app, gui):
+    # Middle half of the image, so it can be moved and resized both ways
+    crop_box = gui.image_with_cropbox.crop_box
+    area = gui.image_with_cropbox.image_area
+    crop_box.aspect_ratio = None
+    crop_box.setCropRect(
+        area.width() // 4, area.height() // 4, area.width() // 2, area.height() // 2
+    )
+    settle(app, 0.05)
+    return crop_box
+
+
+def drag_steps(app, gui, count):
+    crop_box = reset_crop_box(app, gui)
+    center = (crop_box.rect.center().x(), crop_box.rect.center().y())
+    radius = min(crop_box.rect.width(), crop_box.rect.height()) // 4
+    return mouse_path(crop_box, center, circle_offsets(radius, count))
+
+
+def resize_steps(app, gui, count, aspect_ratio=None):
+    crop_box = reset_crop_box(app, gui)
+    crop_box.aspect_ratio = aspect_ratio
+    handle = (crop_box.rect.right() - 3, crop_box.rect.bottom() - 3)
+    reach = min(crop_box.rect.width(), crop_box.rect.height()) // 3
+    # Grow and shrink the box from its bottom-right handle
+    offsets = [
+        (round(reach * np.sin(a)), round(reach * np.sin(a)))
+        for a in np.linspace(0, 4 * np.pi, count)
+    ]
+    return mouse_path(crop_box, handle, offsets)
+
+
+def spinbox_steps(app, gui, count):
+    reset_crop_box(app, gui)
+    panel = gui.control_panel
+    x_values = np.linspace(
+        0, panel.x_input.maximum() - panel.width_input.value(), count // 2
+    )
+    width_values = np.linspace(
+        panel.width_input.value(), panel.width_input.value() // 2, count // 2
+    )
+    steps = [lambda v=int(v): panel.x_input.setValue(v) for v in x_values]
+    steps += [lambda v=int(v): panel.width_input.setValue(v) for v in width_values]
+    return steps
+
+
+SCENARIOS = {
+    "drag": drag_steps,
+    "resize": resize_steps,
+    "resize_locked": lambda app, gui, count: resize_steps(app, gui, count, 16 / 9),
+    "spinbox": spinbox_steps,
+}
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000) if len(values) else None
+
+
+def bench_media(app, path, scenarios, count, verbose):
+    from gui.CropGUI import CropGUI
+    from utils import get_media_type
+
+    media_type = get_media_type(os.path.splitext(path)[1])
+    output_dir = tempfile.mkdtemp(prefix="osaka-gui-bench-")
+    with quiet(verbose):
+        gui = CropGUI(path, media_type, output_dir, False)
+        gui.resize(*WINDOW_SIZE)
+        gui.show()
+        # The control panel hooks up to the crop box from a 100 ms timer
+        settle(app, 0.5)
+    stats = gui.image_with_cropbox.frame_stats
+
+    cases = []
+    for name in scenarios:
+        steps = SCENARIOS[name](app, gui, count)
+        stats.reset()
+        with quiet(verbose):
+            latencies = replay(app, stats, steps)
+        paint_times = list(stats.paint_times)
+        case = {
+            "name": f"gui/{name}/{os.path.basename(path)}",
+            "events": len(steps),
+            "frames": len(latencies),
+            "median": float(np.median(latencies)) if latencies else None,
+            "latency_p50_ms": percentile_ms(latencies, 50),
+            "latency_p99_ms": percentile_ms(latencies, 99),
+            "paint_p50_ms": percentile_ms(paint_times, 50),
+            "paint_p99_ms": percentile_ms(paint_times, 99),
+            "dropped_frames": stats.dropped,
+        }
+        print(
+            f"{case['name']}: p50 {case['latency_p50_ms']:.2f} ms, "
+            f"p99 {case['latency_p99_ms']:.2f} ms, "
+            f"paint p50 {case['paint_p50_ms']:.2f} ms"
+        )
+        cases.append(case)
+
+    gui.cleanup_resources()
+    gui.close()
+    gui.deleteLater()
+    app.processEvents()
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay crop box drags, resizes and spinbox edits offscreen"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Use a small media matrix"
+    )
+    parser.add_argument(
+        "--events", type=int, default=200, help="Input events per scenario"
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=list(SCENARIOS),
+        default=list(SCENARIOS),
+        help="Scenarios to run (default: all)",
+    )
+    parser.add_argument(
+        "--media-dir",
+        default=DEFAULT_MEDIA_DIR,
+        help="Where generated test media is kept between runs",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Results file (default: benchmarks/results/<revision>-gui.json)",
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Show GUI output"
+    )
+    args = parser.parse_args()
+
+    videos, images = ensure_media(args.media_dir, quick=args.quick)
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    # The largest JPEG and the first video cover both preview paths
+    largest_image = [path for path in images if path.endswith(".jpg")][-1]
+    media = [largest_image, videos[0]]
+    cases = []
+    for path in media:
+        cases += bench_media(app, path, args.scenarios, args.events, args.verbose)
+
+    results = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "quick": args.quick,
+        "events": args.events,
+        "environment": get_environment(),
+        "cases": cases,
+    }
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{results['revision'] or 'results'}-gui.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import subprocess
+
+import imageio_ffmpeg
+import numpy as np
+from PIL import Image
+
+# Container used for each codec when generating test videos
+CODEC_CONTAINERS = {
+    "libx264": ".mp4",
+    "libvpx-vp9": ".webm",
+    "mpeg4": ".avi",
+}
+
+VIDEO_RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080)]
+VIDEO_GOPS = [12, 250]
+IMAGE_SIZES = [(4000, 3000), (8000, 6000)]
+IMAGE_FORMATS = [".jpg", ".png", ".tiff"]
+
+# Smaller matrix for a quick smoke run
+QUICK_VIDEO_RESOLUTIONS = [(640, 360)]
+QUICK_VIDEO_GOPS = [12]
+QUICK_IMAGE_SIZES = [(2000, 1500)]
+
+
+def video_name(width, height, codec, gop, duration):
+    return f"video_{width}x{height}_{codec}_gop{gop}_{duration}s{CODEC_CONTAINERS[codec]}"
+
+
+def image_name(width, height, ext):
+    return f"image_{width}x{height}{ext}"
+
+
+def generate_video(path, width, height, codec, gop, duration, fps=30):
+    # testsrc2 has motion and fine detail, plus a tone so the audio path runs
+    command = [
+        imageio_ffmpeg.get_ffmpeg_exe(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={duration}",
+        "-c:v",
+        codec,
+        "-g",
+        str(gop),
+        "-pix_fmt",
+        "yuv420p",
+    ]
+    if codec == "libvpx-vp9":
+        command += ["-deadline", "realtime", "-cpu-used", "8", "-c:a", "libopus"]
+    elif codec == "mpeg4":
+        command += ["-q:v", "4", "-c:a", "libmp3lame"]
+    else:
+        command += ["-preset", "veryfast", "-c:a", "aac"]
+    command.append(path)
+    subprocess.run(command, check=True)
+
+
+def generate_image(path, width, height):
+    # Smooth gradients with mild noise: compresses like a photo, not like noise
+    rng = np.random.default_rng(width * height)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.float32)
+    pixels[..., 0] = (x + y) / 2
+    pixels[..., 1] = x[::-1] * np.ones_like(y)
+    pixels[..., 2] = y * np.ones_like(x)
+    pixels += rng.normal(0, 6, size=pixels.shape).astype(np.float32)
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path)
+
+
+def ensure_media(media_dir, quick=False, duration=3):
+    # Generate the test media once; later runs reuse the files
+    os.makedirs(media_dir, exist_ok=True)
+    resolutions = QUICK_VIDEO_RESOLUTIONS if quick else VIDEO_RESOLUTIONS
+    gops = QUICK_VIDEO_GOPS if quick else VIDEO_GOPS
+    image_sizes = QUICK_IMAGE_SIZES if quick else IMAGE_SIZES
+
+    videos = []
+    for width, height in resolutions:
+        for codec in CODEC_CONTAINERS:
+            for gop in gops:
+                path = os.path.join(
+                    media_dir, video_name(width, height, codec, gop, duration)
+                )
+                if not os.path.exists(path):
+                    print(f"Generating {os.path.basename(path)}")
+                    generate_video(path, width, height, codec, gop, duration)
+                videos.append(path)
+
+    images = []
+    for width, height in image_sizes:
+        for ext in IMAGE_FORMATS:
+            path = os.path.join(media_dir, image_name(width, height, ext))
+            if not os.path.exists(path):
+                print(f"Generating {os.path.basename(path)}")
+                generate_image(path, width, height)
+            images.append(path)
+
+    return videos, images
@@ -0,0 +1,318 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run from the repository root so config.py and the project modules resolve
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.media import ensure_media  # noqa: E402
+from config_loader import config  # noqa: E402
+
+DEFAULT_MEDIA_DIR = os.path.join(REPO_ROOT, "benchmarks", ".media")
+DEFAULT_RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment():
+    import cv2
+    import moviepy
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+        "moviepy": moviepy.__version__,
+        "ram_scratch_root": config.RAM_SCRATCH_ROOT,
+    }
+
+
+@contextlib.contextmanager
+def quiet(verbose):
+    # moviepy progress bars and our own prints would swamp the results
+    if verbose:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+        io.StringIO()
+    ):
+        yield
+
+
+# Settings pointed into the benchmark directory while it runs
+ISOLATED_SETTINGS = [
+    "OUTPUT_DIR",
+    "TEMP_DIR",
+    "JOB_DB",
+    "CACHE_DIR",
+    "MEDIA_INDEX_DIR",
+    "RAM_SCRATCH_ROOT",
+]
+
+
+@contextlib.contextmanager
+def isolated_config(work_dir):
+    # Jobs, scratch space, output, sidecars and the result cache all live
+    # under the benchmark directory; the user's settings come back afterwards
+    saved = {name: getattr(config, name) for name in ISOLATED_SETTINGS}
+    try:
+        config.OUTPUT_DIR = os.path.join(work_dir, "output")
+        config.TEMP_DIR = os.path.join(work_dir, "temp")
+        config.JOB_DB = os.path.join(work_dir, "temp", "jobs.sqlite3")
+        config.CACHE_DIR = os.path.join(work_dir, "cache")
+        config.MEDIA_INDEX_DIR = os.path.join(work_dir, "index")
+        config.RAM_SCRATCH_ROOT = None
+        os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+        os.makedirs(config.TEMP_DIR, exist_ok=True)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+
+def clear_caches():
+    # Every run starts cold: no frame index, scene or probe sidecars and no
+    # cached results left by the run before
+    for path in (config.MEDIA_INDEX_DIR, config.CACHE_DIR):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def center_crop(width, height):
+    # Middle half of the frame, like a typical manual crop
+    return width // 4, height // 4, width // 2, height // 2
+
+
+def time_case(name, function, repeat, verbose, setup=None):
+    timings = []
+    extra = {}
+    for _ in range(repeat):
+        clear_caches()
+        state = setup() if setup else None
+        with quiet(verbose):
+            start = time.perf_counter()
+            result = function(state)
+            elapsed = time.perf_counter() - start
+        if result is None:
+            raise RuntimeError(f"{name} produced no result")
+        if isinstance(result, dict):
+            extra = result
+        timings.append(elapsed)
+    print(f"{name}: median {statistics.median(timings):.3f}s over {repeat} runs")
+    return {
+        "name": name,
+        "runs": timings,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        **extra,
+    }
+
+
+def bench_crop_video(path, work_dir, repeat, verbose):
+    from media_source import MediaSource
+    from utils import crop_video
+
+    with MediaSource(path) as source:
+        width, height = source.clip().size
+
+    def run(_):
+        return crop_video(path, work_dir, *center_crop(width, height))
+
+    return time_case(
+        f"crop_video/{os.path.basename(path)}", run, repeat, verbose
+    )
+
+
+def bench_crop_image(path, work_dir, repeat, verbose):
+    from PIL import Image
+
+    from utils import crop_image
+
+    with Image.open(path) as img:
+        width, height = img.size
+
+    def run(_):
+        return crop_image(path, work_dir, *center_crop(width, height))
+
+    return time_case(
+        f"crop_image/{os.path.basename(path)}", run, repeat, verbose
+    )
+
+
+def bench_extract_frames(path, repeat, verbose):
+    from PIL import Image
+    from PyQt6.QtWidgets import QApplication
+
+    from gui.ImageWithCropBox import ImageWithCropBox
+    from media_source import MediaSource
+
+    app = QApplication.instance() or QApplication([])
+    widget = ImageWithCropBox(Image.new("RGB", (16, 16)))
+
+    def run(source):
+        try:
+            frames = widget.extract_frames_from_video(source)
+        finally:
+            source.close()
+        return {"frames": len(frames)} if frames else None
+
+    result = time_case(
+        f"extract_frames/{os.path.basename(path)}",
+        run,
+        repeat,
+        verbose,
+        setup=lambda: MediaSource(path),
+    )
+    widget.deleteLater()
+    app.processEvents()
+    return result
+
+
+def bench_end_to_end(path, repeat, verbose):
+    import main
+    from utils import MediaType, get_media_type
+
+    if get_media_type(os.path.splitext(path)[1]) == MediaType.VIDEO:
+        from media_source import MediaSource
+
+        with MediaSource(path) as source:
+            width, height = source.clip().size
+    else:
+        from PIL import Image
+
+        with Image.open(path) as img:
+            width, height = img.size
+    crop = ",".join(str(value) for value in center_crop(width, height))
+    output = "bench"
+
+    def run(_):
+        main.run_job(
+            [
+                "--no-daemon",
+                "--no-cache",
+                "--report",
+                "json",
+                "--crop",
+                crop,
+                path,
+                output,
+            ]
+        )
+        report_path = os.path.join(config.OUTPUT_DIR, f"{output}.report.json")
+        with open(report_path) as f:
+            job_report = json.load(f)
+        # Per-stage timings from the job's own report
+        return {
+            "stages": {span["name"]: span["duration"] for span in job_report["spans"]}
+        }
+
+    return time_case(
+        f"end_to_end/{os.path.basename(path)}", run, repeat, verbose
+    )
+
+
+def run_benchmarks(args):
+    videos, images = ensure_media(args.media_dir, quick=args.quick)
+    work_dir = tempfile.mkdtemp(prefix="osaka-bench-")
+    cases = []
+    try:
+        with isolated_config(work_dir):
+            # Recorded with the settings the cases actually ran with
+            environment = get_environment()
+            for path in videos:
+                if "crop_video" in args.cases:
+                    cases.append(bench_crop_video(path, work_dir, args.repeat, args.verbose))
+                if "extract_frames" in args.cases:
+                    cases.append(bench_extract_frames(path, args.repeat, args.verbose))
+            for path in images:
+                if "crop_image" in args.cases:
+                    cases.append(bench_crop_image(path, work_dir, args.repeat, args.verbose))
+            if "end_to_end" in args.cases:
+                # One video and one image keep the end-to-end run short
+                for path in videos[:1] + images[:1]:
+                    cases.append(bench_end_to_end(path, args.repeat, args.verbose))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "quick": args.quick,
+        "repeat": args.repeat,
+        "environment": environment,
+        "cases": cases,
+    }
+
+
+CASES = ["crop_video", "crop_image", "extract_frames", "end_to_end"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark osaka's cropping pipeline")
+    parser.add_argument(
+        "--quick", action="store_true", help="Use a small media matrix"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per case (default: 3)"
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=CASES,
+        default=CASES,
+        help="Cases to run (default: all)",
+    )
+    parser.add_argument(
+        "--media-dir",
+        default=DEFAULT_MEDIA_DIR,
+        help="Where generated test media is kept between runs",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Results file (default: benchmarks/results/<revision>.json)",
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Show pipeline output"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{results['revision'] or 'results'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import glob
+import hashlib
+import json
+import os
+
+from config_loader import config
+from utils import finalize_output, format_path, get_encoding_settings, MediaType
+
+try:
+    import xxhash
+except ImportError:  # Optional, hashlib is used without it
+    xxhash = None
+
+# Bump when the output of a given set of parameters changes
+CACHE_VERSION = 1
+
+# Sampled hashing: this many blocks spread evenly over the file
+SAMPLE_BLOCK_SIZE = 64 * 1024
+SAMPLE_BLOCKS = 16
+
+
+def new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path):
+    # Fast content hash: the size plus evenly spaced blocks, or the whole
+    # file when it is small enough to read outright
+    size = os.path.getsize(path)
+    hasher = new_hasher()
+    hasher.update(str(size).encode())
+
+    with open(path, "rb") as f:
+        if size <= SAMPLE_BLOCK_SIZE * SAMPLE_BLOCKS:
+            hasher.update(f.read())
+        else:
+            last_offset = size - SAMPLE_BLOCK_SIZE
+            for i in range(SAMPLE_BLOCKS):
+                f.seek(last_offset * i // (SAMPLE_BLOCKS - 1))
+                hasher.update(f.read(SAMPLE_BLOCK_SIZE))
+
+    return hasher.hexdigest()
+
+
+def make_cache_key(source_key, params):
+    # Parameters are normalized through sorted JSON so equal jobs hash equally
+    hasher = new_hasher()
+    hasher.update(source_key.encode())
+    hasher.update(
+        json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True).encode()
+    )
+    return hasher.hexdigest()
+
+
+def get_result_params(
+    ext,
+    media_type,
+    crop,
+    no_edit=False,
+    encoding_profile=None,
+    target_size=None,
+    crop_path=None,
+):
+    if no_edit:
+        return {"ext": ext.lower(), "no_edit": True}
+
+    x, y, width, height = crop
+    params = {"ext": ext.lower(), "media_type": media_type.value}
+    if media_type == MediaType.VIDEO:
+        # crop_video trims odd sizes to even, so equal outputs share a key
+        width -= width % 2
+        height -= height % 2
+        # Resolved settings, so editing a profile in config.py invalidates it
+        params["encoding"] = get_encoding_settings(ext, encoding_profile)
+        params["target_size"] = target_size
+    params["crop"] = [x, y, width, height]
+    if crop_path:
+        params["crop_path"] = [list(key) for key in crop_path]
+    return params
+
+
+class ResultCache:
+    # Finished outputs keyed by source + parameters, evicted least recently used
+    # first once the directory grows past its size budget
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or config.CACHE_DIR
+        self.max_bytes = config.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def lookup(self, key):
+        # Staging files of an interrupted store are not entries
+        matches = [
+            path
+            for path in glob.glob(os.path.join(glob.escape(self.root), f"{key}.*"))
+            if not path.endswith(".partial")
+        ]
+        if not matches:
+            return None
+
+        # Refresh the entry's position in the LRU order
+        path = matches[0]
+        os.utime(path)
+        return path
+
+    def store(self, key, path):
+        if self.max_bytes <= 0 or not os.path.exists(path):
+            return None
+
+        _, ext = os.path.splitext(path)
+        cache_path = os.path.join(self.root, f"{key}{ext}")
+        # The result is handed to the user next and may be edited there, so
+        # the entry never shares its inode - reflink or copy only
+        finalize_output(path, cache_path, keep_source=True, allow_hardlink=False)
+        self.evict()
+        return cache_path
+
+    def alias(self, key, cache_path):
+        # A second key for an existing entry, e.g. the URL it was downloaded from
+        _, ext = os.path.splitext(cache_path)
+        alias_path = os.path.join(self.root, f"{key}{ext}")
+        if os.path.exists(alias_path):
+            return alias_path
+        finalize_output(cache_path, alias_path, keep_source=True)
+        return alias_path
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith(".partial"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat))
+
+        # Hardlinked aliases share their data, so count each inode once
+        def total_size():
+            inodes = {(stat.st_dev, stat.st_ino): stat.st_size for _, _, stat in entries}
+            return sum(inodes.values())
+
+        entries.sort()
+        while entries and total_size() > self.max_bytes:
+            _, path, _ = entries.pop(0)
+            try:
+                os.remove(path)
+                print(f"Evicted cache entry: {format_path(path)}")
+            except OSError as e:
+                print(f"Warning: Could not evict cache entry: {e}")
@@ -16,3 +16,176 @@ MIN_CROP_HEIGHT = 20
 
 # Snap-to-edge tolerance for crop box (pixels)
 SNAP_TOLERANCE = 2
+
+# Encoding profiles for cropped videos, selectable with --encoding or in the GUI.
+# Keys left out fall back to the output container's defaults below.
+#   codec / audio_codec: ffmpeg encoder names
+#   preset: encoder speed, "ultrafast" ... "veryslow"
+#   crf: constant quality (lower is better), ignored when bitrate is set
+#   bitrate / audio_bitrate: target bitrates such as "4M" or "128k"
+#   threads: encoder threads (0 lets ffmpeg decide)
+#   pixel_format: output pixel format such as "yuv420p"
+#   faststart: move the index to the front of MP4/MOV files for web playback
+ENCODING_PROFILES = {
+    "fast": {"preset": "ultrafast", "crf": 26, "threads": 0},
+    "balanced": {"preset": "medium", "crf": 23},
+    "web": {
+        "preset": "slow",
+        "crf": 23,
+        "audio_bitrate": "128k",
+        "pixel_format": "yuv420p",
+        "faststart": True,
+    },
+    "archive": {"preset": "veryslow", "crf": 18, "audio_bitrate": "192k"},
+}
+
+# Codecs and default encoding profile for each output container (audio is
+# resampled to 44.1 kHz unless the container sets its own audio_fps)
+CONTAINER_DEFAULTS = {
+    ".mp4": {"codec": "libx264", "audio_codec": "aac", "profile": "web"},
+    ".m4v": {"codec": "libx264", "audio_codec": "aac", "profile": "web"},
+    ".mov": {"codec": "libx264", "audio_codec": "aac", "profile": "balanced"},
+    ".mkv": {"codec": "libx264", "audio_codec": "aac", "profile": "balanced"},
+    ".webm": {
+        "codec": "libvpx-vp9",
+        "audio_codec": "libopus",
+        "audio_fps": 48000,  # Opus only encodes 48 kHz and its divisors
+        "pixel_format": "yuv420p",  # Otherwise RGB input is kept as 4:4:4 RGB
+        "profile": "web",
+    },
+    ".ogv": {"codec": "libtheora", "audio_codec": "libvorbis", "profile": "balanced"},
+    ".avi": {"codec": "libx264", "audio_codec": "libmp3lame", "profile": "balanced"},
+    ".flv": {"codec": "libx264", "audio_codec": "aac", "profile": "balanced"},
+}
+
+# Container whose defaults are used for extensions not listed above
+DEFAULT_CONTAINER = ".mp4"
+
+# Target-size encoding (--target-size): audio bitrate budget, the lowest audio
+# bitrate to fall back to when the cap is tight, the share of the cap reserved
+# for container overhead, and how many second passes to try before giving up
+TARGET_SIZE_AUDIO_BITRATE = "128k"
+TARGET_SIZE_MIN_AUDIO_BITRATE = "48k"
+TARGET_SIZE_OVERHEAD = 0.02
+TARGET_SIZE_MAX_ATTEMPTS = 3
+
+# Delete temporary files from a detached background process so the command
+# returns immediately instead of waiting for the delete to finish
+BACKGROUND_CLEANUP = False
+
+# Scratch space for job directories. Small local inputs use the RAM-backed
+# root (tmpfs) when set and when they fit under RAM_SCRATCH_MAX_BYTES; other
+# jobs spill to TEMP_DIR. Set RAM_SCRATCH_ROOT to None to always use disk.
+RAM_SCRATCH_ROOT = "/dev/shm/osaka" if os.path.isdir("/dev/shm") else None
+RAM_SCRATCH_MAX_BYTES = 512 * 1024 * 1024
+
+# Job directories whose lock hasn't been refreshed for this long (or whose
+# process has exited) are removed on startup
+SCRATCH_HEARTBEAT_SECONDS = 30
+SCRATCH_STALE_SECONDS = 600
+
+# Where "osaka --daemon" listens for jobs. None uses a Unix socket in TEMP_DIR,
+# or a per-user named pipe on Windows.
+DAEMON_ADDRESS = None
+
+# SQLite database recording jobs and their completed stages. Interrupted jobs
+# newer than JOB_RESUME_SECONDS are picked up again by "osaka --resume".
+JOB_DB = os.path.join(TEMP_DIR, "osaka-jobs.sqlite3")
+JOB_RESUME_SECONDS = 7 * 24 * 60 * 60
+
+# Cache of finished outputs keyed by source content and crop/encoding
+# parameters; identical jobs are served from here. 0 disables the cache.
+CACHE_DIR = os.path.join(TEMP_DIR, "cache")
+CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+# Frame-time overlay in the crop view: paint time, input events per second and
+# frames dropped against the refresh budget. F3 toggles it at runtime.
+DEBUG_HUD = False
+HUD_FRAME_BUDGET_MS = 1000 / 60
+
+# Video playback in the crop view decodes ahead into a ring buffer of this many
+# frames, scaled to display size; frames that can't be shown in time are
+# dropped so playback keeps the source's pace.
+PLAYBACK_BUFFER_FRAMES = 4
+
+# Images are decoded region by region: cropping reads only the rows, strips or
+# tiles under the crop box (memory-mapped for uncompressed BMP/TIFF/PPM), and
+# the GUI shows a preview at most PREVIEW_MAX_SIZE pixels on its longest side.
+# MAX_IMAGE_PIXELS caps how many pixels may be decoded into memory at once; a
+# crop or preview that would need more fails instead. None removes the cap.
+MAX_IMAGE_PIXELS = 250 * 1000 * 1000
+PREVIEW_MAX_SIZE = 4096
+
+# JPEGs are cropped losslessly with jpegtran (from libjpeg/libjpeg-turbo) when
+# the crop's top-left corner lies on the MCU grid (8 or 16 pixels, depending
+# on chroma subsampling); the GUI can snap the crop box to that grid. Other
+# crops are re-encoded with the source's quantization tables and subsampling,
+# keeping EXIF and ICC data. JPEGTRAN_PATH=None looks for jpegtran on PATH.
+JPEG_LOSSLESS_CROP = True
+JPEGTRAN_PATH = None
+SNAP_TO_MCU = True
+
+# Media files are recognized by their content rather than their extension and
+# probed once (size, duration, codecs, frame rate, rotation, keyframes); videos
+# also get an index of every frame's timestamp for exact seeking. Both are kept
+# here, keyed by path, modification time and size, and dropped once unused for
+# MEDIA_INDEX_MAX_AGE_SECONDS.
+MEDIA_INDEX_DIR = os.path.join(TEMP_DIR, "index")
+MEDIA_INDEX_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+# Black bar detection (--crop auto and the GUI's bar button). Rows and columns
+# at the frame's edges count as letterbox/pillarbox bars when no more than
+# BLACK_BAR_NOISE of their pixels are brighter than BLACK_BAR_LEVEL (0-255
+# luma) in any of BLACK_BAR_SAMPLES frames spread over the video.
+BLACK_BAR_LEVEL = 24
+BLACK_BAR_NOISE = 0.02
+BLACK_BAR_SAMPLES = 20
+
+# Scene-aware frame sampling for the crop preview. The video is decoded once
+# at thumbnail size to find cuts: frames whose colours and pixels differ from
+# the previous frame by more than SCENE_CUT_THRESHOLD (0-1), at least
+# SCENE_MIN_SECONDS after the last cut. The preview then shows at least one
+# frame per scene. Videos longer than SCENE_FULL_DECODE_SECONDS are only
+# checked at keyframes. Set SCENE_SAMPLING to False for evenly spaced frames.
+SCENE_SAMPLING = True
+SCENE_CUT_THRESHOLD = 0.3
+SCENE_MIN_SECONDS = 0.5
+SCENE_FULL_DECODE_SECONDS = 600
+
+# Subject-aware crops (--crop 9:16@auto and the GUI's suggestion button) place
+# the largest rectangle of the requested shape where sampled frames show the
+# most faces and salient detail. Frames are analysed SUBJECT_ANALYSIS_WIDTH
+# pixels wide; faces count SUBJECT_FACE_WEIGHT times as much as all other
+# detail in a frame.
+SUBJECT_SAMPLES = 10
+SUBJECT_ANALYSIS_WIDTH = 320
+SUBJECT_FACE_WEIGHT = 2.0
+
+# The GUI's Preview button renders the crop quickly before committing to the
+# full encode: the first PREVIEW_RENDER_SECONDS of the video (None for all of
+# it), at most PREVIEW_RENDER_HEIGHT pixels high and PREVIEW_RENDER_FPS frames
+# per second, without audio, with x264's ultrafast preset.
+PREVIEW_RENDER_SECONDS = 5
+PREVIEW_RENDER_HEIGHT = 360
+PREVIEW_RENDER_FPS = 15
+
+# Headless URL jobs with a crop rectangle stream the download straight into
+# ffmpeg when the file can be decoded as it arrives (WebM/MKV, FLV, MPEG-TS, or
+# MP4/MOV with the index first), so downloading and encoding overlap and no raw
+# copy is written. At most STREAM_BUFFER_CHUNKS pieces of STREAM_CHUNK_BYTES
+# are buffered ahead of the encoder. Up to STREAM_PROBE_BYTES are read to find
+# an MP4's index; files with the index last are saved first and cropped as
+# usual, as are --target-size jobs. Set STREAM_DOWNLOADS to False to always
+# save downloads first.
+STREAM_DOWNLOADS = True
+STREAM_CHUNK_BYTES = 256 * 1024
+STREAM_BUFFER_CHUNKS = 32
+STREAM_PROBE_BYTES = 8 * 1024 * 1024
+
+# With the GUI, URLs download in the background while the window opens. The
+# first frame shows as soon as enough of a file that decodes as it arrives is
+# in (see STREAM_DOWNLOADS), so the crop can be set up during the download; a
+# crop started before it finishes waits for it. The partial file is checked
+# every DOWNLOAD_POLL_MS. Set GUI_DURING_DOWNLOAD to False to download first.
+GUI_DURING_DOWNLOAD = True
+DOWNLOAD_POLL_MS = 250
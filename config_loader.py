@@ -22,11 +22,41 @@ def load_config():
     # Import the config module
     try:
         import config
-
-        return config
     except ImportError as e:
         raise ImportError(f"Could not import config: {e}")
 
+    # Fill in settings added to the example after config.py was created
+    if os.path.exists(example_path):
+        apply_example_defaults(config, example_path)
+
+    return config
+
+
+class UserSettingsFirst(dict):
+    # Namespace for running config.example.py in which every setting the
+    # user's config.py already has keeps the user's value, so settings derived
+    # from it (JOB_DB from TEMP_DIR, ...) follow the user's paths
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def __setitem__(self, name, value):
+        if name.isupper() and hasattr(self.config, name):
+            value = getattr(self.config, name)
+        super().__setitem__(name, value)
+
+
+def apply_example_defaults(config, example_path):
+    with open(example_path, encoding="utf-8") as f:
+        source = f.read()
+    example = UserSettingsFirst(config)
+    exec(compile(source, example_path, "exec"), {"__builtins__": __builtins__}, example)
+
+    for name, value in example.items():
+        if name.isupper() and not hasattr(config, name):
+            setattr(config, name, value)
+
 
 # Load configuration
 try:
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+
+
+# A crop path is a list of keyframes, (seconds, x, y, width, height) each,
+# sorted by time. Between keyframes the rectangle moves and scales linearly;
+# before the first and after the last it holds still.
+
+
+def interpolate_crop_path(keyframes, times):
+    # Rectangle for every time at once: one row of x, y, width, height each
+    keyframes = np.asarray(sorted(keyframes), dtype=float)
+    times = np.asarray(times, dtype=float)
+    rects = np.stack(
+        [np.interp(times, keyframes[:, 0], keyframes[:, i]) for i in range(1, 5)],
+        axis=1,
+    )
+    return np.round(rects).astype(int)
+
+
+def get_path_output_size(keyframes):
+    # Every frame is scaled to the largest keyframe rectangle, so the widest
+    # shot keeps its detail; even for 4:2:0 video
+    _, _, _, width, height = max(keyframes, key=lambda key: key[3] * key[4])
+    return int(width - width % 2), int(height - height % 2)
+
+
+def apply_crop_path(clip, keyframes):
+    # Crop every frame to its interpolated rectangle in the same pass that
+    # encodes the clip. Rectangles for all output frames are worked out up
+    # front; each frame then only slices and, if needed, resizes.
+    output_size = get_path_output_size(keyframes)
+    frame_count = max(1, int(np.ceil(clip.duration * clip.fps)))
+    rects = interpolate_crop_path(keyframes, np.arange(frame_count) / clip.fps)
+
+    # Keep every rectangle inside the frame
+    source_width, source_height = clip.size
+    rects[:, 2] = np.clip(rects[:, 2], 1, source_width)
+    rects[:, 3] = np.clip(rects[:, 3], 1, source_height)
+    rects[:, 0] = np.clip(rects[:, 0], 0, source_width - rects[:, 2])
+    rects[:, 1] = np.clip(rects[:, 1], 0, source_height - rects[:, 3])
+
+    def crop_frame(get_frame, t):
+        x, y, width, height = rects[min(int(round(t * clip.fps)), frame_count - 1)]
+        frame = get_frame(t)[y : y + height, x : x + width]
+        if (width, height) != output_size:
+            frame = cv2.resize(frame, output_size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    return clip.transform(crop_frame)
@@ -0,0 +1,169 @@
+import getpass
+import os
+import secrets
+import sys
+import threading
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from config_loader import config
+
+
+def get_daemon_address():
+    if config.DAEMON_ADDRESS:
+        return config.DAEMON_ADDRESS
+    if os.name == "nt":
+        return rf"\\.\pipe\osaka-{getpass.getuser()}"
+    return os.path.join(config.TEMP_DIR, "osaka.sock")
+
+
+def get_auth_key_path():
+    return os.path.join(config.TEMP_DIR, "osaka-daemon.key")
+
+
+def load_auth_key(create=False):
+    # Jobs are pickled over the connection, so only accept clients that can
+    # read this user-private key
+    key_path = get_auth_key_path()
+    if os.path.exists(key_path):
+        with open(key_path, "rb") as f:
+            return f.read()
+    if not create:
+        return None
+
+    os.makedirs(config.TEMP_DIR, exist_ok=True)
+    key = secrets.token_bytes(32)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def submit_job(argv):
+    # Returns the job's exit code, or None if no daemon is running
+    key = load_auth_key()
+    if key is None:
+        return None
+
+    try:
+        conn = Client(get_daemon_address(), authkey=key)
+    except (OSError, AuthenticationError):
+        return None
+
+    try:
+        conn.send({"argv": argv, "cwd": os.getcwd()})
+        while True:
+            kind, payload = conn.recv()
+            if kind == "stdout":
+                sys.stdout.write(payload)
+                sys.stdout.flush()
+            elif kind == "stderr":
+                sys.stderr.write(payload)
+                sys.stderr.flush()
+            elif kind == "exit":
+                return payload
+    except EOFError:
+        print("Error: Lost connection to the osaka daemon")
+        return 1
+    finally:
+        conn.close()
+
+
+class ClientStream:
+    # File-like object that forwards writes to the connected client
+
+    def __init__(self, conn, kind, lock):
+        self.conn = conn
+        self.kind = kind
+        self.lock = lock
+        self.connected = True
+
+    def write(self, text):
+        if not text or not self.connected:
+            return len(text)
+        with self.lock:
+            try:
+                self.conn.send((self.kind, text))
+            except OSError:
+                # Client went away; let the job finish quietly
+                self.connected = False
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def handle_job(conn, run_job):
+    request = conn.recv()
+    lock = threading.Lock()
+    stdout = ClientStream(conn, "stdout", lock)
+    stderr = ClientStream(conn, "stderr", lock)
+
+    exit_code = 0
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            run_job(request["argv"], cwd=request["cwd"])
+        except SystemExit as e:
+            # Mirror sys.exit(): None is success, strings are printed
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+            else:
+                exit_code = e.code or 0
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+
+    try:
+        conn.send(("exit", exit_code))
+    except OSError:
+        pass
+
+
+def serve():
+    address = get_daemon_address()
+    key = load_auth_key(create=True)
+
+    # A leftover socket from a daemon that was killed blocks the bind
+    if os.name != "nt" and os.path.exists(address):
+        try:
+            Client(address, authkey=key).close()
+        except (OSError, AuthenticationError):
+            os.remove(address)
+        else:
+            print("Error: An osaka daemon is already running")
+            sys.exit(1)
+
+    # Pay for the heavy imports once, up front
+    print("Loading media libraries...")
+    from main import run_job
+    import gui  # noqa: F401
+    import utils  # noqa: F401
+
+    listener = Listener(address, authkey=key)
+    print(f"osaka daemon listening on {address} (Ctrl+C to stop)")
+
+    # Jobs run one at a time on this thread, which Qt requires for the GUI
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                # Failed handshakes (wrong key) shouldn't stop the daemon
+                print(f"Rejected connection: {e}")
+                continue
+            try:
+                handle_job(conn, run_job)
+            except (EOFError, OSError) as e:
+                print(f"Connection error: {e}")
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        print("Stopping osaka daemon")
+    finally:
+        listener.close()
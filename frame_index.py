@@ -0,0 +1,237 @@
+import io
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+from PIL import Image
+
+from sidecar import get_sidecar_path, save_sidecar, touch_sidecar
+
+# One entry per video frame, in presentation order
+INDEX_DTYPE = np.dtype([("pts", "<f8"), ("keyframe", "?"), ("size", "<u4")])
+
+# framecrc prints this for packets without a timestamp
+NO_PTS = -(2**63)
+
+# Decoded frames match an indexed time within this much, so float rounding of
+# the stored times can't pick a neighbouring frame
+SEEK_TOLERANCE = 0.0005
+
+# ffmpeg processes decoding different stretches of a video at once
+MAX_DECODERS = 4
+
+PPM_HEADER = re.compile(rb"P6\s+(\d+)\s+(\d+)\s+255\s")
+
+
+def read_packets(path):
+    # One demux-only pass over the first video stream; framecrc lists every
+    # packet (dts, pts, duration, size) and flags those that aren't keyframes
+    command = [
+        FFMPEG_BINARY,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        path,
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        "-f",
+        "framecrc",
+        "-",
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+
+    time_base = None
+    packets = []
+    for line in result.stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            numerator, denominator = line.split(":", 1)[1].strip().split("/")
+            time_base = int(numerator) / int(denominator)
+        elif line and not line.startswith("#"):
+            fields = line.split(",")
+            pts = int(fields[2])
+            if pts != NO_PTS:
+                packets.append((pts, "F=" not in line, int(fields[4])))
+
+    if time_base is None or not packets:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+
+    index = np.array(packets, dtype=[("pts", "<i8"), ("keyframe", "?"), ("size", "<u4")])
+    # Packets arrive in decode order; B-frames make that differ from display
+    index.sort(order="pts", kind="stable")
+    frames = np.empty(len(index), dtype=INDEX_DTYPE)
+    frames["pts"] = index["pts"] * time_base
+    frames["keyframe"] = index["keyframe"]
+    frames["size"] = index["size"]
+    return frames
+
+
+class FrameIndex:
+    # Timestamps of every frame of a video, so frame numbers map to exact
+    # times (variable frame rate included) and seeks resolve by binary search
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.pts = frames["pts"]
+        self.keyframes = np.flatnonzero(frames["keyframe"])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame_time(self, frame_number):
+        return float(self.pts[frame_number])
+
+    def frame_at(self, seconds):
+        # Number of the frame on screen at this time
+        frame_number = np.searchsorted(self.pts, seconds + SEEK_TOLERANCE, side="right")
+        return int(max(0, frame_number - 1))
+
+    def keyframe_before(self, frame_number):
+        # Number of the last keyframe at or before the frame, where decoding
+        # has to start to reach it
+        position = np.searchsorted(self.keyframes, frame_number, side="right")
+        if position == 0:
+            return 0
+        return int(self.keyframes[position - 1])
+
+    def keyframe_times(self):
+        return self.pts[self.keyframes]
+
+    def sample(self, count):
+        # Evenly spaced frame numbers
+        total = len(self)
+        if total <= count:
+            return list(range(total))
+        return [int(i * total / count) for i in range(count)]
+
+
+def load_frame_index(path):
+    # Built once per file and reused from the .npy sidecar until it changes
+    sidecar_path = get_sidecar_path(path, ".frames.npy")
+    try:
+        frames = np.load(sidecar_path)
+        if frames.dtype == INDEX_DTYPE:
+            touch_sidecar(sidecar_path)
+            return FrameIndex(frames)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        frames = read_packets(path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Warning: could not index frames: {e}")
+        return FrameIndex(np.zeros(0, dtype=INDEX_DTYPE))
+
+    data = io.BytesIO()
+    np.save(data, frames)
+    save_sidecar(sidecar_path, data.getvalue())
+    return FrameIndex(frames)
+
+
+def parse_ppm_stream(data):
+    # Split concatenated binary PPMs (as piped by ffmpeg) into images
+    images = []
+    position = 0
+    while position < len(data):
+        header = PPM_HEADER.match(data, position)
+        if not header:
+            break
+        width, height = int(header.group(1)), int(header.group(2))
+        start = header.end()
+        end = start + width * height * 3
+        images.append(Image.frombytes("RGB", (width, height), data[start:end]))
+        position = end
+    return images
+
+
+def decode_from_keyframe(path, keyframe_time, offsets):
+    # One ffmpeg run: seek straight to a keyframe, decode forward and keep
+    # the frames at the given offsets (seconds) from it. Offsets rather than
+    # absolute times, since ffmpeg may shift timestamps by the container's
+    # start time.
+    windows = "+".join(
+        f"between(t-start_t\\,{offset - SEEK_TOLERANCE:.6f}\\,{offset + SEEK_TOLERANCE:.6f})"
+        for offset in offsets
+    )
+    command = [
+        FFMPEG_BINARY,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-noaccurate_seek",
+        "-seek_timestamp",
+        "1",
+        "-ss",
+        f"{keyframe_time:.6f}",
+        "-i",
+        path,
+        "-map",
+        "0:v:0",
+        "-vf",
+        f"select={windows}",
+        "-fps_mode",
+        "passthrough",
+        "-frames:v",
+        str(len(offsets)),
+        "-f",
+        "image2pipe",
+        "-c:v",
+        "ppm",
+        "-",
+    ]
+    result = subprocess.run(command, capture_output=True, check=True)
+    return parse_ppm_stream(result.stdout)
+
+
+def decode_first_frame(path):
+    # First frame of a video without indexing it, so it also works on a file
+    # that is still downloading; None when it can't be decoded (yet)
+    command = [
+        FFMPEG_BINARY,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        path,
+        "-map",
+        "0:v:0",
+        "-frames:v",
+        "1",
+        "-f",
+        "image2pipe",
+        "-c:v",
+        "ppm",
+        "-",
+    ]
+    result = subprocess.run(command, capture_output=True)
+    images = parse_ppm_stream(result.stdout)
+    return images[0] if images else None
+
+
+def read_frames(path, index, frame_numbers):
+    # Decode exactly these frames. Frames after the same keyframe share one
+    # decoder run, and runs for different keyframes go in parallel.
+    groups = {}
+    for frame_number in sorted(set(frame_numbers)):
+        groups.setdefault(index.keyframe_before(frame_number), []).append(frame_number)
+
+    def decode_group(keyframe, numbers):
+        keyframe_time = index.frame_time(keyframe)
+        offsets = [index.frame_time(number) - keyframe_time for number in numbers]
+        return dict(zip(numbers, decode_from_keyframe(path, keyframe_time, offsets)))
+
+    decoded = {}
+    workers = min(len(groups), os.cpu_count() or 1, MAX_DECODERS) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for frames in pool.map(decode_group, groups.keys(), groups.values()):
+            decoded.update(frames)
+    return [decoded.get(frame_number) for frame_number in frame_numbers]
+
+
+def read_frame(path, index, frame_number):
+    return read_frames(path, index, [frame_number])[0]
@@ -7,26 +7,62 @@ from PyQt6.QtWidgets import (
     QHBoxLayout,
     QLabel,
     QPushButton,
+    QCheckBox,
     QComboBox,
     QSpinBox,
 )
 from PyQt6.QtGui import QIcon
+from PyQt6.QtCore import pyqtSignal
 
+from auto_crop import find_picture_area, find_subject_area
 from config_loader import config
-from utils import crop_video, crop_image, MediaType
+from crop_path import interpolate_crop_path
+from gui.PreviewPlayer import PreviewPlayer
+from probe import get_media_info
+from profiler import profiler
+from utils import crop_video, crop_image, render_preview, MediaType
 
 
 class ControlPanel(QWidget):
-    def __init__(self, media_path, media_type, output_path):
+    # Path of a rendered crop preview, empty when rendering failed
+    previewReady = pyqtSignal(str)
+
+    def __init__(
+        self,
+        media_path,
+        media_type,
+        output_path,
+        encoding_profile=None,
+        target_size=None,
+        media_info=None,
+        download=None,
+    ):
         super().__init__()
         self.media_path = media_path
         self.media_type = media_type
+        self.media_info = media_info or {}
         self.video_path = media_path if media_type == MediaType.VIDEO else None
         self.output_path = output_path
+        self.encoding_profile = encoding_profile
+        self.target_size = target_size
         self.crop_box = None
         self.image_with_cropbox = None
+        # JPEG block grid the crop corner can snap to for a lossless crop
+        self.mcu_size = self.media_info.get("mcu_size")
+        # Crop rectangle per keyframed time (seconds), for videos
+        self.crop_keyframes = {}
+        self.preview_player = None
+        self.previewReady.connect(self.show_preview)
+        # Background download the media comes from, None for local files
+        self.download = download
         self.init_ui()
 
+        if self.media_type == MediaType.VIDEO and not self.media_path:
+            # Only the first frame is in so far; playing and previewing need
+            # the complete file
+            self.play_button.setEnabled(False)
+            self.preview_button.setEnabled(False)
+
     def init_ui(self):
         # Main layout for controls
         layout = QVBoxLayout()
@@ -115,6 +151,26 @@ class ControlPanel(QWidget):
         self.align_horizontal_button.clicked.connect(self.align_horizontal)
         alignment_layout.addWidget(self.align_horizontal_button)
 
+        self.remove_bars_button = QPushButton()
+        self.remove_bars_button.setIcon(
+            QIcon("assets/icons/crop_free_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg")
+        )
+        self.remove_bars_button.setToolTip("Remove Black Bars")
+        self.remove_bars_button.setFixedSize(28, 28)
+        self.remove_bars_button.clicked.connect(self.remove_black_bars)
+        alignment_layout.addWidget(self.remove_bars_button)
+
+        self.suggest_crop_button = QPushButton()
+        self.suggest_crop_button.setIcon(
+            QIcon(
+                "assets/icons/center_focus_strong_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg"
+            )
+        )
+        self.suggest_crop_button.setToolTip("Suggest Crop Around Subject")
+        self.suggest_crop_button.setFixedSize(28, 28)
+        self.suggest_crop_button.clicked.connect(self.suggest_subject_crop)
+        alignment_layout.addWidget(self.suggest_crop_button)
+
         # Add the horizontal layout to the main vertical layout
         layout.addLayout(alignment_layout)
 
@@ -172,9 +228,18 @@ class ControlPanel(QWidget):
         aspect_layout.addWidget(self.aspect_ratio_combo)
         layout.addLayout(aspect_layout)
 
-        # Frame navigation controls for videos
+        # Frame navigation and encoding controls for videos
         if self.media_type == MediaType.VIDEO:
             self.add_frame_navigation(layout)
+            self.add_keyframe_controls(layout)
+            self.add_encoding_selector(layout, input_width)
+        elif self.media_info.get("animated"):
+            # Animated images step through frames like a video
+            self.add_frame_navigation(layout)
+
+        # Snap-to-MCU option for lossless JPEG crops
+        if self.mcu_size and config.JPEG_LOSSLESS_CROP:
+            self.add_mcu_snap(layout)
 
         # Add some spacing
         layout.addStretch()
@@ -192,6 +257,19 @@ class ControlPanel(QWidget):
             QIcon("assets/icons/crop_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg")
         )
         self.crop_button.clicked.connect(self.start_crop_background)
+
+        # Quick low-resolution render to check the crop before the full encode
+        if self.media_type == MediaType.VIDEO:
+            self.preview_button = QPushButton(" Preview")
+            self.preview_button.setIcon(
+                QIcon(
+                    "assets/icons/preview_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg"
+                )
+            )
+            self.preview_button.setToolTip("Render a Quick Low-Resolution Preview")
+            self.preview_button.clicked.connect(self.start_preview_background)
+            layout.addWidget(self.preview_button)
+
         layout.addWidget(self.crop_button)
 
         # Set max width for the panel
@@ -229,8 +307,149 @@ class ControlPanel(QWidget):
 
         layout.addLayout(nav_layout)
 
+        # Real-time playback from the current frame, for videos
+        if self.media_type == MediaType.VIDEO:
+            play_layout = QHBoxLayout()
+            play_layout.addStretch()
+            self.play_button = QPushButton()
+            self.play_button.setFixedSize(28, 28)
+            self.play_button.clicked.connect(self.toggle_playback)
+            self.on_playback_changed(False)
+            play_layout.addWidget(self.play_button)
+            layout.addLayout(play_layout)
+
+    def add_keyframe_controls(self, layout):
+        keyframe_layout = QHBoxLayout()
+
+        self.keyframe_label = QLabel("0 keys")
+        self.keyframe_label.setToolTip("Crop Keyframes")
+        keyframe_layout.addWidget(self.keyframe_label)
+        keyframe_layout.addStretch()
+
+        self.add_keyframe_button = QPushButton()
+        self.add_keyframe_button.setIcon(
+            QIcon("assets/icons/keyframe_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg")
+        )
+        self.add_keyframe_button.setFixedSize(28, 28)
+        self.add_keyframe_button.setToolTip(
+            "Keyframe the Crop at This Frame (two or more pan the crop)"
+        )
+        self.add_keyframe_button.clicked.connect(self.add_crop_keyframe)
+
+        self.clear_keyframes_button = QPushButton()
+        self.clear_keyframes_button.setIcon(
+            QIcon("assets/icons/close_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg")
+        )
+        self.clear_keyframes_button.setFixedSize(28, 28)
+        self.clear_keyframes_button.setToolTip("Clear Crop Keyframes")
+        self.clear_keyframes_button.clicked.connect(self.clear_crop_keyframes)
+
+        keyframe_layout.addWidget(self.add_keyframe_button)
+        keyframe_layout.addWidget(self.clear_keyframes_button)
+
+        layout.addLayout(keyframe_layout)
+
+    def add_crop_keyframe(self):
+        if not self.image_with_cropbox:
+            return
+        frame_time = self.image_with_cropbox.current_frame_time()
+        if frame_time is None:
+            return
+
+        rect = (
+            self.x_input.value(),
+            self.y_input.value(),
+            self.width_input.value(),
+            self.height_input.value(),
+        )
+        # Setting a keyframe at an already keyed time replaces it
+        self.crop_keyframes[round(frame_time, 6)] = rect
+        print(f"Crop keyframe at {frame_time:.3f}s: {rect}")
+        self.update_keyframe_label()
+
+    def clear_crop_keyframes(self):
+        self.crop_keyframes = {}
+        self.update_keyframe_label()
+
+    def update_keyframe_label(self):
+        count = len(self.crop_keyframes)
+        self.keyframe_label.setText(f"{count} key" if count == 1 else f"{count} keys")
+
+    def get_crop_path(self):
+        # Keyframes as (seconds, x, y, width, height); a single keyframe is
+        # just a static crop
+        if len(self.crop_keyframes) < 2:
+            return None
+        return [(time, *rect) for time, rect in sorted(self.crop_keyframes.items())]
+
+    def show_keyframed_crop(self):
+        # Move the crop box to where the path puts it on the current frame
+        crop_path = self.get_crop_path()
+        if not crop_path or not self.crop_box:
+            return
+        frame_time = self.image_with_cropbox.current_frame_time()
+        if frame_time is None:
+            return
+        rect = interpolate_crop_path(crop_path, [frame_time])[0]
+        self.set_crop_rect(*map(int, rect), keep_aspect_ratio=True)
+
+    def add_encoding_selector(self, layout, input_width):
+        encoding_layout = QHBoxLayout()
+
+        encoding_label = QLabel("enc")
+        encoding_label.setToolTip("Encoding Profile")
+        encoding_layout.addWidget(encoding_label)
+
+        # "Auto" picks the default profile for the output container
+        self.encoding_combo = QComboBox()
+        self.encoding_combo.setFixedWidth(input_width)
+        self.encoding_combo.addItem("Auto")
+        self.encoding_combo.addItems(sorted(config.ENCODING_PROFILES))
+        if self.encoding_profile:
+            self.encoding_combo.setCurrentText(self.encoding_profile)
+        self.encoding_combo.currentTextChanged.connect(self.on_encoding_changed)
+        encoding_layout.addWidget(self.encoding_combo)
+
+        layout.addLayout(encoding_layout)
+
+    def add_mcu_snap(self, layout):
+        mcu_width, mcu_height = self.mcu_size
+        self.mcu_snap_checkbox = QCheckBox("MCU")
+        self.mcu_snap_checkbox.setToolTip(
+            f"Snap the top-left corner to the {mcu_width}x{mcu_height} JPEG block "
+            "grid so the crop is lossless"
+        )
+        self.mcu_snap_checkbox.setChecked(config.SNAP_TO_MCU)
+        self.mcu_snap_checkbox.toggled.connect(self.on_mcu_snap_changed)
+        layout.addWidget(self.mcu_snap_checkbox)
+        self.update_mcu_steps()
+
+    def is_snapping_to_mcu(self):
+        return hasattr(self, "mcu_snap_checkbox") and self.mcu_snap_checkbox.isChecked()
+
+    def snap_to_mcu(self, x, y):
+        # Round down so the crop box never grows past the image
+        if not self.is_snapping_to_mcu():
+            return x, y
+        mcu_width, mcu_height = self.mcu_size
+        return x - x % mcu_width, y - y % mcu_height
+
+    def update_mcu_steps(self):
+        snapping = self.is_snapping_to_mcu()
+        self.x_input.setSingleStep(self.mcu_size[0] if snapping else 1)
+        self.y_input.setSingleStep(self.mcu_size[1] if snapping else 1)
+
+    def on_mcu_snap_changed(self, checked):
+        self.update_mcu_steps()
+        if checked and self.crop_box:
+            self.update_crop_from_fields()
+
+    def on_encoding_changed(self, profile_text):
+        self.encoding_profile = None if profile_text == "Auto" else profile_text
+
     def set_image_widget(self, image_with_cropbox):
         self.image_with_cropbox = image_with_cropbox
+        image_with_cropbox.playbackChanged.connect(self.on_playback_changed)
 
         # Initialize frame controls if this is a video
         if hasattr(image_with_cropbox, "frames") and len(image_with_cropbox.frames) > 1:
@@ -266,9 +485,9 @@ class ControlPanel(QWidget):
         self.update_spinbox_ranges(image_with_cropbox)
 
     def update_spinbox_ranges(self, image_with_cropbox):
-        if hasattr(image_with_cropbox, "pil_image") and image_with_cropbox.pil_image:
-            image_width = image_with_cropbox.pil_image.width
-            image_height = image_with_cropbox.pil_image.height
+        if hasattr(image_with_cropbox, "source_size") and image_with_cropbox.source_size:
+            image_width = image_with_cropbox.source_size[0]
+            image_height = image_with_cropbox.source_size[1]
 
             # Update X and Width ranges
             self.x_input.setRange(0, image_width)
@@ -346,6 +565,11 @@ class ControlPanel(QWidget):
         # Reconnect signals
         self.connect_input_signals()
 
+        # A dragged box lands anywhere; move it onto the JPEG block grid
+        x, y = self.x_input.value(), self.y_input.value()
+        if self.crop_box and self.snap_to_mcu(x, y) != (x, y):
+            self.update_crop_from_fields()
+
     def update_crop_from_fields(self):
         try:
             orig_x = self.x_input.value()
@@ -367,6 +591,9 @@ class ControlPanel(QWidget):
                 )
             )
 
+            # Keep the corner on the JPEG block grid when snapping is on
+            adjusted_x, adjusted_y = self.snap_to_mcu(adjusted_x, adjusted_y)
+
             # Update spinboxes if values were adjusted
             if (
                 adjusted_x != orig_x
@@ -419,9 +646,9 @@ class ControlPanel(QWidget):
         expected_width_from_height = height * aspect_ratio
 
         # Get image dimensions for bounds checking
-        if self.image_with_cropbox and hasattr(self.image_with_cropbox, "pil_image"):
-            image_width = self.image_with_cropbox.pil_image.width
-            image_height = self.image_with_cropbox.pil_image.height
+        if self.image_with_cropbox and hasattr(self.image_with_cropbox, "source_size"):
+            image_width = self.image_with_cropbox.source_size[0]
+            image_height = self.image_with_cropbox.source_size[1]
         else:
             image_width = width * 2  # Fallback
             image_height = height * 2
@@ -461,13 +688,13 @@ class ControlPanel(QWidget):
 
     def apply_boundary_constraints(self, x, y, width, height):
         if not self.image_with_cropbox or not hasattr(
-            self.image_with_cropbox, "pil_image"
+            self.image_with_cropbox, "source_size"
         ):
             return x, y, width, height
         min_width, min_height = config.MIN_CROP_WIDTH, config.MIN_CROP_HEIGHT
 
-        image_width = self.image_with_cropbox.pil_image.width
-        image_height = self.image_with_cropbox.pil_image.height
+        image_width = self.image_with_cropbox.source_size[0]
+        image_height = self.image_with_cropbox.source_size[1]
 
         # Ensure minimum dimensions
         width = max(min_width, width)
@@ -513,6 +740,15 @@ class ControlPanel(QWidget):
             self.width_input.valueChanged.connect(self.update_crop_from_fields)
             self.height_input.valueChanged.connect(self.update_crop_from_fields)
 
+    def set_media(self, media_path, media_info):
+        # The download finished
+        self.media_path = media_path
+        self.video_path = media_path
+        self.media_info = media_info
+        self.play_button.setEnabled(True)
+        self.preview_button.setEnabled(True)
+        self.update_frame_controls()
+
     def start_crop_background(self):
         # Extract all necessary data before starting the thread
         # This prevents issues with Qt objects being deleted
@@ -523,24 +759,65 @@ class ControlPanel(QWidget):
             height = self.height_input.value()
             media_path = self.media_path
             media_type = self.media_type
+            media_info = self.media_info
+            crop_path = self.get_crop_path()
             output_path = self.output_path
+            encoding_profile = self.encoding_profile
+            target_size = self.target_size
+            download = self.download
+            # The thread hands its result back to the GUI, None if it failed
+            gui = self.parent() if hasattr(self.parent(), "set_crop_result") else None
+            if not media_path:
+                print("Crop queued, it starts when the download finishes")
 
             # Define a function that captures the data and calls appropriate crop function
             def crop_func():
+                nonlocal media_path, media_info
+                if not media_path:
+                    media_path = download.wait()
+                    if not media_path:
+                        print("Download failed, nothing to crop")
+                        return
+                    media_info = get_media_info(media_path)
+
+                result = None
                 if media_type == MediaType.IMAGE:
-                    crop_image(media_path, output_path, x, y, width, height)
+                    result = crop_image(
+                        media_path,
+                        output_path,
+                        x,
+                        y,
+                        width,
+                        height,
+                        media_info=media_info,
+                    )
                 elif media_type == MediaType.VIDEO:
-                    crop_video(media_path, output_path, x, y, width, height)
+                    result = crop_video(
+                        media_path,
+                        output_path,
+                        x,
+                        y,
+                        width,
+                        height,
+                        encoding_profile=encoding_profile,
+                        target_size=target_size,
+                        media_info=media_info,
+                        crop_path=crop_path,
+                    )
                 else:
                     print(f"Unsupported media type: {media_type}")
+                if gui is not None:
+                    gui.set_crop_result(result)
 
-            # Start the crop process in a separate thread
-            crop_thread = threading.Thread(target=crop_func)
+            # Start the crop process in a separate thread, profiled with --profile
+            crop_thread = threading.Thread(target=profiler.wrap(crop_func))
             crop_thread.start()
 
-            # Store the thread reference in the parent GUI
+            # Store the thread reference and crop rectangle in the parent GUI
             if self.parent() and hasattr(self.parent(), "set_crop_thread"):
                 self.parent().set_crop_thread(crop_thread)
+                self.parent().set_crop_params((x, y, width, height))
+                self.parent().set_crop_path(crop_path)
 
             # Only close the window if auto_close is True (--keep-gui flag not set)
             if (
@@ -553,6 +830,43 @@ class ControlPanel(QWidget):
         except Exception as e:
             print(f"Error starting crop process: {e}")
 
+    def start_preview_background(self):
+        x = self.x_input.value()
+        y = self.y_input.value()
+        width = self.width_input.value()
+        height = self.height_input.value()
+        crop_path = self.get_crop_path()
+        media_path = self.media_path
+        output_path = self.output_path
+
+        def preview_func():
+            preview_path = render_preview(
+                media_path, output_path, x, y, width, height, crop_path=crop_path
+            )
+            # Back to the GUI thread to play it
+            self.previewReady.emit(preview_path or "")
+
+        self.close_preview()
+        self.preview_button.setEnabled(False)
+        self.preview_button.setText(" Rendering...")
+        # Not waited for on exit; an abandoned preview is simply discarded
+        threading.Thread(target=preview_func, daemon=True).start()
+
+    def show_preview(self, preview_path):
+        self.preview_button.setEnabled(True)
+        self.preview_button.setText(" Preview")
+        if not preview_path:
+            return
+
+        self.preview_player = PreviewPlayer(preview_path, self)
+        self.preview_player.cropConfirmed.connect(self.start_crop_background)
+        self.preview_player.show()
+
+    def close_preview(self):
+        if self.preview_player:
+            self.preview_player.close()
+            self.preview_player = None
+
     def align_horizontal(self):
         if not self.crop_box or not self.image_with_cropbox:
             return
@@ -564,7 +878,7 @@ class ControlPanel(QWidget):
             )
 
             # Get original image dimensions
-            image_width = self.image_with_cropbox.pil_image.width
+            image_width = self.image_with_cropbox.source_size[0]
 
             # Calculate centered X position
             centered_x = (image_width - current_width) // 2
@@ -586,7 +900,7 @@ class ControlPanel(QWidget):
             )
 
             # Get original image dimensions
-            image_height = self.image_with_cropbox.pil_image.height
+            image_height = self.image_with_cropbox.source_size[1]
 
             # Calculate centered Y position
             centered_y = (image_height - current_height) // 2
@@ -597,6 +911,54 @@ class ControlPanel(QWidget):
         except ValueError:
             print("Please enter valid dimensions before aligning")
 
+    def remove_black_bars(self):
+        if not self.crop_box or not self.image_with_cropbox:
+            return
+
+        # The sampled frames already on screen are enough to find the bars
+        area = find_picture_area(
+            self.image_with_cropbox.frames, self.image_with_cropbox.source_size
+        )
+        if area is None:
+            print("No black bars found")
+            return
+        print(f"Picture area without black bars: {area}")
+        self.set_crop_rect(*area)
+
+    def suggest_subject_crop(self):
+        if not self.crop_box or not self.image_with_cropbox:
+            return
+
+        # The selected aspect ratio, or the crop box's current shape
+        aspect_ratio = self.get_aspect_ratio_value(
+            self.aspect_ratio_combo.currentText()
+        )
+        if aspect_ratio is None:
+            aspect_ratio = self.width_input.value() / self.height_input.value()
+
+        area = find_subject_area(
+            self.image_with_cropbox.frames,
+            self.image_with_cropbox.source_size,
+            aspect_ratio,
+        )
+        if area is None:
+            return
+        print(f"Suggested crop around the subject: {area}")
+        self.set_crop_rect(*area, keep_aspect_ratio=True)
+
+    def set_crop_rect(self, x, y, width, height, keep_aspect_ratio=False):
+        # Drop the aspect ratio lock unless the rectangle was made to fit it
+        if not keep_aspect_ratio:
+            self.aspect_ratio_combo.setCurrentText("Custom")
+
+        self.disconnect_input_signals()
+        self.x_input.setValue(x)
+        self.y_input.setValue(y)
+        self.width_input.setValue(width)
+        self.height_input.setValue(height)
+        self.connect_input_signals()
+        self.update_crop_from_fields()
+
     def on_orientation_button_clicked(self, orientation):
         if orientation == "portrait":
             # Ensure portrait is checked and landscape is unchecked
@@ -623,8 +985,8 @@ class ControlPanel(QWidget):
             return None  # No aspect ratio constraint
         elif ratio_text == "Original":
             # Use original image aspect ratio
-            image_width = self.image_with_cropbox.pil_image.width
-            image_height = self.image_with_cropbox.pil_image.height
+            image_width = self.image_with_cropbox.source_size[0]
+            image_height = self.image_with_cropbox.source_size[1]
             return image_width / image_height
         elif ratio_text == "1:1":
             return 1.0
@@ -666,8 +1028,8 @@ class ControlPanel(QWidget):
         )
 
         # Center the crop box
-        image_width = self.image_with_cropbox.pil_image.width
-        image_height = self.image_with_cropbox.pil_image.height
+        image_width = self.image_with_cropbox.source_size[0]
+        image_height = self.image_with_cropbox.source_size[1]
 
         new_x = (image_width - new_width) // 2
         new_y = (image_height - new_height) // 2
@@ -684,8 +1046,8 @@ class ControlPanel(QWidget):
         if not self.image_with_cropbox:
             return current_width, current_height
 
-        image_width = self.image_with_cropbox.pil_image.width
-        image_height = self.image_with_cropbox.pil_image.height
+        image_width = self.image_with_cropbox.source_size[0]
+        image_height = self.image_with_cropbox.source_size[1]
 
         # Get the aspect ratio value
         aspect_ratio = self.get_aspect_ratio_value(ratio_text)
@@ -708,15 +1070,28 @@ class ControlPanel(QWidget):
 
         return new_width, new_height
 
+    def toggle_playback(self):
+        if self.image_with_cropbox:
+            self.image_with_cropbox.toggle_playback()
+
+    def on_playback_changed(self, playing):
+        icon = "pause" if playing else "play_arrow"
+        self.play_button.setIcon(
+            QIcon(f"assets/icons/{icon}_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg")
+        )
+        self.play_button.setToolTip("Pause" if playing else "Play from This Frame")
+
     def previous_frame(self):
         if hasattr(self, "image_with_cropbox") and self.image_with_cropbox:
             self.image_with_cropbox.previous_frame()
             self.update_frame_controls()
+            self.show_keyframed_crop()
 
     def next_frame(self):
         if hasattr(self, "image_with_cropbox") and self.image_with_cropbox:
             self.image_with_cropbox.next_frame()
             self.update_frame_controls()
+            self.show_keyframed_crop()
 
     def update_frame_controls(self):
         # Update frame navigation controls state
@@ -1,28 +1,85 @@
+import threading
+
 from PyQt6.QtWidgets import (
     QWidget,
     QHBoxLayout,
+    QLabel,
 )
-from PIL import Image
-
-from gui.ImageWithCropBox import ImageWithCropBox
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from gui.ImageWithCropBox import ImageWithCropBox, sample_video_frames
 from gui.ControlPanel import ControlPanel
+from animation import sample_animation_frames
+from config_loader import config
+from image_roi import load_preview
+from media_source import MediaSource
+from probe import get_media_info
 from utils import MediaType
 
 
 class CropGUI(QWidget):
-    def __init__(self, media_path, media_type, output_path, auto_close):
+    # Results of the download checks that run off the GUI thread: the first
+    # frame of a partial download (or None), and the finished download's
+    # (path, media info, source, sampled frames) or None if it failed
+    firstFrameChecked = pyqtSignal(object)
+    downloadProbed = pyqtSignal(object)
+
+    def __init__(
+        self,
+        media_path,
+        media_type,
+        output_path,
+        auto_close,
+        encoding_profile=None,
+        target_size=None,
+        media_info=None,
+        download=None,
+    ):
         super().__init__()
-        
+        self.output_path = output_path
+        self.auto_close = auto_close
+        self.encoding_profile = encoding_profile
+        self.target_size = target_size
+        self.crop_thread = None  # Store crop thread reference
+        self.crop_params = None  # Crop rectangle the thread was started with
+        self.crop_path = None  # Keyframed crop path, when one was rendered
+        self.crop_result = None  # Output path once the crop thread succeeded
+
+        # A URL still downloading; the crop widgets are added once there is a
+        # frame to show
+        self.download = download
+        self.image_with_cropbox = None
+        self.control_panel = None
+        self.source = None
+        self.image = None
+        self.source_size = None
+        self.frames = None
+        self.animated = False
+        if download is None:
+            self.load_media(media_path, media_type, media_info)
+        self.initUI()
+
+    def load_media(self, media_path, media_type, media_info=None):
         self.image_path = media_path if media_type == MediaType.IMAGE else None
         self.video_path = media_path if media_type == MediaType.VIDEO else None
         
         self.media_path = media_path
         self.media_type = media_type
-        self.output_path = output_path
-        self.image = Image.open(self.image_path) if self.image_path else None
-        self.auto_close = auto_close
-        self.crop_thread = None  # Store crop thread reference
-        self.initUI()
+        # Probe results (size, frame count, ...) so the file isn't reopened
+        self.media_info = media_info or get_media_info(media_path)
+        # Every file handle on the media is owned by the source
+        self.source = MediaSource(media_path)
+        self.animated = bool(self.image_path) and self.media_info.get("animated", False)
+        if self.image_path:
+            # Huge images are shown downscaled; coordinates stay in full size
+            self.source_size = (self.media_info["width"], self.media_info["height"])
+            if self.animated:
+                # Sampled frames to step through, like a video
+                self.frames = sample_animation_frames(
+                    media_path, 10, config.PREVIEW_MAX_SIZE
+                )
+                self.image = self.frames[0]
+            else:
+                self.image = load_preview(media_path, config.PREVIEW_MAX_SIZE)
 
     def initUI(self):
         self.setWindowTitle("Video Cropper")
@@ -30,25 +87,150 @@ class CropGUI(QWidget):
         self.setMinimumSize(200, 200)
 
         # Main horizontal layout
-        main_layout = QHBoxLayout()
+        self.main_layout = QHBoxLayout()
+        self.setLayout(self.main_layout)
+
+        if self.download:
+            # Download progress until the first frame can be shown
+            self.status_label = QLabel("Downloading...")
+            self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            self.main_layout.addWidget(self.status_label)
+            self.download_check_running = False
+            self.firstFrameChecked.connect(self.on_first_frame_checked)
+            self.downloadProbed.connect(self.on_download_probed)
+            self.download_timer = QTimer(self)
+            self.download_timer.timeout.connect(self.check_download)
+            self.download_timer.start(config.DOWNLOAD_POLL_MS)
+        else:
+            self.add_crop_widgets()
+
+    def add_crop_widgets(self):
+        if self.download:
+            self.main_layout.removeWidget(self.status_label)
+            self.status_label.deleteLater()
 
         # Image with crop box widget
         self.image_with_cropbox = ImageWithCropBox(
-            self.image, self, video_path=self.video_path
+            self.image,
+            self,
+            video_source=self.source if self.video_path else None,
+            source_size=self.source_size,
+            frames=self.frames,
         )
-        main_layout.addWidget(self.image_with_cropbox)
+        self.main_layout.addWidget(self.image_with_cropbox)
 
         # Control panel
         self.control_panel = ControlPanel(
             media_path=self.media_path, 
             media_type=self.media_type, 
-            output_path=self.output_path
+            output_path=self.output_path,
+            encoding_profile=self.encoding_profile,
+            target_size=self.target_size,
+            media_info=self.media_info,
+            download=self.download,
         )
         # Connect the control panel to the image widget
         self.control_panel.set_image_widget(self.image_with_cropbox)
-        main_layout.addWidget(self.control_panel)
+        self.main_layout.addWidget(self.control_panel)
 
-        self.setLayout(main_layout)
+    def check_download(self):
+        # Runs on the GUI timer. Whatever reads or decodes the file runs on a
+        # worker thread and reports back with a signal, one check at a time.
+        if self.image_with_cropbox is None:
+            downloaded = self.download.downloaded_bytes() / 1024**2
+            self.status_label.setText(f"Downloading... {downloaded:.1f} MB")
+        if self.download_check_running:
+            return
+        if self.download.done():
+            self.download_timer.stop()
+            self.start_download_check(self.probe_download)
+        elif self.image_with_cropbox is None and self.download.progressive is not False:
+            # Stops once the file is known not to decode from the front
+            self.start_download_check(self.check_first_frame)
+
+    def start_download_check(self, check):
+        self.download_check_running = True
+        threading.Thread(target=check, daemon=True).start()
+
+    def check_first_frame(self):
+        # Runs on a worker thread; the signal has to go out even when the
+        # check fails, or the next one is never started
+        try:
+            frame = self.download.first_frame()
+        except Exception as e:
+            print(f"Warning: could not decode the first frame: {e}")
+            frame = None
+        self.firstFrameChecked.emit(frame)
+
+    def probe_download(self):
+        # Probe the finished file and, for videos, sample the frames to step
+        # through, as the GUI would at startup
+        media_path = self.download.media_path
+        if not media_path:
+            self.downloadProbed.emit(None)
+            return
+        try:
+            media_info = get_media_info(media_path)
+            source = None
+            sampled = ([], [], [])
+            if media_info["media_type"] == MediaType.VIDEO.value:
+                source = MediaSource(media_path)
+                sampled = sample_video_frames(source)
+        except Exception as e:
+            # Reported as a failed download rather than leaving the window
+            # waiting on a signal that never comes
+            print(f"Warning: could not read the download: {e}")
+            self.downloadProbed.emit(None)
+            return
+        self.downloadProbed.emit((media_path, media_info, source, sampled))
+
+    def on_first_frame_checked(self, frame):
+        self.download_check_running = False
+        if frame is not None and self.image_with_cropbox is None:
+            self.show_first_frame(frame)
+
+    def show_first_frame(self, frame):
+        # Only videos are decoded from a partial download. The crop is set up
+        # on this frame while the rest arrives.
+        self.media_path = None
+        self.media_type = MediaType.VIDEO
+        self.video_path = None
+        self.media_info = {"width": frame.width, "height": frame.height}
+        self.image = frame
+        self.source_size = frame.size
+        self.add_crop_widgets()
+
+    def on_download_probed(self, probed):
+        self.download_check_running = False
+        if probed is None:
+            if self.image_with_cropbox is None:
+                self.status_label.setText("Download failed")
+            return
+
+        media_path, media_info, source, sampled = probed
+        frame_numbers, frame_times, frames = sampled
+        media_type = MediaType(media_info["media_type"])
+        if self.image_with_cropbox is None:
+            if media_type == MediaType.IMAGE:
+                self.load_media(media_path, media_type, media_info)
+                self.add_crop_widgets()
+                return
+            if media_type != MediaType.VIDEO or not frames:
+                self.status_label.setText(f"Can't crop this {media_type.value} file")
+                if source:
+                    source.close()
+                return
+            self.show_first_frame(frames[0].copy())
+
+        # Step through and play the whole video instead of its first frame
+        self.media_path = self.video_path = media_path
+        self.media_info = media_info
+        self.source = source
+        if frames:
+            self.image_with_cropbox.load_video(
+                source, frame_numbers, frame_times, frames
+            )
+        self.control_panel.set_media(media_path, media_info)
 
     def connect_crop_signals(self, crop_box):
         self.control_panel.connect_crop_signals(crop_box, self.image_with_cropbox)
@@ -59,26 +241,40 @@ class CropGUI(QWidget):
     def get_crop_thread(self):
         return self.crop_thread
 
+    def set_crop_params(self, crop_params):
+        self.crop_params = crop_params
+
+    def get_crop_params(self):
+        return self.crop_params
+
+    def set_crop_path(self, crop_path):
+        self.crop_path = crop_path
+
+    def get_crop_path(self):
+        return self.crop_path
+
+    def set_crop_result(self, crop_result):
+        self.crop_result = crop_result
+
+    def get_crop_result(self):
+        return self.crop_result
+
     def cleanup_resources(self):
-        if hasattr(self, "image") and self.image:
-            try:
-                self.image.close()
-                self.image = None
-            except:
-                pass
-
-        # Also cleanup resources in image_with_cropbox
-        if hasattr(self, "image_with_cropbox") and self.image_with_cropbox:
-            if hasattr(self.image_with_cropbox, "pil_image"):
-                try:
-                    self.image_with_cropbox.pil_image.close()
-                except:
-                    pass
-
-            # Cleanup any frames if it's a video
-            if hasattr(self.image_with_cropbox, "frames"):
-                for frame in self.image_with_cropbox.frames:
-                    try:
-                        frame.close()
-                    except:
-                        pass
+        # Stop playback before closing the image, capture and clip opened on
+        # the media file
+        if self.download:
+            self.download_timer.stop()
+        if self.image_with_cropbox is None:
+            # Closed before anything was downloaded to show
+            return
+        self.image_with_cropbox.stop_playback()
+        if self.source:
+            self.source.close()
+        self.control_panel.close_preview()
+        self.image = None
+
+        # Sampled video and animation frames are in-memory copies, drop them too
+        if self.media_type == MediaType.VIDEO or self.animated:
+            for frame in self.image_with_cropbox.frames:
+                frame.close()
+            self.image_with_cropbox.frames = []
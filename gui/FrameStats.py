@@ -0,0 +1,63 @@
+import time
+from collections import deque
+
+
+class FrameStats:
+    # Frame timings for the debug HUD and the GUI benchmark. Input events and
+    # paints are recorded as they happen; a frame ends when the topmost
+    # widget has painted.
+    def __init__(self, budget_ms, history=240):
+        self.budget = budget_ms / 1000
+        self.paint_times = deque(maxlen=history)
+        self.latencies = deque(maxlen=history)
+        self.event_times = deque()
+        self.frames = 0
+        self.dropped = 0
+        self.last_frame_end = None
+        self.pending_since = None
+        self.current_paint = 0.0
+
+    def input_event(self):
+        now = time.perf_counter()
+        self.event_times.append(now)
+        # Latency is measured from the oldest event the next frame shows
+        if self.pending_since is None:
+            self.pending_since = now
+
+    def add_paint_time(self, seconds):
+        self.current_paint += seconds
+
+    def frame_done(self):
+        now = time.perf_counter()
+        self.frames += 1
+        self.paint_times.append(self.current_paint)
+        self.current_paint = 0.0
+
+        if self.pending_since is not None:
+            self.latencies.append(now - self.pending_since)
+            # Frames only count as dropped while the user is interacting
+            if self.last_frame_end is not None:
+                missed = int((now - self.last_frame_end) / self.budget) - 1
+                if missed > 0 and self.last_frame_end >= self.pending_since - self.budget:
+                    self.dropped += missed
+            self.pending_since = None
+        self.last_frame_end = now
+
+    def events_per_second(self):
+        cutoff = time.perf_counter() - 1.0
+        while self.event_times and self.event_times[0] < cutoff:
+            self.event_times.popleft()
+        return len(self.event_times)
+
+    def last_paint_ms(self):
+        return self.paint_times[-1] * 1000 if self.paint_times else 0.0
+
+    def reset(self):
+        self.paint_times.clear()
+        self.latencies.clear()
+        self.event_times.clear()
+        self.frames = 0
+        self.dropped = 0
+        self.last_frame_end = None
+        self.pending_since = None
+        self.current_paint = 0.0
@@ -1,27 +1,92 @@
-import cv2
+import time
+
 from PyQt6.QtWidgets import QWidget
-from PyQt6.QtGui import QPainter, QPixmap
-from PyQt6.QtCore import Qt, QRect, QSize
+from PyQt6.QtGui import QColor, QImage, QKeySequence, QPainter, QPixmap, QShortcut
+from PyQt6.QtCore import Qt, QRect, QSize, QTimer, pyqtSignal
 from PIL.ImageQt import ImageQt
-from PIL import Image
 
+from config_loader import config
+from frame_index import read_frames
+from gui.FrameStats import FrameStats
 from gui.ResizableCropBox import ResizableCropBox
+from gui.VideoPlayback import VideoPlayback
+from report import report
+from scenes import sample_scene_frames
+
+
+def sample_video_frames(video_source, num_frames=10):
+    # A frame from every scene (or evenly spaced frames), decoded by exact
+    # timestamp from the frame index. Returns the frame numbers, their times
+    # (seconds from the first frame) and the frames; touches no widgets, so
+    # it can run off the GUI thread.
+    try:
+        with report.span("extract_frames") as span:
+            index = video_source.frame_index()
+            if not len(index):
+                print(f"Error opening video: {video_source.path}")
+                return [], [], []
+
+            if config.SCENE_SAMPLING:
+                frame_numbers = sample_scene_frames(
+                    video_source.path, index, num_frames
+                )
+            else:
+                frame_numbers = index.sample(num_frames)
+            decoded = read_frames(video_source.path, index, frame_numbers)
+            frame_numbers = [
+                frame_number
+                for frame_number, frame in zip(frame_numbers, decoded)
+                if frame is not None
+            ]
+            start = index.frame_time(0)
+            frame_times = [
+                index.frame_time(frame_number) - start
+                for frame_number in frame_numbers
+            ]
+            frames = [frame for frame in decoded if frame is not None]
+            span["frames"] = len(frames)
+        print(f"Extracted {len(frames)} frames from video")
+        return frame_numbers, frame_times, frames
+
+    except Exception as e:
+        print(f"Error extracting frames: {e}")
+        return [], [], []
 
 
 class ImageWithCropBox(QWidget):
-    def __init__(self, pil_image, parent=None, video_path=None):
+    # Emitted with True when playback starts and False when it stops
+    playbackChanged = pyqtSignal(bool)
+
+    def __init__(
+        self, pil_image, parent=None, video_source=None, source_size=None, frames=None
+    ):
         super().__init__(parent)
 
-        # If video_path is provided, extract frames from video
-        if video_path:
-            self.frames = self.extract_frames_from_video(video_path)
+        # Frame number and time (seconds from the start) of each sampled
+        # video frame, for keyframing the crop and starting playback
+        self.frame_numbers = []
+        self.frame_times = []
+        self.video_source = video_source
+
+        # If a video source is provided, extract frames from video
+        if video_source:
+            self.frames = self.extract_frames_from_video(video_source)
             self.current_frame_index = 0
             self.pil_image = self.frames[0] if self.frames else pil_image
+        elif frames:
+            # Frames sampled from an animated image
+            self.frames = frames
+            self.current_frame_index = 0
+            self.pil_image = frames[0]
         else:
             self.frames = [pil_image] if pil_image else []
             self.current_frame_index = 0
             self.pil_image = pil_image
 
+        # Crop coordinates are in the source's pixels even when a downscaled
+        # preview is shown
+        self.source_size = source_size or self.pil_image.size
+
         self.qimage = ImageQt(self.pil_image)
         self.pixmap = QPixmap.fromImage(self.qimage)
 
@@ -31,12 +96,25 @@ class ImageWithCropBox(QWidget):
         # Create the crop box overlay (will be positioned in resizeEvent)
         self.crop_box = None
 
+        # Frame timings behind the debug HUD, toggled with F3
+        self.frame_stats = FrameStats(config.HUD_FRAME_BUDGET_MS)
+        self.show_hud = config.DEBUG_HUD
+        self.hud_shortcut = QShortcut(QKeySequence("F3"), self)
+        self.hud_shortcut.activated.connect(self.toggle_hud)
+
+        # Real-time playback; the timer polls for the frame that is due
+        self.playback = None
+        self.playback_timer = QTimer(self)
+        self.playback_timer.timeout.connect(self.show_due_frame)
+
     def showEvent(self, event):
         super().showEvent(event)
         if self.crop_box is None:
             self.crop_box = ResizableCropBox(self)
             # Give the crop box a reference to get image boundaries
             self.crop_box.get_image_bounds = lambda: self.image_area
+            # The crop box paints last, so it closes each frame
+            self.crop_box.frame_stats = self.frame_stats
             self.crop_box.show()
 
             # Emit a signal or call parent method to connect the crop box signal
@@ -44,6 +122,7 @@ class ImageWithCropBox(QWidget):
                 self.parent().connect_crop_signals(self.crop_box)
 
     def paintEvent(self, event):
+        paint_start = time.perf_counter()
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
@@ -63,25 +142,64 @@ class ImageWithCropBox(QWidget):
         # Update image area
         self.image_area = QRect(x, y, scaled_size.width(), scaled_size.height())
 
-        # Draw the image
-        scaled_pixmap = self.pixmap.scaled(
-            scaled_size,
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation,
-        )
-        painter.drawPixmap(x, y, scaled_pixmap)
+        # Draw the image; playback frames are decoded at display size already
+        if pixmap_size == scaled_size:
+            painter.drawPixmap(x, y, self.pixmap)
+        else:
+            scaled_pixmap = self.pixmap.scaled(
+                scaled_size,
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation,
+            )
+            painter.drawPixmap(x, y, scaled_pixmap)
 
         # Update crop box to only cover the image area
         if self.crop_box:
             self.crop_box.setGeometry(self.image_area)
 
+        if self.show_hud:
+            self.draw_hud(painter)
+        painter.end()
+
+        self.frame_stats.add_paint_time(time.perf_counter() - paint_start)
+        if not self.crop_box:
+            self.frame_stats.frame_done()
+
+        # Only the first paint closes the span, later calls are ignored
+        report.end("gui.first_frame")
+
+    def draw_hud(self, painter):
+        stats = self.frame_stats
+        text = (
+            f"paint {stats.last_paint_ms():.1f} ms  "
+            f"{stats.events_per_second()} ev/s  "
+            f"dropped {stats.dropped}"
+        )
+        if self.playback:
+            text += f"  playback dropped {self.playback.dropped}"
+        # Inside the image area, which is repainted along with the crop box
+        hud_rect = QRect(
+            self.image_area.x() + 4,
+            self.image_area.y() + 4,
+            painter.fontMetrics().horizontalAdvance(text) + 8,
+            painter.fontMetrics().height() + 4,
+        )
+        painter.fillRect(hud_rect, QColor(0, 0, 0, 160))
+        painter.setPen(QColor(0, 255, 0))
+        painter.drawText(hud_rect, Qt.AlignmentFlag.AlignCenter, text)
+
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+        self.frame_stats.reset()
+        self.update()
+
     def display_to_original_coords(self, x, y, width, height):
         if self.image_area.isEmpty():
             return x, y, width, height
 
         # Convert from display coordinates to original image coordinates
-        scale_x = self.pil_image.width / self.image_area.width()
-        scale_y = self.pil_image.height / self.image_area.height()
+        scale_x = self.source_size[0] / self.image_area.width()
+        scale_y = self.source_size[1] / self.image_area.height()
 
         orig_x = round(x * scale_x)
         orig_y = round(y * scale_y)
@@ -95,8 +213,8 @@ class ImageWithCropBox(QWidget):
             return orig_x, orig_y, orig_width, orig_height
 
         # Convert from original image coordinates to display coordinates
-        scale_x = self.image_area.width() / self.pil_image.width
-        scale_y = self.image_area.height() / self.pil_image.height
+        scale_x = self.image_area.width() / self.source_size[0]
+        scale_y = self.image_area.height() / self.source_size[1]
 
         x = round(orig_x * scale_x)
         y = round(orig_y * scale_y)
@@ -124,8 +242,8 @@ class ImageWithCropBox(QWidget):
         crop_rect = self.crop_box.rect
 
         # Use consistent scaling factors with display_to_original_coords method
-        scale_x = self.pil_image.width / self.image_area.width()
-        scale_y = self.pil_image.height / self.image_area.height()
+        scale_x = self.source_size[0] / self.image_area.width()
+        scale_y = self.source_size[1] / self.image_area.height()
 
         # Convert to image coordinates (round to avoid precision loss)
         img_x = round(crop_rect.x() * scale_x)
@@ -135,49 +253,92 @@ class ImageWithCropBox(QWidget):
 
         return (img_x, img_y, img_w, img_h)
 
-    def extract_frames_from_video(self, video_path, num_frames=10):
-        frames = []
-        try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                print(f"Error opening video: {video_path}")
-                return frames
+    def extract_frames_from_video(self, video_source, num_frames=10):
+        self.frame_numbers, self.frame_times, frames = sample_video_frames(
+            video_source, num_frames
+        )
+        return frames
 
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    def load_video(self, video_source, frame_numbers, frame_times, frames):
+        # Swap the frame shown so far (the first frame of a download) for
+        # frames sampled over the complete video
+        for frame in self.frames:
+            frame.close()
+        self.video_source = video_source
+        self.frame_numbers = frame_numbers
+        self.frame_times = frame_times
+        self.frames = frames
+        self.current_frame_index = 0
+        self.update_current_frame()
+
+    def current_frame_time(self):
+        if self.current_frame_index < len(self.frame_times):
+            return self.frame_times[self.current_frame_index]
+        return None
+
+    def toggle_playback(self):
+        if self.playback:
+            self.stop_playback()
+        else:
+            self.start_playback()
 
-            if total_frames <= num_frames:
-                # If video has fewer frames than requested, get all frames
-                frame_indices = list(range(total_frames))
-            else:
-                # Extract evenly spaced frames
-                frame_indices = [
-                    int(i * total_frames / num_frames) for i in range(num_frames)
-                ]
-
-            for frame_idx in frame_indices:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = cap.read()
-                if ret:
-                    # Convert BGR to RGB
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    # Convert to PIL Image
-                    pil_image = Image.fromarray(frame)
-                    frames.append(pil_image)
-
-            cap.release()
-            print(f"Extracted {len(frames)} frames from video")
-
-        except Exception as e:
-            print(f"Error extracting frames: {e}")
+    def start_playback(self):
+        # Play from the sampled frame on screen, decoded at the size it is
+        # shown at
+        if not self.frame_numbers or self.image_area.isEmpty():
+            return
+        index = self.video_source.frame_index()
+        start_frame = self.frame_numbers[self.current_frame_index]
+        self.playback = VideoPlayback(
+            self.video_source.path,
+            index,
+            start_frame,
+            (self.image_area.width(), self.image_area.height()),
+            config.PLAYBACK_BUFFER_FRAMES,
+        )
+        self.playback.start()
 
-        return frames
+        # Poll twice per frame so no frame is shown late by a whole period
+        duration = index.frame_time(len(index) - 1) - index.frame_time(0)
+        fps = (len(index) - 1) / duration if duration > 0 else 30
+        self.playback_timer.start(max(1, round(500 / fps)))
+        self.playbackChanged.emit(True)
+
+    def stop_playback(self):
+        if not self.playback:
+            return
+        self.playback_timer.stop()
+        self.playback.stop()
+        if self.playback.dropped:
+            print(f"Playback dropped {self.playback.dropped} frames")
+        self.playback = None
+        self.playbackChanged.emit(False)
+
+    def show_due_frame(self):
+        frame = self.playback.take_due_frame()
+        if frame:
+            slot, _ = frame
+            pixels = self.playback.frame_pixels(slot)
+            height, width = pixels.shape[:2]
+            qimage = QImage(
+                pixels.data, width, height, 3 * width, QImage.Format.Format_RGB888
+            )
+            # fromImage copies, so the slot can be decoded into again
+            self.pixmap = QPixmap.fromImage(qimage)
+            self.playback.release(slot)
+            # Only the picture needs repainting, not the margins around it
+            self.update(self.image_area)
+        if self.playback.finished and not frame:
+            self.stop_playback()
 
     def previous_frame(self):
+        self.stop_playback()
         if hasattr(self, "frames") and self.current_frame_index > 0:
             self.current_frame_index -= 1
             self.update_current_frame()
 
     def next_frame(self):
+        self.stop_playback()
         if hasattr(self, "frames") and self.current_frame_index < len(self.frames) - 1:
             self.current_frame_index += 1
             self.update_current_frame()
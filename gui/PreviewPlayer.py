@@ -0,0 +1,91 @@
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton
+from PyQt6.QtGui import QIcon, QImage, QPixmap
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+
+from media_source import MediaSource
+
+
+class PreviewPlayer(QWidget):
+    # Loops the rendered crop preview; "Crop" confirms the crop and starts
+    # the full encode
+    cropConfirmed = pyqtSignal()
+
+    def __init__(self, preview_path, parent=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.source = MediaSource(preview_path)
+        self.clip = self.source.clip()
+        self.frame_number = 0
+
+        self.setWindowTitle("Crop Preview")
+        layout = QVBoxLayout()
+
+        self.video_label = QLabel()
+        self.video_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.video_label.setMinimumSize(*self.clip.size)
+        layout.addWidget(self.video_label)
+
+        controls_layout = QHBoxLayout()
+        self.play_button = QPushButton()
+        self.play_button.setFixedSize(28, 28)
+        self.play_button.clicked.connect(self.toggle_playback)
+        controls_layout.addWidget(self.play_button)
+        controls_layout.addStretch()
+
+        self.crop_button = QPushButton(" Crop Video")
+        self.crop_button.setIcon(
+            QIcon("assets/icons/crop_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg")
+        )
+        self.crop_button.clicked.connect(self.confirm_crop)
+        controls_layout.addWidget(self.crop_button)
+        layout.addLayout(controls_layout)
+        self.setLayout(layout)
+
+        # Frames are read one at a time as they are shown; the preview is
+        # small enough to decode on the GUI thread
+        self.timer = QTimer(self)
+        self.timer.setInterval(round(1000 / self.clip.fps))
+        self.timer.timeout.connect(self.show_next_frame)
+        self.show_next_frame()
+        self.set_playing(True)
+
+    def show_next_frame(self):
+        t = self.frame_number / self.clip.fps
+        if t >= self.clip.duration:
+            # Loop back to the start
+            self.frame_number = 0
+            t = 0
+        frame = self.clip.get_frame(t)
+        height, width = frame.shape[:2]
+        image = QImage(
+            frame.data, width, height, 3 * width, QImage.Format.Format_RGB888
+        ).copy()
+        self.video_label.setPixmap(
+            QPixmap.fromImage(image).scaled(
+                self.video_label.size(),
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation,
+            )
+        )
+        self.frame_number += 1
+
+    def set_playing(self, playing):
+        if playing:
+            self.timer.start()
+            icon = "pause_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg"
+        else:
+            self.timer.stop()
+            icon = "play_arrow_24dp_E3E3E3_FILL0_wght400_GRAD0_opsz24.svg"
+        self.play_button.setIcon(QIcon(f"assets/icons/{icon}"))
+        self.play_button.setToolTip("Pause" if playing else "Play")
+
+    def toggle_playback(self):
+        self.set_playing(not self.timer.isActive())
+
+    def confirm_crop(self):
+        self.close()
+        self.cropConfirmed.emit()
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.source.close()
+        super().closeEvent(event)
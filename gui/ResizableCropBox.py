@@ -1,3 +1,5 @@
+import time
+
 from PyQt6.QtWidgets import QWidget
 from PyQt6.QtGui import QPainter, QBrush, QColor, QPen
 from PyQt6.QtCore import Qt, QRect, pyqtSignal
@@ -25,6 +27,8 @@ class ResizableCropBox(QWidget):
         self.drag_handle = None
         self.drag_start = None
         self.drag_rect_initial = None
+        # Set by the image widget to time frames for the debug HUD
+        self.frame_stats = None
 
     def resizeEvent(self, event):
         old_size = event.oldSize()
@@ -65,6 +69,7 @@ class ResizableCropBox(QWidget):
         return bounds
 
     def paintEvent(self, event):
+        paint_start = time.perf_counter()
         painter = QPainter(self)
 
         # Draw semi-transparent overlay in four regions around the crop box
@@ -107,6 +112,11 @@ class ResizableCropBox(QWidget):
         for x in [self.rect.left(), self.rect.right() - self.handle_size]:
             for y in [self.rect.top(), self.rect.bottom() - self.handle_size]:
                 painter.drawRect(x, y, self.handle_size, self.handle_size)
+        painter.end()
+
+        if self.frame_stats:
+            self.frame_stats.add_paint_time(time.perf_counter() - paint_start)
+            self.frame_stats.frame_done()
 
     def mousePressEvent(self, event):
         # Check if a handle is clicked
@@ -405,4 +415,7 @@ class ResizableCropBox(QWidget):
         self.float_rect[1] = float(y)
         self.float_rect[2] = float(width)
         self.float_rect[3] = float(height)
+        # Drags and spinbox edits both land here
+        if self.frame_stats:
+            self.frame_stats.input_event()
         self.update()
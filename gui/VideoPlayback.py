@@ -0,0 +1,161 @@
+import queue
+import subprocess
+import threading
+import time
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+# How often the decode thread checks whether playback was stopped while it
+# waits for a free buffer slot
+STOP_POLL_SECONDS = 0.1
+
+
+class VideoPlayback:
+    # Plays a video from one of its frames. A background thread decodes it
+    # already scaled to display size into a small ring buffer of reused
+    # frames; the GUI takes whichever frame is due by the wall clock, so
+    # frames the machine couldn't show in time are dropped instead of
+    # slowing playback down.
+
+    def __init__(self, path, index, start_frame, size, buffer_frames):
+        self.path = path
+        self.index = index
+        self.start_frame = start_frame
+        self.start_time = index.frame_time(start_frame)
+        self.size = size
+
+        width, height = size
+        self.buffer = np.empty((buffer_frames, height, width, 3), dtype=np.uint8)
+        # Slots ready to decode into, and (slot, frame number) ready to show
+        self.free_slots = queue.Queue()
+        for slot in range(buffer_frames):
+            self.free_slots.put(slot)
+        self.decoded = queue.Queue()
+        self.pending = None
+
+        self.dropped = 0
+        self.finished = False
+        self.stopped = threading.Event()
+        self.process = None
+        self.thread = threading.Thread(target=self.decode, daemon=True)
+        self.clock_start = None
+
+    def start(self):
+        self.thread.start()
+
+    def elapsed(self):
+        # The clock starts with the first frame shown, so the time ffmpeg
+        # takes to start and seek doesn't count as frames to drop
+        if self.clock_start is None:
+            return 0.0
+        return time.perf_counter() - self.clock_start
+
+    def due_time(self, frame_number):
+        # When the frame should be on screen, counted from playback start
+        return self.index.frame_time(frame_number) - self.start_time
+
+    def decode(self):
+        width, height = self.size
+        command = [
+            FFMPEG_BINARY,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-seek_timestamp",
+            "1",
+            "-ss",
+            f"{self.start_time:.6f}",
+            "-i",
+            self.path,
+            "-map",
+            "0:v:0",
+            "-vf",
+            f"scale={width}:{height}",
+            "-fps_mode",
+            "passthrough",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-",
+        ]
+        self.process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        frame_bytes = width * height * 3
+        frame_number = self.start_frame
+        try:
+            while frame_number < len(self.index) and not self.stopped.is_set():
+                slot = self.get_free_slot()
+                if slot is None:
+                    break
+                view = memoryview(self.buffer[slot]).cast("B")
+                if self.process.stdout.readinto(view) < frame_bytes:
+                    break
+
+                # Already late when decoded (the next frame is due): give the
+                # slot straight back
+                next_frame = frame_number + 1
+                late = next_frame < len(self.index) and (
+                    self.due_time(next_frame) < self.elapsed()
+                )
+                if late:
+                    self.dropped += 1
+                    self.free_slots.put(slot)
+                else:
+                    self.decoded.put((slot, frame_number))
+                frame_number += 1
+        finally:
+            self.decoded.put(None)
+            self.process.stdout.close()
+            self.process.kill()
+            self.process.wait()
+
+    def get_free_slot(self):
+        while not self.stopped.is_set():
+            try:
+                return self.free_slots.get(timeout=STOP_POLL_SECONDS)
+            except queue.Empty:
+                pass
+        return None
+
+    def take_due_frame(self):
+        # (slot, frame number) of the newest frame that is due, or None when
+        # the frame on screen should stay; due frames skipped over count as
+        # dropped. The slot goes back with release() once shown.
+        due = None
+        elapsed = self.elapsed()
+        while True:
+            if self.pending is None:
+                try:
+                    self.pending = self.decoded.get_nowait()
+                except queue.Empty:
+                    break
+                if self.pending is None:
+                    # End of the video
+                    self.finished = True
+                    break
+            if self.clock_start is None:
+                start_offset = self.due_time(self.pending[1])
+                self.clock_start = time.perf_counter() - start_offset
+                elapsed = start_offset
+            if self.due_time(self.pending[1]) > elapsed:
+                break
+            if due is not None:
+                self.dropped += 1
+                self.release(due[0])
+            due, self.pending = self.pending, None
+        return due
+
+    def frame_pixels(self, slot):
+        return self.buffer[slot]
+
+    def release(self, slot):
+        self.free_slots.put(slot)
+
+    def stop(self):
+        self.stopped.set()
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+        self.thread.join()
@@ -3,16 +3,34 @@ import sys
 from PyQt6.QtWidgets import QApplication
 
 from gui.CropGUI import CropGUI
+from report import report
 
 
-def run_gui(media_path, media_type, output_path, keep_open):
-    app = QApplication(sys.argv)
+def run_gui(
+    media_path,
+    media_type,
+    output_path,
+    keep_open,
+    encoding_profile=None,
+    target_size=None,
+    media_info=None,
+    download=None,
+):
+    # Time from launch until the first frame is painted
+    report.begin("gui.first_frame")
+
+    # A daemon runs many jobs in one process, and Qt allows only one app
+    app = QApplication.instance() or QApplication(sys.argv)
 
     gui = CropGUI(
         media_path=media_path,
         media_type=media_type,
         output_path=output_path,
         auto_close=(not keep_open),
+        encoding_profile=encoding_profile,
+        target_size=target_size,
+        media_info=media_info,
+        download=download,
     )
     
     gui.show()
@@ -0,0 +1,179 @@
+import mmap
+
+import numpy as np
+from PIL import Image
+
+from config_loader import config
+
+# Opening an image only reads its header, so Pillow's open-time size check is
+# replaced by a budget on what is actually decoded (MAX_IMAGE_PIXELS)
+Image.MAX_IMAGE_PIXELS = None
+
+# Bytes per pixel of the raw layouts that can be sliced straight from the file
+RAW_PIXEL_BYTES = {
+    "L": 1,
+    "P": 1,
+    "I;16": 2,
+    "I;16B": 2,
+    "LA": 2,
+    "RGB": 3,
+    "BGR": 3,
+    "RGBA": 4,
+    "RGBX": 4,
+    "BGRA": 4,
+    "BGRX": 4,
+    "CMYK": 4,
+    "F;32F": 4,
+    "I;32": 4,
+}
+
+# Decoders that fill rows top to bottom and can stop early
+SEQUENTIAL_DECODERS = {"zip"}
+
+# Rows decoded per step when building a preview from raw data
+PREVIEW_BAND_ROWS = 256
+
+
+def open_image(path):
+    return Image.open(path)
+
+
+def check_decode_budget(pixels, what):
+    limit = config.MAX_IMAGE_PIXELS
+    if limit is not None and pixels > limit:
+        raise Image.DecompressionBombError(
+            f"{what} needs {pixels} pixels decoded at once, "
+            f"above MAX_IMAGE_PIXELS ({limit})"
+        )
+
+
+def get_raw_tiles(img):
+    # Raw tiles as (extents, offset, rawmode, stride, orientation), or None
+    # when any part of the image needs a real decoder
+    tiles = []
+    for tile in img.tile:
+        name, extents, offset, args = tile[:4]
+        if name != "raw":
+            return None
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if rawmode not in RAW_PIXEL_BYTES:
+            return None
+        tile_width = extents[2] - extents[0]
+        tiles.append(
+            (
+                extents,
+                offset,
+                rawmode,
+                stride or tile_width * RAW_PIXEL_BYTES[rawmode],
+                orientation,
+            )
+        )
+    return tiles
+
+
+def read_raw_region(img, tiles, box):
+    # Copy only the bytes under the box out of a memory map of the file
+    left, top, right, bottom = box
+    region = Image.new(img.mode, (right - left, bottom - top))
+    if img.mode == "P":
+        region.putpalette(img.getpalette())
+
+    with open(img.filename, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        for (x0, y0, x1, y1), offset, rawmode, stride, orientation in tiles:
+            ix0, iy0 = max(left, x0), max(top, y0)
+            ix1, iy1 = min(right, x1), min(bottom, y1)
+            if ix0 >= ix1 or iy0 >= iy1:
+                continue
+
+            pixel_bytes = RAW_PIXEL_BYTES[rawmode]
+            rows = np.frombuffer(
+                data, dtype=np.uint8, count=stride * (y1 - y0), offset=offset
+            ).reshape(y1 - y0, stride)
+            # Bottom-up files (BMP) store the last row first
+            if orientation < 0:
+                rows = rows[::-1]
+            part = rows[
+                iy0 - y0 : iy1 - y0,
+                (ix0 - x0) * pixel_bytes : (ix1 - x0) * pixel_bytes,
+            ].copy()
+            # Drop the view before the map is closed
+            del rows
+
+            tile_image = Image.frombuffer(
+                img.mode, (ix1 - ix0, iy1 - iy0), part, "raw", rawmode, 0, 1
+            )
+            region.paste(tile_image, (ix0 - left, iy0 - top))
+
+    return region
+
+
+def read_region(path, box):
+    # Decode as little of the image as the format allows for this box
+    with open_image(path) as img:
+        raw_tiles = get_raw_tiles(img)
+        if raw_tiles:
+            check_decode_budget((box[2] - box[0]) * (box[3] - box[1]), "Crop")
+            return read_raw_region(img, raw_tiles, box)
+
+        # Row-sequential decoders stop at the bottom of the box
+        if (
+            len(img.tile) == 1
+            and img.tile[0][0] in SEQUENTIAL_DECODERS
+            and not img.info.get("interlace")
+        ):
+            name, extents, offset, args = img.tile[0][:4]
+            rows = min(box[3], extents[3])
+            check_decode_budget(img.width * rows, "Crop")
+            img.tile = [(name, (0, 0, img.width, rows), offset, args)]
+            img.load()
+            return img.crop(box)
+
+        check_decode_budget(img.width * img.height, "Crop")
+        return img.crop(box)
+
+
+def get_preview_size(size, max_size):
+    width, height = size
+    scale = min(1.0, max_size / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def load_preview(path, max_size):
+    # An in-memory image no larger than max_size on its longest side
+    with open_image(path) as img:
+        preview_size = get_preview_size(img.size, max_size)
+        if preview_size == img.size:
+            check_decode_budget(img.width * img.height, "Preview")
+            img.load()
+            return img.copy()
+
+        raw_tiles = get_raw_tiles(img)
+        if raw_tiles:
+            # Downscale band by band so the full raster is never in memory
+            scale = img.height / preview_size[1]
+            band_rows = max(PREVIEW_BAND_ROWS, int(scale) * 4)
+            check_decode_budget(img.width * band_rows, "Preview")
+            preview = Image.new(img.mode, preview_size)
+            if img.mode == "P":
+                preview.putpalette(img.getpalette())
+            for top in range(0, img.height, band_rows):
+                bottom = min(img.height, top + band_rows)
+                out_top = round(top / scale)
+                out_bottom = round(bottom / scale)
+                if out_bottom <= out_top:
+                    continue
+                band = read_raw_region(img, raw_tiles, (0, top, img.width, bottom))
+                preview.paste(
+                    band.resize((preview_size[0], out_bottom - out_top)),
+                    (0, out_top),
+                )
+            return preview
+
+        # JPEG decodes straight to a 1/2, 1/4 or 1/8 scale
+        img.draft(img.mode, preview_size)
+        check_decode_budget(img.width * img.height, "Preview")
+        return img.resize(preview_size, reducing_gap=3.0)
@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import time
+
+from config_loader import config
+from scratch import LOCK_FILE, is_stale
+
+# Pipeline stages in order; a job records the last one it completed
+STAGES = ["download", "probe", "crop", "finalize"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    argv TEXT NOT NULL,
+    output TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    scratch_dir TEXT,
+    media_path TEXT,
+    media_type TEXT,
+    result_path TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class JobStore:
+    # Durable record of every job and the last pipeline stage it completed,
+    # so an interrupted worker can pick up where it stopped
+
+    def __init__(self, path=None):
+        self.path = path or config.JOB_DB
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets a worker write while another process reads the queue
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_job(self, argv, output, status="running"):
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO jobs (argv, output, status, created, updated) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (json.dumps(argv), output, status, now, now),
+        )
+        return cursor.lastrowid
+
+    def get_job(self, job_id):
+        return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def update_job(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    def complete_stage(self, job_id, stage, **fields):
+        self.update_job(job_id, stage=stage, **fields)
+
+    def finish_job(self, job_id):
+        self.update_job(job_id, status="done", stage=STAGES[-1])
+
+    def fail_job(self, job_id, error):
+        self.update_job(job_id, status="failed", error=error)
+
+    def stage_done(self, job, stage):
+        if job is None or job["stage"] is None:
+            return False
+        return STAGES.index(job["stage"]) >= STAGES.index(stage)
+
+    def is_interrupted(self, job):
+        if job["status"] != "running":
+            return False
+        if time.time() - job["updated"] > config.JOB_RESUME_SECONDS:
+            return False
+        # A running job whose scratch lock went stale has lost its worker
+        if not job["scratch_dir"]:
+            return True
+        lock_path = os.path.join(job["scratch_dir"], LOCK_FILE)
+        return not os.path.exists(lock_path) or is_stale(lock_path)
+
+    def pending_jobs(self):
+        # Queued jobs plus running jobs whose worker died, oldest first
+        rows = self.conn.execute(
+            "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY id"
+        ).fetchall()
+        return [
+            row
+            for row in rows
+            if row["status"] == "queued" or self.is_interrupted(row)
+        ]
+
+    def resumable_scratch_dirs(self):
+        # Stale job directories that must survive the sweep so they can resume
+        return [
+            row["scratch_dir"]
+            for row in self.pending_jobs()
+            if row["scratch_dir"] and os.path.isdir(row["scratch_dir"])
+        ]
@@ -0,0 +1,108 @@
+import shutil
+import subprocess
+
+from PIL import Image, JpegImagePlugin
+
+from config_loader import config
+from image_roi import open_image, read_region
+
+JPEG_EXTENSIONS = {".jpg", ".jpeg", ".jpe", ".jfif"}
+
+
+def find_jpegtran():
+    if config.JPEGTRAN_PATH:
+        return config.JPEGTRAN_PATH
+    return shutil.which("jpegtran")
+
+
+def get_image_mcu_size(img):
+    # MCU width and height of an open JPEG, None for anything else. Each MCU
+    # spans 8 pixels times the largest sampling factor of any component.
+    if img.format != "JPEG" or not getattr(img, "layer", None):
+        return None
+    h_max = max(layer[1] for layer in img.layer)
+    v_max = max(layer[2] for layer in img.layer)
+    return 8 * h_max, 8 * v_max
+
+
+def is_mcu_aligned(mcu_size, box):
+    # Only the top-left corner has to sit on the grid; jpegtran keeps partial
+    # MCUs along the right and bottom edges
+    mcu_width, mcu_height = mcu_size
+    return box[0] % mcu_width == 0 and box[1] % mcu_height == 0
+
+
+def crop_lossless(jpegtran, source_path, output_path, box, progressive):
+    # Crop in the DCT domain: coefficients are copied, nothing is re-encoded
+    left, top, right, bottom = box
+    command = [
+        jpegtran,
+        "-crop",
+        f"{right - left}x{bottom - top}+{left}+{top}",
+        "-copy",
+        "all",
+        "-optimize",
+    ]
+    if progressive:
+        command.append("-progressive")
+    command += ["-outfile", output_path, source_path]
+
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Lossless JPEG crop failed: {e}")
+        return False
+
+    # jpegtran moves a misaligned corner instead of failing, so check the size
+    with Image.open(output_path) as cropped:
+        if cropped.size != (right - left, bottom - top):
+            print(f"Lossless JPEG crop produced {cropped.size}, re-encoding instead")
+            return False
+    return True
+
+
+def crop_reencode(source, source_path, output_path, box):
+    # Re-encode with the source's quantization tables and chroma subsampling,
+    # keeping EXIF and ICC metadata
+    cropped = read_region(source_path, box)
+    options = {
+        "qtables": source.quantization,
+        "subsampling": JpegImagePlugin.get_sampling(source),
+        "progressive": source.info.get("progressive", False),
+        "optimize": True,
+    }
+    if options["subsampling"] == -1:
+        del options["subsampling"]
+    for key in ["exif", "icc_profile", "dpi", "comment"]:
+        if key in source.info:
+            options[key] = source.info[key]
+    cropped.save(output_path, "JPEG", **options)
+
+
+def crop_jpeg(source_path, output_path, box):
+    # Lossless when the crop sits on the MCU grid and jpegtran is available,
+    # otherwise a re-encode that keeps the source's quality settings.
+    # Returns the method used.
+    with open_image(source_path) as source:
+        mcu_size = get_image_mcu_size(source)
+        progressive = bool(source.info.get("progressive"))
+
+        # A .jpg that isn't really a JPEG has no tables to keep
+        if not mcu_size:
+            read_region(source_path, box).save(output_path)
+            return "reencoded"
+
+        if config.JPEG_LOSSLESS_CROP:
+            jpegtran = find_jpegtran()
+            if not jpegtran:
+                print("jpegtran not found, re-encoding JPEG with the original tables")
+            elif not is_mcu_aligned(mcu_size, box):
+                print(
+                    f"Crop offset ({box[0]}, {box[1]}) is not on the "
+                    f"{mcu_size[0]}x{mcu_size[1]} MCU grid, re-encoding JPEG"
+                )
+            elif crop_lossless(jpegtran, source_path, output_path, box, progressive):
+                return "lossless"
+
+        crop_reencode(source, source_path, output_path, box)
+        return "reencoded"
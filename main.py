@@ -1,16 +1,19 @@
 import argparse
-import gc
+import json
 import os
-import shutil
 import sys
-import time
+import traceback
 
 from config_loader import config, runtime_config
-from gui import run_gui
-from utils import download_media, format_path, is_url, get_media_type, MediaType
 
 
-def main():
+def build_parser():
+    # parse_size lives with the heavy media imports, so load it only when used
+    def size_argument(value):
+        from utils import parse_size
+
+        return parse_size(value)
+
     parser = argparse.ArgumentParser(
         description="Osaka - Media Download and Editing Tool",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -27,6 +30,22 @@ Examples:
   
   # Keep GUI open after cropping and keep temporary files
   osaka --keep-gui --keep-temp "input" "output"
+
+  # Encode with a named profile from config.py
+  osaka --encoding archive "input.mp4" "output"
+
+  # Fit the cropped video under an upload cap
+  osaka --target-size 25MB "input.mp4" "output"
+
+  # Keep a warm daemon running; later osaka commands are sent to it
+  osaka --daemon
+
+  # Crop without the GUI, queue jobs and run the queue (resuming after a crash)
+  osaka --crop 0,140,1080,1080 "input.mp4" "output"
+  osaka --crop auto "letterboxed.mp4" "output"
+  osaka --crop 9:16@auto "landscape.mp4" "vertical"
+  osaka --queue --crop 0,0,720,1280 "https://example.com/video" "clip1"
+  osaka --resume
         """,
     )
 
@@ -54,103 +73,623 @@ Examples:
         help="Keep temporary files (don't cleanup at end)",
     )
 
+    # Encoding profile for videos
+    parser.add_argument(
+        "--encoding",
+        "-e",
+        choices=sorted(config.ENCODING_PROFILES),
+        default=None,
+        help="Encoding profile for videos (default depends on the output container)",
+    )
+
+    # Target file size for videos
+    parser.add_argument(
+        "--target-size",
+        "-s",
+        type=size_argument,
+        default=None,
+        metavar="SIZE",
+        help="Two-pass encode videos to fit under SIZE (e.g. 8MB, 25MB, 1.5GiB)",
+    )
+
+    # Run as a persistent daemon that accepts jobs from later invocations
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Start a warm daemon that runs jobs submitted by the osaka command",
+    )
+
+    # Run in this process even if a daemon is available
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run the job in this process instead of the daemon",
+    )
+
+    # Headless crop rectangle
+    parser.add_argument(
+        "--crop",
+        "-c",
+        default=None,
+        metavar="X,Y,W,H|auto|W:H@auto",
+        help=(
+            "Crop to this rectangle without opening the GUI; auto removes black "
+            "bars, W:H@auto fits that aspect ratio around the subject"
+        ),
+    )
+
+    # Record the job for later instead of running it now
+    parser.add_argument(
+        "--queue",
+        "-q",
+        action="store_true",
+        help="Add the job to the queue; run queued jobs with --resume",
+    )
+
+    # Work through queued and interrupted jobs
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Run queued jobs and resume interrupted ones (no input/output needed)",
+    )
+
+    # Skip the result cache
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse or store cached results for identical jobs",
+    )
+
+    # Profile the job; reports land in the (kept) job directory
+    parser.add_argument(
+        "--profile",
+        choices=["cpu", "mem"],
+        default=None,
+        help="Profile CPU time (cProfile) or allocations (tracemalloc) and keep the job directory",
+    )
+
+    # Machine-readable timing report
+    parser.add_argument(
+        "--report",
+        choices=["json"],
+        default=None,
+        help="Write stage timings, byte counts and peak memory to <output>.report.json",
+    )
+
     # Positional arguments
     parser.add_argument("input", help="Media URL or local file path (auto-detected)")
     parser.add_argument("output", help="Output file name")
 
-    args = parser.parse_args()
+    return parser
+
+
+# Options that say how to run an invocation rather than what the job is
+RUN_OPTIONS = ("daemon", "no_daemon", "queue", "resume")
+
+
+def job_argv(parser, args):
+    # The command line that reproduces a parsed job, rebuilt from the parsed
+    # values rather than from what was typed (clustered short options,
+    # abbreviations), with the long name and value in one argument each
+    argv = []
+    for action in parser._actions:
+        if not action.option_strings or action.dest in RUN_OPTIONS:
+            continue
+        value = getattr(args, action.dest, action.default)
+        if value == action.default:
+            continue
+        option = action.option_strings[0]
+        argv.append(option if action.nargs == 0 else f"{option}={value}")
+    return argv + ["--", args.input, args.output]
+
+
+def main():
+    argv = sys.argv[1:]
+
+    if "--daemon" in argv:
+        from daemon import serve
+
+        serve()
+        return
+
+    if "--resume" in argv:
+        resume_jobs()
+        return
+
+    # Hand the job to a running daemon; fall back to running it here
+    if "--no-daemon" not in argv:
+        from daemon import submit_job
+
+        exit_code = submit_job(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    run_job(argv)
+
+
+def resume_jobs():
+    from jobs import JobStore
+
+    with JobStore() as store:
+        pending = store.pending_jobs()
+
+    if not pending:
+        print("No queued or interrupted jobs")
+        return
+
+    print(f"Resuming {len(pending)} job(s)")
+    for job in pending:
+        print(f"Job {job['id']}: {job['output']} (last stage: {job['stage'] or 'none'})")
+        try:
+            run_job(json.loads(job["argv"]), job_id=job["id"])
+        except SystemExit:
+            # A failed job is recorded as such; carry on with the rest
+            pass
+        except Exception:
+            # So is a crashed one
+            traceback.print_exc()
+
+
+def run_job(argv, cwd=None, job_id=None):
+    # A job that crashes is recorded as failed, so --resume doesn't pick it
+    # up again ahead of the queued jobs behind it
+    handles = {}
+    try:
+        run_job_stages(argv, cwd, job_id, handles)
+    except Exception as e:
+        if handles.get("job_id") is not None:
+            mark_job_crashed(handles["job_id"], e)
+        raise
+    except KeyboardInterrupt:
+        # Keep the scratch directory so --resume can pick the job up again
+        handles["keep"] = True
+        raise
+    finally:
+        # Whatever the stages left running: the profiler, the scratch
+        # directory's heartbeat and lock, and the job store. Each is a no-op
+        # when the job already released it.
+        if "job" in handles:
+            from profiler import profiler
+
+            profiler.stop()
+            handles["job"].release(keep=handles["keep"])
+        if "store" in handles:
+            handles["store"].close()
+
+
+def mark_job_crashed(job_id, error):
+    from jobs import JobStore
+
+    # The job's own store may already be closed; a finished job stays finished
+    with JobStore() as store:
+        record = store.get_job(job_id)
+        if record and record["status"] == "running":
+            store.fail_job(job_id, f"{type(error).__name__}: {error}")
+
+
+def run_job_stages(argv, cwd, job_id, handles):
+    # Media libraries are imported here so the thin client path stays fast
+    from auto_crop import detect_black_bars, detect_subject_crop
+    from cache import ResultCache, get_result_params, hash_file, make_cache_key
+    from gui import run_gui
+    from jobs import JobStore
+    from probe import get_media_info
+    from profiler import profiler
+    from report import report
+    from scratch import ScratchJob, choose_scratch_root, sweep_stale_jobs
+    from streaming import (
+        BackgroundDownload,
+        crop_stream,
+        get_url_validator,
+        open_stream,
+        save_stream,
+    )
+    from utils import (
+        crop_image,
+        crop_video,
+        download_media,
+        finalize_output,
+        format_path,
+        is_url,
+        parse_aspect_ratio,
+        parse_crop,
+        MediaType,
+    )
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # Local paths are relative to the caller's directory, not the daemon's
+    # Store the absolute path so a resumed job finds the file from anywhere
+    if not is_url(args.input):
+        args.input = os.path.abspath(os.path.join(cwd or os.getcwd(), args.input))
+    argv = job_argv(parser, args)
+
+    # Automatic crops are worked out from the media once it is probed:
+    # "bars" for --crop auto, the aspect ratio for --crop W:H@auto
+    crop = None
+    auto_crop = None
+    try:
+        if args.crop == "auto":
+            auto_crop = "bars"
+        elif args.crop and args.crop.endswith("@auto"):
+            auto_crop = parse_aspect_ratio(args.crop[: -len("@auto")])
+        elif args.crop:
+            crop = parse_crop(args.crop)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Set runtime configuration based on command line flags
     runtime_config.set_keep_temp(args.keep_temp)
+    report.reset(
+        enabled=args.report is not None,
+        input=args.input,
+        output=args.output,
+        argv=argv,
+    )
 
-    # Create temp directory if it doesn't exist
-    os.makedirs(config.TEMP_DIR, exist_ok=True)
-    os.makedirs(f"{config.TEMP_DIR}/{args.output}", exist_ok=True)
+    store = JobStore()
+    handles["store"] = store
 
-    # Handle input - auto-detect URL vs file path
-    if is_url(args.input):
-        # Download from URL
-        print(f"Downloading media from: {args.input}")
-        media_path = download_media(args.input, f"{config.TEMP_DIR}/{args.output}")
-        if not media_path:
-            print("Error: Failed to download media")
-            sys.exit(1)
+    # Record the job and stop; "osaka --resume" will run it later
+    if args.queue:
+        job_id = store.add_job(argv, args.output, status="queued")
+        store.close()
+        print(f"Queued job {job_id}: {args.output}")
+        return
+
+    if job_id is None:
+        job_id = store.add_job(argv, args.output)
+        record = None
     else:
-        # Local media file
-        media_path = args.input
-        if not os.path.exists(media_path):
-            print(f"Error: File {format_path(media_path)} not found")
-            sys.exit(1)
-        print(f"Using local file: {format_path(media_path)}")
-    
-    path_root, ext = os.path.splitext(media_path)
-    
-    # Handle unsupported media types
-    media_type = get_media_type(ext)
-    if media_type == MediaType.UNKNOWN:
-        print(f"Error: Unsupported media type: {ext}")
-        sys.exit(1)
-    if media_type == MediaType.AUDIO:
-        print("No support for Audio files yet :)")
+        record = store.get_job(job_id)
+        store.update_job(job_id, status="running")
+    handles["job_id"] = job_id
+
+    # Clear out directories left behind by crashed or killed runs, except
+    # those that queued or interrupted jobs can still resume from
+    sweep_stale_jobs(keep=store.resumable_scratch_dirs())
+
+    # Reuse the scratch directory of an interrupted job if it survived
+    if record and record["scratch_dir"] and os.path.isdir(record["scratch_dir"]):
+        job = ScratchJob(None, args.output, path=record["scratch_dir"])
+    else:
+        # Small local files get RAM-backed scratch space, downloads go to disk
+        expected_size = None
+        if not is_url(args.input) and os.path.exists(args.input):
+            expected_size = os.path.getsize(args.input)
+        job = ScratchJob(choose_scratch_root(expected_size), args.output)
+        record = None
+    handles["job"] = job
+    handles["keep"] = args.keep_temp or args.profile is not None
+    store.update_job(job_id, scratch_dir=job.path)
+    print(f"Working directory: {format_path(job.path)}")
+
+    if args.profile:
+        profiler.start(args.profile, job.path)
+
+    def stop_profiler():
+        for path in profiler.stop():
+            print(f"Profile written to: {format_path(path)}")
+
+    def fail(message):
+        print(f"Error: {message}")
+        store.fail_job(job_id, message)
+        store.close()
+        stop_profiler()
+        job.release(keep=args.keep_temp or args.profile is not None)
         sys.exit(1)
-    print(f"Detected media type: {media_type.value}")
-
-    # Handle edit vs no-edit
-    if not args.no_edit:
-        # Launch GUI for editing
-        print("Launching GUI for editing...")
-        exit_code, gui = run_gui(
-            media_path=media_path,
-            media_type=media_type,
-            output_path=f"{config.TEMP_DIR}/{args.output}",
-            keep_open=args.keep_gui,
+
+    # Identical headless jobs are answered from the result cache
+    use_cache = not args.no_cache and config.CACHE_MAX_BYTES > 0
+    cache = ResultCache() if use_cache else None
+    headless = args.no_edit or crop is not None or auto_crop is not None
+    cached_result = None
+
+    # A URL seen before with the same settings needs no download at all, as
+    # long as the server reports the same content behind it
+    url_key = None
+    url_validator = None
+    if cache and headless and is_url(args.input):
+        url_validator = get_url_validator(args.input)
+    if url_validator:
+        url_key = make_cache_key(
+            f"url:{args.input}:{url_validator}",
+            {
+                "no_edit": args.no_edit,
+                "crop": args.crop if auto_crop is not None else crop,
+                "encoding": args.encoding,
+                "target_size": args.target_size,
+            },
         )
+        cached_result = cache.lookup(url_key)
+
+    # Headless crops of URLs run while the file downloads when its container
+    # can be decoded as it arrives; nothing but the result is written to disk
+    stream = None
+    streamed_result = None
+    if (
+        crop
+        and is_url(args.input)
+        and not cached_result
+        and not args.target_size
+        and config.STREAM_DOWNLOADS
+        and not store.stage_done(record, "download")
+    ):
+        stream = open_stream(args.input)
+        if stream and stream.progressive:
+            print(f"Streaming media from: {args.input}")
+            streamed_result = crop_stream(
+                stream, job.path, *crop, encoding_profile=args.encoding
+            )
+            if not streamed_result:
+                fail("Cropping failed")
+
+    # With the GUI, URLs download while the window opens: the crop is set up on
+    # the first frame and starts as soon as the download is complete
+    download = None
+    gui = None
+    if (
+        not headless
+        and is_url(args.input)
+        and config.GUI_DURING_DOWNLOAD
+        and not store.stage_done(record, "download")
+    ):
+        print(f"Downloading media from: {args.input}")
+        download = BackgroundDownload(args.input, job.path)
+        download.start()
+        print("Launching GUI while downloading...")
+        with report.span("gui"):
+            exit_code, gui = run_gui(
+                media_path=None,
+                media_type=None,
+                output_path=job.path,
+                keep_open=args.keep_gui,
+                encoding_profile=args.encoding,
+                target_size=args.target_size,
+                download=download,
+            )
+        if not gui.get_crop_thread():
+            # Nothing to crop, the rest of the download isn't needed
+            download.cancel()
+
+    if streamed_result:
+        # Downloaded and cropped in one pass, there is no raw file to probe
+        media_type = MediaType.VIDEO
+        ext = stream.ext
+        result = streamed_result
+        crop_params = crop
+        crop_path = None
+        source_key = None
+        store.complete_stage(job_id, "download", media_path=args.input)
+    else:
+        # Download stage - skipped when an earlier run already fetched the file
+        if cached_result:
+            media_path = cached_result
+            print(f"Using cached result for: {args.input}")
+        elif store.stage_done(record, "download") and os.path.exists(record["media_path"]):
+            media_path = record["media_path"]
+            print(f"Reusing downloaded file: {format_path(media_path)}")
+        elif download:
+            # Downloaded in the background while the GUI was open
+            with report.span("download_wait"):
+                media_path = download.wait()
+            if not media_path:
+                if download.cancelled.is_set():
+                    fail("GUI closed before the download finished")
+                fail("Failed to download media")
+        elif stream:
+            # Opened for streaming, but the container needs seeking
+            print(f"Downloading media from: {args.input}")
+            media_path = save_stream(stream, job.path)
+            if not media_path:
+                fail("Failed to download media")
+        elif is_url(args.input):
+            # Download from URL
+            print(f"Downloading media from: {args.input}")
+            media_path = download_media(args.input, job.path)
+            if not media_path:
+                fail("Failed to download media")
+        else:
+            # Local media file
+            media_path = args.input
+            if not os.path.exists(media_path):
+                fail(f"File {format_path(media_path)} not found")
+            print(f"Using local file: {format_path(media_path)}")
+        store.complete_stage(job_id, "download", media_path=media_path)
+    
+        # Recognize the media by its content; every later stage reuses the result
+        with report.span("probe", bytes=os.path.getsize(media_path)):
+            media_info = get_media_info(media_path)
+        media_type = MediaType(media_info["media_type"])
+        ext = media_info["ext"]
+        _, original_ext = os.path.splitext(media_path)
+        if ext != original_ext.lower():
+            print(f"File content is {ext.lstrip('.')}, not {original_ext or 'unlabelled'}")
 
-        # Wait for crop thread to complete if it exists
-        crop_thread = gui.get_crop_thread()
-        if crop_thread:
-            print("Waiting for crop process to complete...")
-            crop_thread.join()  # Wait for the thread to finish
-            print("Crop process completed!")
+        # Handle unsupported media types
+        if media_type == MediaType.UNKNOWN:
+            fail(f"Unsupported media type: {ext}")
+        if media_type == MediaType.AUDIO:
+            fail("No support for Audio files yet :)")
+        print(f"Detected media type: {media_type.value}")
+        store.complete_stage(job_id, "probe", media_type=media_type.value)
 
-        # Cleanup GUI resources before deleting temporary files
-        gui.cleanup_resources()
+        if auto_crop is not None and not args.no_edit and not cached_result:
+            with report.span("auto_crop"):
+                if auto_crop == "bars":
+                    crop = detect_black_bars(media_path, media_type, media_info)
+                else:
+                    crop = detect_subject_crop(
+                        media_path, media_type, media_info, auto_crop
+                    )
 
-        result = f"{config.TEMP_DIR}/{args.output}/cropped{ext}"
+        # An automatic crop that keeps the whole frame leaves the media as it
+        # is; only a size target still needs the encode
+        uncropped = (
+            auto_crop is not None
+            and crop == (0, 0, media_info["width"], media_info["height"])
+            and not args.target_size
+        )
+        if uncropped:
+            print("No crop needed, keeping the media as it is")
+
+        # Copying a local file as-is gains nothing from the cache
+        if cache and (args.no_edit or uncropped) and not is_url(args.input):
+            cache = None
 
-        if exit_code == 0:
-            print("GUI closed successfully")
+        source_key = None
+        if cache and not cached_result:
+            with report.span("cache.hash"):
+                source_key = hash_file(media_path)
+            if headless:
+                cached_result = cache.lookup(
+                    make_cache_key(
+                        source_key,
+                        get_result_params(
+                            ext,
+                            media_type,
+                            crop,
+                            args.no_edit,
+                            args.encoding,
+                            args.target_size,
+                        ),
+                    )
+                )
+                if cached_result:
+                    print(f"Using cached result: {format_path(cached_result)}")
+
+        # Handle edit vs no-edit
+        crop_params = crop
+        crop_path = None
+        if cached_result:
+            result = cached_result
+        elif args.no_edit or uncropped:
+            # Move the downloaded file into place as-is
+            result = media_path
+        elif store.stage_done(record, "crop") and os.path.exists(record["result_path"]):
+            result = record["result_path"]
+            print(f"Reusing cropped file: {format_path(result)}")
+        elif crop:
+            # Headless crop with a known rectangle
+            if media_type == MediaType.IMAGE:
+                result = crop_image(media_path, job.path, *crop, media_info=media_info)
+            else:
+                result = crop_video(
+                    media_path,
+                    job.path,
+                    *crop,
+                    encoding_profile=args.encoding,
+                    target_size=args.target_size,
+                    media_info=media_info,
+                )
+            if not result:
+                fail("Cropping failed")
         else:
-            print(f"GUI closed with error code: {exit_code}")
+            if gui is None:
+                # Launch GUI for editing
+                print("Launching GUI for editing...")
+                with report.span("gui"):
+                    exit_code, gui = run_gui(
+                        media_path=media_path,
+                        media_type=media_type,
+                        media_info=media_info,
+                        output_path=job.path,
+                        keep_open=args.keep_gui,
+                        encoding_profile=args.encoding,
+                        target_size=args.target_size,
+                    )
 
-    try:
-        print(
-            f"Copying {media_type.value.lower()} to: {format_path(f'{config.OUTPUT_DIR}/{args.output}{ext}')}"
+            # Wait for crop thread to complete if it exists
+            crop_thread = gui.get_crop_thread()
+            if crop_thread:
+                print("Waiting for crop process to complete...")
+                with report.span("crop_wait"):
+                    crop_thread.join()  # Wait for the thread to finish
+                print("Crop process completed!")
+
+            # Release every handle on the media before deleting temporary files
+            gui.cleanup_resources()
+
+            # A failed crop may leave a partial file behind; never save or
+            # cache it
+            if crop_thread and not gui.get_crop_result():
+                fail("Cropping failed")
+            result = gui.get_crop_result() or f"{job.path}/cropped{ext}"
+            crop_params = gui.get_crop_params()
+            crop_path = gui.get_crop_path()
+
+            if exit_code == 0:
+                print("GUI closed successfully")
+            else:
+                print(f"GUI closed with error code: {exit_code}")
+
+    if os.path.exists(result):
+        store.complete_stage(job_id, "crop", result_path=result)
+
+    # Remember the new result under its content key and, for URLs, the URL key
+    if cache and not cached_result and os.path.exists(result) and (
+        args.no_edit or crop_params
+    ):
+        result_params = get_result_params(
+            ext,
+            media_type,
+            crop_params,
+            args.no_edit,
+            args.encoding,
+            args.target_size,
+            crop_path=crop_path,
         )
-        shutil.copy2(result, f"{config.OUTPUT_DIR}/{args.output}{ext}")
+        if source_key:
+            cache_path = cache.store(make_cache_key(source_key, result_params), result)
+            if url_key and cache_path:
+                cache.alias(url_key, cache_path)
+        elif url_key:
+            # A streamed download was never on disk to hash; only its URL finds it
+            cache.store(url_key, result)
+
+    final_path = f"{config.OUTPUT_DIR}/{args.output}{ext}"
+    try:
+        print(f"Saving {media_type.value.lower()} to: {format_path(final_path)}")
+        # Never move or hardlink the user's own input file or a cache entry
+        is_shared = result == args.input or result == cached_result
+        with report.span("finalize", bytes=os.path.getsize(result)) as span:
+            method = finalize_output(
+                result,
+                final_path,
+                keep_source=args.keep_temp or is_shared,
+                allow_hardlink=not is_shared,
+            )
+            span["method"] = method
         print(
-            f"{media_type.value.capitalize()} saved as: {format_path(f'{config.OUTPUT_DIR}/{args.output}{ext}')}"
+            f"{media_type.value.capitalize()} saved as: {format_path(final_path)} ({method})"
         )
+        store.finish_job(job_id)
     except FileNotFoundError:
-        print(f"No {media_type.value.lower()} found at {format_path(result)}, nothing to copy.")
+        print(f"No {media_type.value.lower()} found at {format_path(result)}, nothing to save.")
+        store.fail_job(job_id, "No output to save")
+    store.close()
+    stop_profiler()
 
-    # Cleanup temporary files unless --keep-temp flag is used
-    if not args.keep_temp:
+    # Cleanup temporary files unless --keep-temp or --profile is used
+    if not args.keep_temp and not args.profile:
         print("Cleaning up temporary files...")
         try:
-            # Force garbage collection to ensure all file handles are released
-            gc.collect()
-            time.sleep(0.1)  # Small delay to ensure resources are released
-
-            # Remove the entire temporary directory for this output
-            temp_dir_path = f"{config.TEMP_DIR}/{args.output}"
-            if os.path.exists(temp_dir_path):
-                shutil.rmtree(temp_dir_path)
-                print(f"Removed temporary directory: {format_path(temp_dir_path)}")
+            with report.span("cleanup", background=config.BACKGROUND_CLEANUP):
+                job.release(background=config.BACKGROUND_CLEANUP)
+            print(f"Removed temporary directory: {format_path(job.path)}")
         except Exception as e:
             print(f"Warning: Could not cleanup some temporary files: {e}")
     else:
-        print("Temporary files kept as requested")
+        job.release(keep=True)
+        print(f"Temporary files kept in {format_path(job.path)}")
+
+    if args.report == "json":
+        report.fields["cache_hit"] = cached_result is not None
+        report.fields["media_type"] = media_type.value
+        report_path = f"{config.OUTPUT_DIR}/{args.output}.report.json"
+        report.write_json(report_path)
+        print(f"Report written to: {format_path(report_path)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import cv2
+from moviepy import VideoFileClip
+
+from frame_index import load_frame_index
+from image_roi import open_image
+
+
+class MediaSource:
+    # Owns every handle opened on a media file (PIL image, cv2 capture,
+    # moviepy clip) so they are all released together by close()
+
+    def __init__(self, path):
+        self.path = path
+        self._frame_index = None
+        self._image = None
+        self._capture = None
+        self._clip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def image(self):
+        if self._image is None:
+            # Header only; pixels are decoded on demand, region by region
+            self._image = open_image(self.path)
+        return self._image
+
+    def frame_index(self):
+        # Timestamps and keyframes of every frame, from the cached index
+        if self._frame_index is None:
+            self._frame_index = load_frame_index(self.path)
+        return self._frame_index
+
+    def capture(self):
+        if self._capture is None:
+            self._capture = cv2.VideoCapture(self.path)
+        return self._capture
+
+    def clip(self):
+        if self._clip is None:
+            self._clip = VideoFileClip(self.path)
+        return self._clip
+
+    def release_capture(self):
+        # Free the decoder once sampling is done, the clip may still be needed
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def close(self):
+        errors = []
+
+        for name, closer in [
+            ("image", lambda: self._image.close()),
+            ("capture", self.release_capture),
+            ("clip", lambda: self._clip.close()),
+        ]:
+            if getattr(self, f"_{name}") is None:
+                continue
+            try:
+                closer()
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+            finally:
+                setattr(self, f"_{name}", None)
+
+        if errors:
+            print(f"Warning: could not close {self.path}: {'; '.join(errors)}")
@@ -0,0 +1,210 @@
+import json
+import os
+
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from animation import ANIMATED_FORMATS
+from frame_index import load_frame_index
+from image_roi import open_image
+from jpeg_crop import get_image_mcu_size
+from sidecar import get_sidecar_path, save_sidecar, touch_sidecar
+from utils import get_media_type, MediaType
+
+# Bump when probe results gain or change fields
+PROBE_VERSION = 2
+
+# Bytes read from the start of a file to recognize its format
+SNIFF_BYTES = 512
+
+# Fixed signatures at the start of the file
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+    (b"8BPS", ".psd"),
+    (b"\x00\x00\x01\x00", ".ico"),
+    (b"FLV", ".flv"),
+    (b"\x00\x00\x01\xba", ".mpg"),
+    (b"fLaC", ".flac"),
+    (b"ID3", ".mp3"),
+    (b"BM", ".bmp"),
+]
+
+# RIFF form types
+RIFF_TYPES = {b"WEBP": ".webp", b"AVI ": ".avi", b"WAVE": ".wav"}
+
+# ISO base media brands that aren't plain MP4
+FTYP_BRANDS = {
+    b"qt  ": ".mov",
+    b"M4A ": ".m4a",
+    b"M4B ": ".m4a",
+    b"3gp4": ".3gp",
+    b"3gp5": ".3gp",
+    b"3g2a": ".3gp",
+    b"heic": ".heic",
+    b"heix": ".heic",
+    b"mif1": ".heic",
+    b"avif": ".avif",
+}
+
+# QuickTime files from before ftyp start straight with one of these atoms
+QUICKTIME_ATOMS = {b"moov", b"mdat", b"wide", b"free", b"skip"}
+
+# Extensions naming the same format; a file keeps its own extension when the
+# sniffed one is in the same group
+EQUIVALENT_EXTENSIONS = [
+    {".jpg", ".jpeg", ".jpe", ".jfif"},
+    {".tif", ".tiff"},
+    {".png", ".apng"},
+    {".mp4", ".m4v", ".mov", ".3gp"},
+    {".mpg", ".mpeg"},
+    {".ogg", ".ogv", ".opus"},
+    {".ts", ".mts", ".m2ts"},
+]
+
+# EXIF orientation values and the clockwise rotation they stand for
+EXIF_ORIENTATION = 0x0112
+EXIF_ROTATION = {3: 180, 4: 180, 5: 90, 6: 90, 7: 270, 8: 270}
+
+
+def sniff_extension(head):
+    # Extension matching the file's content, or None when unrecognized
+    for magic, ext in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return ext
+
+    if head[:4] == b"RIFF":
+        return RIFF_TYPES.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(head[8:12], ".mp4")
+    if head[4:8] in QUICKTIME_ATOMS:
+        return ".mov"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        # EBML header; the doctype tells WebM from Matroska
+        return ".webm" if b"webm" in head[:64] else ".mkv"
+    if head[:4] == b"OggS":
+        return ".ogv" if b"theora" in head else ".ogg"
+    # MPEG transport stream packets are 188 bytes, each starting with 0x47
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:
+        return ".ts"
+    return None
+
+
+def choose_extension(path, sniffed):
+    _, original = os.path.splitext(path)
+    original = original.lower()
+    if not sniffed or original == sniffed:
+        return original
+    for group in EQUIVALENT_EXTENSIONS:
+        if original in group and sniffed in group:
+            return original
+    return sniffed
+
+
+def probe_video(path, info):
+    try:
+        infos = ffmpeg_parse_infos(path)
+    except OSError as e:
+        # Corrupt, or not really video or audio despite its name
+        print(f"Warning: could not read video: {e}")
+        info["media_type"] = MediaType.UNKNOWN.value
+        return info
+    if not infos.get("video_found"):
+        if infos.get("audio_found"):
+            info["media_type"] = MediaType.AUDIO.value
+            info["duration"] = infos.get("duration")
+        return info
+
+    # Frames are decoded upright, so width and height are the displayed ones
+    width, height = infos["video_size"]
+    rotation = abs(infos.get("video_rotation", 0))
+    if rotation in (90, 270):
+        width, height = height, width
+
+    # Counted from the frame index, exact even for variable frame rates
+    index = load_frame_index(path)
+
+    info.update(
+        {
+            "media_type": MediaType.VIDEO.value,
+            "width": width,
+            "height": height,
+            "duration": infos.get("video_duration") or infos.get("duration"),
+            "fps": infos.get("video_fps"),
+            "n_frames": len(index) or infos.get("video_n_frames"),
+            "rotation": rotation,
+            "video_codec": infos.get("video_codec_name"),
+            "has_audio": bool(infos.get("audio_found")),
+            "keyframes": index.keyframe_times().tolist(),
+        }
+    )
+    return info
+
+
+def probe_image(path, info):
+    try:
+        img = open_image(path)
+    except OSError as e:
+        print(f"Warning: could not open image: {e}")
+        info["media_type"] = MediaType.UNKNOWN.value
+        return info
+
+    with img:
+        n_frames = getattr(img, "n_frames", 1)
+        orientation = img.getexif().get(EXIF_ORIENTATION)
+        mcu_size = get_image_mcu_size(img)
+        info.update(
+            {
+                # Pillow's name, which the JPEG and animation code check
+                "format": img.format,
+                "width": img.width,
+                "height": img.height,
+                "mode": img.mode,
+                "n_frames": n_frames,
+                "animated": img.format in ANIMATED_FORMATS and n_frames > 1,
+                "rotation": EXIF_ROTATION.get(orientation, 0),
+                "mcu_size": list(mcu_size) if mcu_size else None,
+            }
+        )
+    return info
+
+
+def probe_media(path):
+    # Recognize the file by its content, then read what later stages need
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    sniffed = sniff_extension(head)
+    ext = choose_extension(path, sniffed)
+
+    info = {
+        "version": PROBE_VERSION,
+        "ext": ext,
+        "sniffed": sniffed is not None,
+        "media_type": get_media_type(ext).value,
+        "format": sniffed.lstrip(".") if sniffed else None,
+    }
+    if info["media_type"] == MediaType.IMAGE.value:
+        return probe_image(path, info)
+    if info["media_type"] in (MediaType.VIDEO.value, MediaType.AUDIO.value):
+        return probe_video(path, info)
+    return info
+
+
+def get_media_info(path):
+    # Probe results are reused from the sidecar until the file changes
+    sidecar_path = get_sidecar_path(path, ".json")
+    try:
+        with open(sidecar_path) as f:
+            info = json.load(f)
+        if info.get("version") == PROBE_VERSION:
+            touch_sidecar(sidecar_path)
+            return info
+    except (OSError, ValueError):
+        pass
+
+    info = probe_media(path)
+    save_sidecar(sidecar_path, json.dumps(info).encode())
+    return info
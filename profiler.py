@@ -0,0 +1,129 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+
+from report import get_peak_rss
+
+# Stack depth kept per allocation and how many entries each report lists
+MEMORY_TRACE_FRAMES = 10
+TOP_ENTRIES = 40
+
+
+class Profiler:
+    # CPU (cProfile) or memory (tracemalloc) profiling for one job; does
+    # nothing unless started with --profile
+
+    def __init__(self):
+        self.mode = None
+        self.directory = None
+        self.main_profile = None
+        self.thread_profiles = []
+        self._lock = threading.Lock()
+
+    def start(self, mode, directory):
+        self.mode = mode
+        self.directory = directory
+        self.thread_profiles = []
+        if mode == "cpu":
+            self.main_profile = cProfile.Profile()
+            self.main_profile.enable()
+        elif mode == "mem":
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+    def wrap(self, function):
+        # Before 3.12 cProfile only sees the thread that enabled it, so worker
+        # threads get their own profile, merged into the report at the end.
+        # From 3.12 on the main profile already covers every thread.
+        if self.mode != "cpu" or sys.version_info >= (3, 12):
+            return function
+
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            with self._lock:
+                self.thread_profiles.append(profile)
+            profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+
+        return run
+
+    def stop(self):
+        # Write the reports into the job directory and return their paths
+        if self.mode == "cpu":
+            paths = self.write_cpu_report()
+        elif self.mode == "mem":
+            paths = self.write_memory_report()
+        else:
+            return []
+        self.mode = None
+        return paths
+
+    def write_cpu_report(self):
+        self.main_profile.disable()
+        stats = pstats.Stats(self.main_profile)
+        with self._lock:
+            for profile in self.thread_profiles:
+                stats.add(profile)
+
+        stats_path = os.path.join(self.directory, "profile.pstats")
+        stats.dump_stats(stats_path)
+
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+        stats.sort_stats("tottime").print_stats(TOP_ENTRIES)
+        text_path = os.path.join(self.directory, "profile.txt")
+        with open(text_path, "w") as f:
+            f.write(text.getvalue())
+
+        self.main_profile = None
+        return [stats_path, text_path]
+
+    def write_memory_report(self):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Tracebacks of the profiler itself would only add noise
+        snapshot = snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        snapshot_path = os.path.join(self.directory, "memory.snapshot")
+        snapshot.dump(snapshot_path)
+
+        # Pillow and ffmpeg buffers live outside the Python allocator and only
+        # show up in the process peak
+        peak_rss = get_peak_rss()
+        lines = [
+            f"Current traced memory: {current / 1024 / 1024:.1f} MiB",
+            f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB",
+            f"Peak process RSS: {peak_rss / 1024 / 1024:.1f} MiB"
+            if peak_rss
+            else "Peak process RSS: unknown",
+            "",
+            f"Top {TOP_ENTRIES} allocations by line:",
+        ]
+        for stat in snapshot.statistics("lineno")[:TOP_ENTRIES]:
+            lines.append(str(stat))
+
+        lines += ["", "Top 10 allocation tracebacks:"]
+        for stat in snapshot.statistics("traceback")[:10]:
+            lines.append("")
+            lines.append(f"{stat.count} blocks, {stat.size / 1024:.1f} KiB")
+            lines.extend(stat.traceback.format())
+
+        text_path = os.path.join(self.directory, "memory.txt")
+        with open(text_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+        return [snapshot_path, text_path]
+
+
+# Profiler for the job currently running in this process
+profiler = Profiler()
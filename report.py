@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def get_peak_rss():
+    # Peak resident set size of this process in bytes, None if unknown
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(
+            process, ctypes.byref(counters), counters.cb
+        ):
+            return counters.PeakWorkingSetSize
+
+    return None
+
+
+class Report:
+    # Timing spans and counters for one job; recording is a no-op unless the
+    # report was enabled with --report
+
+    def __init__(self):
+        self.reset(enabled=False)
+
+    def reset(self, enabled, **fields):
+        self.enabled = enabled
+        self.fields = dict(fields)
+        self.spans = []
+        self.pending = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **fields):
+        # Yields a dict the caller can fill in with byte counts, fps, etc.
+        info = dict(fields)
+        if not self.enabled:
+            yield info
+            return
+
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.add_span(name, start, time.perf_counter(), **info)
+
+    def begin(self, name):
+        # For spans that start and end in different places (e.g. GUI launch
+        # to first paint); end() records it once
+        if self.enabled:
+            with self._lock:
+                self.pending[name] = time.perf_counter()
+
+    def end(self, name, **fields):
+        if not self.enabled:
+            return
+        with self._lock:
+            start = self.pending.pop(name, None)
+        if start is not None:
+            self.add_span(name, start, time.perf_counter(), **fields)
+
+    def add_span(self, name, start, end, **fields):
+        if not self.enabled:
+            return
+        if "frames" in fields and end > start:
+            fields["fps"] = round(fields["frames"] / (end - start), 2)
+        with self._lock:
+            self.spans.append(
+                {
+                    "name": name,
+                    "start": round(start - self.started, 6),
+                    "duration": round(end - start, 6),
+                    "thread": threading.current_thread().name,
+                    **fields,
+                }
+            )
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {
+            **self.fields,
+            "total_seconds": round(time.perf_counter() - self.started, 6),
+            "peak_rss_bytes": get_peak_rss(),
+            "spans": spans,
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+# Report for the job currently running in this process
+report = Report()
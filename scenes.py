@@ -0,0 +1,174 @@
+import io
+import subprocess
+
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+from config_loader import config
+from sidecar import get_sidecar_path, save_sidecar, touch_sidecar
+
+# Frames are compared at thumbnail size, decoded a batch at a time
+ANALYSIS_WIDTH = 64
+ANALYSIS_HEIGHT = 36
+BATCH_FRAMES = 256
+HISTOGRAM_BINS = 16
+
+# Change score of each analysed frame against the one before it
+SCORES_DTYPE = np.dtype([("frame", "<u4"), ("score", "<f4")])
+
+
+def get_histograms(pixels):
+    # Normalized per-channel colour histograms of a batch of frames at once
+    count = len(pixels)
+    bins = (pixels >> 4).astype(np.int64).reshape(count, -1, 3)
+    # Offset every channel and frame into its own run of bins
+    bins += np.arange(3) * HISTOGRAM_BINS
+    bins += np.arange(count)[:, None, None] * 3 * HISTOGRAM_BINS
+    histograms = np.bincount(bins.ravel(), minlength=count * 3 * HISTOGRAM_BINS)
+    pixel_count = ANALYSIS_WIDTH * ANALYSIS_HEIGHT
+    return histograms.reshape(count, 3 * HISTOGRAM_BINS) / pixel_count
+
+
+def score_changes(path, keyframes_only):
+    # Decode the video once at thumbnail size and score how much each frame
+    # differs from the previous one: half histogram distance, half pixel
+    # difference, both 0-1. Only keyframes are decoded for long videos.
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error"]
+    if keyframes_only:
+        command += ["-skip_frame", "nokey"]
+    # Analysis doesn't need the deblocked, full-precision picture
+    command += [
+        "-skip_loop_filter",
+        "all",
+        "-flags2",
+        "fast",
+        "-i",
+        path,
+        "-map",
+        "0:v:0",
+        "-vf",
+        f"scale={ANALYSIS_WIDTH}:{ANALYSIS_HEIGHT}:flags=fast_bilinear",
+        "-fps_mode",
+        "passthrough",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-",
+    ]
+    frame_bytes = ANALYSIS_WIDTH * ANALYSIS_HEIGHT * 3
+
+    scores = []
+    previous_pixels = None
+    previous_histogram = None
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes * BATCH_FRAMES)
+            count = len(data) // frame_bytes
+            if not count:
+                break
+            pixels = np.frombuffer(data[: count * frame_bytes], dtype=np.uint8)
+            pixels = pixels.reshape(count, ANALYSIS_HEIGHT, ANALYSIS_WIDTH, 3)
+            histograms = get_histograms(pixels)
+
+            # Each frame against the one before, the batch's first against
+            # the last frame of the previous batch
+            if previous_pixels is None:
+                previous_pixels = pixels[:1]
+                previous_histogram = histograms[:1]
+            before_pixels = np.concatenate([previous_pixels, pixels[:-1]])
+            before_histograms = np.concatenate([previous_histogram, histograms[:-1]])
+            histogram_change = np.abs(histograms - before_histograms).sum(axis=1) / 6
+            pixel_change = (
+                np.abs(pixels.astype(np.int16) - before_pixels).mean(axis=(1, 2, 3))
+                / 255
+            )
+            scores.append((histogram_change + pixel_change) / 2)
+
+            previous_pixels = pixels[-1:].copy()
+            previous_histogram = histograms[-1:]
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if not scores:
+        return np.zeros(0)
+    return np.concatenate(scores)
+
+
+def load_change_scores(path, index):
+    # Scored once per file and reused from the sidecar; the cut threshold is
+    # applied afterwards so changing it needs no new pass
+    sidecar_path = get_sidecar_path(path, ".scenes.npy")
+    try:
+        scores = np.load(sidecar_path)
+        if scores.dtype == SCORES_DTYPE:
+            touch_sidecar(sidecar_path)
+            return scores
+    except (OSError, ValueError):
+        pass
+
+    duration = index.frame_time(len(index) - 1) if len(index) else 0
+    keyframes_only = duration > config.SCENE_FULL_DECODE_SECONDS
+    changes = score_changes(path, keyframes_only)
+    # Decoded frames come out in display order, the index's order
+    frame_numbers = index.keyframes if keyframes_only else np.arange(len(index))
+    count = min(len(changes), len(frame_numbers))
+    scores = np.empty(count, dtype=SCORES_DTYPE)
+    scores["frame"] = frame_numbers[:count]
+    scores["score"] = changes[:count]
+
+    data = io.BytesIO()
+    np.save(data, scores)
+    save_sidecar(sidecar_path, data.getvalue())
+    return scores
+
+
+def find_scenes(scores, index):
+    # (first frame, end frame) of each scene. A cut is a frame scoring above
+    # the threshold that comes at least SCENE_MIN_SECONDS after the last one,
+    # so flashes and fast motion don't split scenes.
+    starts = [0]
+    for frame, score in zip(scores["frame"], scores["score"]):
+        if score < config.SCENE_CUT_THRESHOLD or frame == 0:
+            continue
+        if index.frame_time(frame) - index.frame_time(starts[-1]) >= config.SCENE_MIN_SECONDS:
+            starts.append(int(frame))
+    return list(zip(starts, starts[1:] + [len(index)]))
+
+
+def pick_scene_frames(scenes, budget):
+    # One frame from the middle of each scene, the longest scenes first when
+    # there are more scenes than the budget; spare frames go to long scenes
+    lengths = np.array([end - start for start, end in scenes], dtype=float)
+    if len(scenes) >= budget:
+        kept = sorted(np.argsort(-lengths, kind="stable")[:budget])
+        counts = {scene: 1 for scene in kept}
+    else:
+        share = lengths / lengths.sum() * (budget - len(scenes))
+        extra = np.floor(share).astype(int)
+        # Hand out what rounding left over by largest remainder
+        for scene in np.argsort(-(share - extra), kind="stable")[
+            : budget - len(scenes) - extra.sum()
+        ]:
+            extra[scene] += 1
+        counts = {scene: 1 + extra[scene] for scene in range(len(scenes))}
+
+    frames = []
+    for scene, count in sorted(counts.items()):
+        start, end = scenes[scene]
+        count = min(count, end - start)
+        frames += [start + int((i + 0.5) * (end - start) / count) for i in range(count)]
+    return frames
+
+
+def sample_scene_frames(path, index, budget):
+    # Frame numbers to show in the crop preview, covering every scene
+    if not len(index):
+        return []
+    scenes = find_scenes(load_change_scores(path, index), index)
+    print(f"Found {len(scenes)} scene(s)")
+    return pick_scene_frames(scenes, budget)
@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+from config_loader import config
+from utils import format_path, remove_temp_dir
+
+LOCK_FILE = "job.lock"
+
+
+class ScratchJob:
+    # A unique working directory for one job, kept alive by a heartbeat in its
+    # lockfile so crashed jobs can be told apart from running ones
+
+    def __init__(self, root, name, path=None):
+        # An existing path is adopted when resuming an interrupted job
+        if path is None:
+            os.makedirs(root, exist_ok=True)
+            path = os.path.join(root, f"{name}-{uuid.uuid4().hex[:8]}")
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self.lock_path = os.path.join(self.path, LOCK_FILE)
+
+        self._stop = threading.Event()
+        self.released = False
+        self.write_heartbeat()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def write_heartbeat(self):
+        lock = {"pid": os.getpid(), "host": socket.gethostname(), "heartbeat": time.time()}
+
+        # Write then rename so a sweeper never reads a half-written lock
+        staging_path = f"{self.lock_path}.tmp"
+        with open(staging_path, "w") as f:
+            json.dump(lock, f)
+        os.replace(staging_path, self.lock_path)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(config.SCRATCH_HEARTBEAT_SECONDS):
+            try:
+                self.write_heartbeat()
+            except OSError as e:
+                print(f"Warning: Could not update scratch heartbeat: {e}")
+
+    def release(self, keep=False, background=False):
+        # Only the first call counts, so a failing job can always release
+        if self.released:
+            return
+        self.released = True
+        self._stop.set()
+        self._heartbeat_thread.join()
+
+        if keep:
+            # Without a lock the directory is never swept
+            if os.path.exists(self.lock_path):
+                os.remove(self.lock_path)
+        elif os.path.exists(self.path):
+            remove_temp_dir(self.path, background=background)
+
+
+def get_scratch_roots():
+    roots = [config.TEMP_DIR]
+    if config.RAM_SCRATCH_ROOT:
+        roots.append(config.RAM_SCRATCH_ROOT)
+    return roots
+
+
+def choose_scratch_root(expected_size=None):
+    # Small jobs go to RAM when there's room, unknown or large ones spill to disk
+    ram_root = config.RAM_SCRATCH_ROOT
+    if not ram_root or expected_size is None:
+        return config.TEMP_DIR
+    if expected_size > config.RAM_SCRATCH_MAX_BYTES:
+        return config.TEMP_DIR
+
+    # Check free space on the filesystem that will hold the RAM root
+    existing_parent = ram_root
+    while not os.path.exists(existing_parent):
+        existing_parent = os.path.dirname(existing_parent)
+    try:
+        free = shutil.disk_usage(existing_parent).free
+    except OSError:
+        return config.TEMP_DIR
+
+    # Leave room for intermediates (temp audio, second-pass output)
+    if free < expected_size * 3:
+        return config.TEMP_DIR
+    return ram_root
+
+
+def is_process_alive(pid):
+    # Signal 0 is a CTRL_C_EVENT on Windows, so rely on heartbeats there
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_stale(lock_path):
+    try:
+        with open(lock_path) as f:
+            lock = json.load(f)
+    except (OSError, ValueError):
+        # Unreadable lock: fall back to its age
+        try:
+            age = time.time() - os.path.getmtime(lock_path)
+        except OSError:
+            return False
+        return age > config.SCRATCH_STALE_SECONDS
+
+    # On this host the owner's PID settles it, so a job that was suspended or
+    # starved past the timeout isn't swept while it still runs. Other hosts
+    # (and Windows, which can't check the PID) go by the heartbeat.
+    if lock.get("host") == socket.gethostname() and os.name != "nt":
+        return not is_process_alive(lock.get("pid", -1))
+    return time.time() - lock.get("heartbeat", 0) > config.SCRATCH_STALE_SECONDS
+
+
+def sweep_stale_jobs(keep=()):
+    # Remove job directories whose owner died without cleaning up
+    keep = {os.path.normcase(os.path.abspath(path)) for path in keep}
+    swept = 0
+
+    for root in get_scratch_roots():
+        if not os.path.isdir(root):
+            continue
+        for entry in os.scandir(root):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if os.path.normcase(os.path.abspath(entry.path)) in keep:
+                continue
+            lock_path = os.path.join(entry.path, LOCK_FILE)
+            if not os.path.exists(lock_path) or not is_stale(lock_path):
+                continue
+            try:
+                remove_temp_dir(entry.path)
+                swept += 1
+            except OSError as e:
+                print(f"Warning: Could not remove stale job {format_path(entry.path)}: {e}")
+
+    if swept:
+        print(f"Removed {swept} abandoned job director{'y' if swept == 1 else 'ies'}")
+    return swept
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from config_loader import config
+
+
+def get_sidecar_path(path, suffix):
+    # Keyed by path, modification time and size, so an edited file is read again
+    stat = os.stat(path)
+    key = hashlib.blake2b(
+        f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode(),
+        digest_size=16,
+    ).hexdigest()
+    return os.path.join(config.MEDIA_INDEX_DIR, f"{key}{suffix}")
+
+
+def touch_sidecar(sidecar_path):
+    # Mark a sidecar as used so pruning keeps it
+    try:
+        os.utime(sidecar_path)
+    except OSError:
+        pass
+
+
+def save_sidecar(sidecar_path, data):
+    # Written under a temporary name of its own, so readers never see half a
+    # file and writers of the same sidecar (a download's GUI and its queued
+    # crop probing at once) don't clobber each other
+    staging_path = None
+    try:
+        os.makedirs(config.MEDIA_INDEX_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=config.MEDIA_INDEX_DIR,
+            prefix=f"{os.path.basename(sidecar_path)}.",
+            suffix=".partial",
+            delete=False,
+        ) as f:
+            staging_path = f.name
+            f.write(data)
+        os.replace(staging_path, sidecar_path)
+        prune_sidecars()
+    except OSError as e:
+        print(f"Warning: could not save {os.path.basename(sidecar_path)}: {e}")
+        if staging_path and os.path.exists(staging_path):
+            os.remove(staging_path)
+
+
+def prune_sidecars():
+    # Drop sidecars of files that haven't been looked at for a while
+    cutoff = time.time() - config.MEDIA_INDEX_MAX_AGE_SECONDS
+    for entry in os.scandir(config.MEDIA_INDEX_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,353 @@
+import glob
+import os
+import queue
+import struct
+import subprocess
+import tempfile
+import threading
+
+import yt_dlp
+from moviepy.config import FFMPEG_BINARY
+from yt_dlp.networking import Request
+
+from config_loader import config
+from frame_index import decode_first_frame
+from probe import QUICKTIME_ATOMS, SNIFF_BYTES, sniff_extension
+from report import report
+from utils import (
+    download_media,
+    format_path,
+    get_encoding_settings,
+    get_ffmpeg_output_args,
+    get_media_type,
+    get_ytdlp_options,
+    MediaType,
+)
+
+# Protocols yt-dlp hands over as one plain file that can be read front to back
+STREAMABLE_PROTOCOLS = {"http", "https"}
+
+# ISO base media boxes that let a decoder start before the media data: the
+# index, or the first fragment of a fragmented file
+ISO_INDEX_BOXES = {b"moov", b"moof"}
+
+# How often the download thread checks whether the encoder has given up
+# while it waits for room in the buffer
+STOP_POLL_SECONDS = 0.1
+
+
+def is_progressive(head):
+    # Whether a file starting with these bytes can be decoded as it arrives:
+    # True or False, or None when more bytes are needed to tell
+    if len(head) < 8:
+        return None
+    if head[4:8] != b"ftyp" and head[4:8] not in QUICKTIME_ATOMS:
+        # Matroska/WebM, FLV, MPEG-TS, Ogg and the like decode front to back
+        return True
+
+    # MP4/MOV: decodable only if the index comes before the media data
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box_type = struct.unpack(">I4s", head[offset : offset + 8])
+        if box_type in ISO_INDEX_BOXES:
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1:
+            # 64-bit size after the type
+            if offset + 16 > len(head):
+                return None
+            size = struct.unpack(">Q", head[offset + 8 : offset + 16])[0]
+        elif size == 0:
+            # Last box, running to the end of the file
+            return False
+        if size < 8:
+            return False
+        offset += size
+    return None
+
+
+def get_url_validator(url):
+    # What identifies the current content behind a URL without downloading
+    # it: the ETag, Last-Modified and Content-Length of the file yt-dlp
+    # resolves it to. None when the server gives none of them or the URL
+    # isn't a single plain file, so the content can't be told apart.
+    ydl = yt_dlp.YoutubeDL({**get_ytdlp_options(), "quiet": True})
+    try:
+        info = ydl.extract_info(url, download=False)
+        if info.get("protocol") not in STREAMABLE_PROTOCOLS or not info.get("url"):
+            return None
+        request = Request(
+            info["url"], headers=info.get("http_headers") or {}, method="HEAD"
+        )
+        with ydl.urlopen(request) as response:
+            validators = [
+                response.headers.get(name)
+                for name in ("ETag", "Last-Modified", "Content-Length")
+            ]
+    except Exception as e:
+        print(f"Can't check the URL for changes: {e}")
+        return None
+    finally:
+        ydl.close()
+    if not any(validators):
+        return None
+    return "|".join(value or "" for value in validators)
+
+
+class DownloadStream:
+    # An HTTP download read front to back. Its first bytes are read ahead to
+    # recognize the container, then handed out again with the rest.
+
+    def __init__(self, ydl, response, head, ext, progressive):
+        self.ydl = ydl
+        self.response = response
+        self.head = head
+        self.ext = ext
+        self.progressive = progressive
+
+    def chunks(self):
+        yield self.head
+        while True:
+            chunk = self.response.read(config.STREAM_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.response.close()
+        self.ydl.close()
+
+
+def open_stream(url):
+    # Start downloading the URL if yt-dlp resolves it to a single plain file;
+    # None when it would have to assemble the download (HLS, DASH, separate
+    # audio and video) or resolving fails
+    ydl = yt_dlp.YoutubeDL({**get_ytdlp_options(), "quiet": True})
+    try:
+        info = ydl.extract_info(url, download=False)
+        if info.get("protocol") not in STREAMABLE_PROTOCOLS or not info.get("url"):
+            ydl.close()
+            return None
+        request = Request(info["url"], headers=info.get("http_headers") or {})
+        response = ydl.urlopen(request)
+    except Exception as e:
+        print(f"Can't stream the download: {e}")
+        ydl.close()
+        return None
+
+    # Read just far enough to tell whether the container decodes as it comes
+    head = b""
+    progressive = None
+    while progressive is None and len(head) < config.STREAM_PROBE_BYTES:
+        chunk = response.read(config.STREAM_CHUNK_BYTES)
+        if not chunk:
+            break
+        head += chunk
+        progressive = is_progressive(head)
+
+    ext = sniff_extension(head[:SNIFF_BYTES]) or f".{info.get('ext', '')}"
+    progressive = bool(progressive) and get_media_type(ext) == MediaType.VIDEO
+    return DownloadStream(ydl, response, head, ext, progressive)
+
+
+def save_stream(stream, output_path):
+    # Write the whole download to disk, for files that need seeking
+    downloaded_path = f"{output_path}/raw{stream.ext}"
+    try:
+        with report.span("download.stream") as span, open(downloaded_path, "wb") as f:
+            for chunk in stream.chunks():
+                f.write(chunk)
+            span["bytes"] = f.tell()
+    except Exception as e:
+        print(f"Download failed: {e}")
+        return None
+    finally:
+        stream.close()
+    print(f"Downloaded: {format_path(downloaded_path)}")
+    return downloaded_path
+
+
+def put_chunk(chunks, chunk, stopped):
+    # Wait for room in the queue unless the encoder has stopped taking chunks
+    while not stopped.is_set():
+        try:
+            chunks.put(chunk, timeout=STOP_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def feed_chunks(stream, chunks, stopped, errors):
+    # Download thread: hand chunks to the encoder through the bounded queue.
+    # A full queue blocks here, which stops reading from the network too.
+    try:
+        for chunk in stream.chunks():
+            if not put_chunk(chunks, chunk, stopped):
+                return
+    except Exception as e:
+        errors.append(e)
+    finally:
+        # End of the download
+        put_chunk(chunks, None, stopped)
+
+
+def crop_stream(stream, output_path, x, y, width, height, encoding_profile=None):
+    # Crop and encode a progressive download as it arrives: ffmpeg reads the
+    # download from a pipe while a separate thread keeps the network busy,
+    # at most STREAM_BUFFER_CHUNKS chunks ahead
+    width -= width % 2
+    height -= height % 2
+    print(
+        f"Cropping video while downloading: X={x}, Y={y}, Width={width}, Height={height}"
+    )
+
+    ext = stream.ext
+    cropped_video_path = f"{output_path}/cropped{ext}"
+    settings = get_encoding_settings(ext, encoding_profile)
+    print(
+        f"Encoding profile: {settings['name']} "
+        f"({settings['codec']}, preset {settings['preset']})"
+    )
+    command = [
+        FFMPEG_BINARY,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-i",
+        "pipe:0",
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        "-vf",
+        f"crop={width}:{height}:{x}:{y}",
+        *get_ffmpeg_output_args(settings, ext),
+        cropped_video_path,
+    ]
+
+    chunks = queue.Queue(maxsize=config.STREAM_BUFFER_CHUNKS)
+    stopped = threading.Event()
+    errors = []
+    with report.span("stream", media="video") as span, tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=log)
+        feeder = threading.Thread(
+            target=feed_chunks, args=(stream, chunks, stopped, errors), daemon=True
+        )
+        feeder.start()
+
+        bytes_in = 0
+        try:
+            while (chunk := chunks.get()) is not None:
+                process.stdin.write(chunk)
+                bytes_in += len(chunk)
+        except BrokenPipeError:
+            # ffmpeg gave up; its log says why
+            pass
+        finally:
+            stopped.set()
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.wait()
+            feeder.join()
+            stream.close()
+
+        if errors:
+            print(f"Download failed: {errors[0]}")
+            return None
+        if process.returncode != 0 or not os.path.exists(cropped_video_path):
+            log.seek(0)
+            print(f"Error during video cropping: {log.read().decode(errors='replace')}")
+            return None
+
+        span["bytes_in"] = bytes_in
+        span["bytes"] = os.path.getsize(cropped_video_path)
+
+    print(f"Video cropping completed! Output saved to: {format_path(cropped_video_path)}")
+    return cropped_video_path
+
+
+class BackgroundDownload:
+    # download_media on a separate thread, so the GUI can open right away.
+    # yt-dlp writes to raw.<ext>.part until it is done; once the start of
+    # that file can be decoded its first frame is shown to crop on.
+
+    def __init__(self, url, output_path):
+        self.url = url
+        self.output_path = output_path
+        self.media_path = None
+        # Whether the partial file decodes from the front; None until known
+        self.progressive = None
+        self.finished = threading.Event()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.media_path = download_media(
+                self.url, self.output_path, progress_hook=self.check_cancelled
+            )
+        finally:
+            self.finished.set()
+
+    def check_cancelled(self, progress):
+        if self.cancelled.is_set():
+            raise yt_dlp.utils.DownloadCancelled()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def done(self):
+        return self.finished.is_set()
+
+    def wait(self):
+        self.finished.wait()
+        return self.media_path
+
+    def partial_path(self):
+        parts = glob.glob(os.path.join(glob.escape(self.output_path), "raw.*.part"))
+        return parts[0] if parts else None
+
+    def downloaded_bytes(self):
+        path = self.partial_path()
+        try:
+            return os.path.getsize(path) if path else 0
+        except OSError:
+            # Renamed to the finished file in the meantime
+            return 0
+
+    def first_frame(self):
+        # First frame of the partial download, or None while too little of it
+        # has arrived. Once the file turns out not to decode from the front
+        # (or not to be a video) it stays None without reading the file again.
+        if self.progressive is False:
+            return None
+        path = self.partial_path()
+        if not path:
+            return None
+
+        if self.progressive is None:
+            try:
+                with open(path, "rb") as f:
+                    head = f.read(config.STREAM_PROBE_BYTES)
+            except OSError:
+                return None
+            if len(head) < SNIFF_BYTES:
+                return None
+            progressive = is_progressive(head)
+            if progressive is None and len(head) >= config.STREAM_PROBE_BYTES:
+                progressive = False
+            if progressive is None:
+                return None
+            ext = sniff_extension(head[:SNIFF_BYTES]) or ""
+            self.progressive = progressive and get_media_type(ext) == MediaType.VIDEO
+            if not self.progressive:
+                return None
+        return decode_first_frame(path)
@@ -1,14 +1,30 @@
 import os
+import re
+import sys
 import glob
+import time
+import shutil
 import subprocess
 from enum import Enum
 
 import yt_dlp
-from moviepy import VideoFileClip
-from moviepy.video.fx import Crop
-from PIL import Image
+from moviepy.video.fx import Crop, Resize
 
 from config_loader import runtime_config, config
+from crop_path import apply_crop_path
+from animation import crop_animation, is_animated
+from image_roi import read_region
+from jpeg_crop import crop_jpeg, JPEG_EXTENSIONS
+from media_source import MediaSource
+from report import report
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+# ioctl request for copy-on-write clones on Linux (btrfs, XFS, ...)
+FICLONE = 0x40049409
 
 
 class MediaType(Enum):
@@ -35,7 +51,7 @@ def get_media_type(ext):
     
     # Image extensions
     image_extensions = {
-        'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'tif', 'webp', 
+        'jpg', 'jpeg', 'png', 'apng', 'gif', 'bmp', 'tiff', 'tif', 'webp', 
         'svg', 'ico', 'psd', 'raw', 'cr2', 'nef', 'dng'
     }
     
@@ -66,33 +82,146 @@ def format_path(path):
     return f'"{normalized_path}"'
 
 
-def download_media(url, output_path):
-    # First try yt-dlp
+def parse_size(size_string):
+    # Parse sizes like "8MB", "25M" or "1.5GiB" into bytes (MB = 1000^2, MiB = 1024^2)
+    match = re.fullmatch(
+        r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)(i?)b?\s*", size_string, re.IGNORECASE
+    )
+    if not match:
+        raise ValueError(f"Invalid size: {size_string}")
+
+    number, prefix, binary = match.groups()
+    base = 1024 if binary else 1000
+    exponent = " kmg".index(prefix.lower() or " ")
+    return int(float(number) * base**exponent)
+
+
+def parse_crop(crop_string):
+    # Parse a headless crop rectangle given as "x,y,width,height"
+    try:
+        x, y, width, height = (int(value) for value in crop_string.split(","))
+    except ValueError:
+        raise ValueError(f"Invalid crop: {crop_string} (expected x,y,width,height)")
+    if width <= 0 or height <= 0 or x < 0 or y < 0:
+        raise ValueError(f"Invalid crop: {crop_string} (negative or empty rectangle)")
+    return x, y, width, height
+
+
+def parse_aspect_ratio(ratio_string):
+    # Parse an aspect ratio given as "width:height" into width / height
+    try:
+        width, height = (float(value) for value in ratio_string.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid aspect ratio: {ratio_string} (expected W:H)")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid aspect ratio: {ratio_string} (must be positive)")
+    return width / height
+
+
+def parse_bitrate(bitrate_string):
+    # Parse ffmpeg-style bitrates like "128k" or "4M" into bits per second
+    return parse_size(bitrate_string.lower().replace("i", ""))
+
+
+def reflink_file(source_path, destination_path):
+    if fcntl is None:
+        return False
+
+    try:
+        with open(source_path, "rb") as source, open(destination_path, "wb") as dest:
+            fcntl.ioctl(dest.fileno(), FICLONE, source.fileno())
+        shutil.copystat(source_path, destination_path)
+        return True
+    except OSError:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        return False
+
+
+def finalize_output(source_path, destination_path, keep_source=False, allow_hardlink=True):
+    # Stage next to the destination so the final os.replace is atomic
+    staging_path = f"{destination_path}.partial"
+    destination_dir = os.path.dirname(os.path.abspath(destination_path))
+    same_device = os.stat(source_path).st_dev == os.stat(destination_dir).st_dev
+
+    if same_device:
+        # Rename in place - no bytes are written
+        if not keep_source:
+            try:
+                os.replace(source_path, destination_path)
+                return "moved"
+            except OSError:
+                pass
+
+        # Copy-on-write clone shares the data blocks with the source
+        if reflink_file(source_path, staging_path):
+            os.replace(staging_path, destination_path)
+            if not keep_source:
+                os.remove(source_path)
+            return "cloned"
+
+        # Hardlink shares the inode, so only use it for files we own
+        if allow_hardlink:
+            try:
+                os.link(source_path, staging_path)
+                os.replace(staging_path, destination_path)
+                if not keep_source:
+                    os.remove(source_path)
+                return "linked"
+            except OSError:
+                if os.path.exists(staging_path):
+                    os.remove(staging_path)
+
+    # Last resort: copy across filesystems
+    try:
+        shutil.copy2(source_path, staging_path)
+        os.replace(staging_path, destination_path)
+    except BaseException:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        raise
+    if not keep_source:
+        os.remove(source_path)
+    return "copied"
+
+
+def get_ytdlp_options():
+    # Format selection and authentication shared by every yt-dlp call
+    ydl_opts = {
+        "format": "best",
+        "noplaylist": True,
+    }
     if config.BROWSER:
-        ydl_opts = {
-            "outtmpl": f"{output_path}/raw.%(ext)s",
-            "format": "best", 
-            "noplaylist": True,
-            "cookiesfrombrowser": (config.BROWSER,),
-        }
-    else:
-        ydl_opts = {
-            "outtmpl": f"{output_path}/raw.%(ext)s",
-            "format": "best", 
-            "noplaylist": True,
-        }
-    
+        ydl_opts["cookiesfrombrowser"] = (config.BROWSER,)
+    return ydl_opts
+
+
+def download_media(url, output_path, progress_hook=None):
+    # First try yt-dlp
+    ydl_opts = {
+        **get_ytdlp_options(),
+        "outtmpl": f"{output_path}/raw.%(ext)s",
+        "continuedl": True,  # Resume .part files left by an interrupted job
+    }
+    if progress_hook:
+        # Called for every chunk; raising DownloadCancelled stops the download
+        ydl_opts["progress_hooks"] = [progress_hook]
+
     try:
         print("Attempting download with yt-dlp...")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with report.span("download.yt-dlp") as span, yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=True)
             ext = info.get("ext")
             downloaded_path = f"{output_path}/raw.{ext}"
             
             if os.path.exists(downloaded_path):
+                span["bytes"] = os.path.getsize(downloaded_path)
                 print(f"Downloaded via yt-dlp: {format_path(downloaded_path)}")
                 return downloaded_path
                 
+    except yt_dlp.utils.DownloadCancelled:
+        print("Download cancelled")
+        return None
     except Exception:
         print(f"yt-dlp failed")
         print("Attempting download with gallery-dl...")
@@ -113,11 +242,17 @@ def download_media(url, output_path):
             
             cmd.append(url)
             
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            print("gallery-dl output:", result.stdout)
-            
-            # Find the downloaded file
-            downloaded_files = glob.glob(f"{output_path}/*/*/raw.*")
+            with report.span("download.gallery-dl") as span:
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, check=True
+                )
+                print("gallery-dl output:", result.stdout)
+
+                # Find the downloaded file
+                downloaded_files = glob.glob(f"{output_path}/*/*/raw.*")
+                if downloaded_files:
+                    span["bytes"] = os.path.getsize(downloaded_files[0])
+
             if downloaded_files:
                 downloaded_path = downloaded_files[0]
                 print(f"Downloaded via gallery-dl: {format_path(downloaded_path)}")
@@ -141,66 +276,362 @@ def download_media(url, output_path):
         
 
 
-def crop_video(video_path, output_path, x, y, width, height):
+# libvpx has no x264-style presets, so map preset names onto its speed setting
+VPX_CPU_USED = {
+    "ultrafast": 8,
+    "superfast": 7,
+    "veryfast": 6,
+    "faster": 5,
+    "fast": 4,
+    "medium": 3,
+    "slow": 2,
+    "slower": 1,
+    "veryslow": 0,
+}
+
+# Extension for moviepy's intermediate audio file, by audio codec
+AUDIO_CODEC_EXTENSIONS = {
+    "aac": "m4a",
+    "libopus": "ogg",
+    "libvorbis": "ogg",
+    "libmp3lame": "mp3",
+}
+
+
+def get_encoding_settings(ext, profile_name=None):
+    ext = (ext or config.DEFAULT_CONTAINER).lower()
+    container = config.CONTAINER_DEFAULTS.get(
+        ext, config.CONTAINER_DEFAULTS[config.DEFAULT_CONTAINER]
+    )
+
+    # Fall back to the container's default profile
+    if profile_name is None:
+        profile_name = container["profile"]
+    if profile_name not in config.ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile: {profile_name}")
+
+    settings = {
+        "name": profile_name,
+        "codec": container["codec"],
+        "audio_codec": container["audio_codec"],
+        "audio_fps": container.get("audio_fps", 44100),
+        "preset": "medium",
+        "crf": None,
+        "bitrate": None,
+        "audio_bitrate": None,
+        "threads": None,
+        "pixel_format": container.get("pixel_format"),
+        "faststart": False,
+    }
+    settings.update(
+        {
+            key: value
+            for key, value in config.ENCODING_PROFILES[profile_name].items()
+            if value is not None
+        }
+    )
+    return settings
+
+
+def get_write_options(settings, ext):
+    codec = settings["codec"]
+    ffmpeg_params = []
+
+    if codec.startswith("libvpx"):
+        cpu_used = VPX_CPU_USED.get(settings["preset"], 3)
+        ffmpeg_params.extend(["-deadline", "good", "-cpu-used", str(cpu_used)])
+        if settings["crf"] is not None:
+            ffmpeg_params.extend(["-crf", str(settings["crf"])])
+            # VP9 only runs in constant quality mode without a bitrate cap
+            if settings["bitrate"] is None:
+                ffmpeg_params.extend(["-b:v", "0"])
+    elif settings["crf"] is not None and settings["bitrate"] is None:
+        ffmpeg_params.extend(["-crf", str(settings["crf"])])
+
+    if settings["pixel_format"]:
+        ffmpeg_params.extend(["-pix_fmt", settings["pixel_format"]])
+
+    if settings["faststart"] and ext.lower() in (".mp4", ".m4v", ".mov"):
+        ffmpeg_params.extend(["-movflags", "+faststart"])
+
+    return {
+        "codec": codec,
+        "audio_codec": settings["audio_codec"],
+        "audio_fps": settings["audio_fps"],
+        "preset": settings["preset"],
+        "bitrate": settings["bitrate"],
+        "audio_bitrate": settings["audio_bitrate"],
+        "threads": settings["threads"],
+        "ffmpeg_params": ffmpeg_params,
+    }
+
+
+def get_ffmpeg_output_args(settings, ext):
+    # The same encoder settings as ffmpeg arguments, for encodes that feed
+    # ffmpeg directly instead of going through moviepy
+    options = get_write_options(settings, ext)
+    args = ["-c:v", options["codec"]]
+    if not options["codec"].startswith("libvpx"):
+        args += ["-preset", options["preset"]]
+    if options["bitrate"]:
+        args += ["-b:v", options["bitrate"]]
+    if options["threads"] is not None:
+        args += ["-threads", str(options["threads"])]
+    args += options["ffmpeg_params"]
+    args += ["-c:a", options["audio_codec"], "-ar", str(options["audio_fps"])]
+    if options["audio_bitrate"]:
+        args += ["-b:a", options["audio_bitrate"]]
+    return args
+
+
+def get_target_bitrates(target_size, duration, has_audio):
+    if not duration or duration <= 0:
+        raise ValueError("Cannot target a file size without a known duration")
+
+    # Total bits per second available once container overhead is set aside
+    total_bitrate = target_size * 8 * (1 - config.TARGET_SIZE_OVERHEAD) / duration
+
+    audio_bitrate = parse_bitrate(config.TARGET_SIZE_AUDIO_BITRATE) if has_audio else 0
+    min_audio_bitrate = parse_bitrate(config.TARGET_SIZE_MIN_AUDIO_BITRATE)
+
+    # Give video at least three quarters of the budget before squeezing audio
+    if has_audio and audio_bitrate > total_bitrate / 4:
+        audio_bitrate = max(min_audio_bitrate, round(total_bitrate / 4))
+
+    video_bitrate = round(total_bitrate - audio_bitrate)
+    if video_bitrate <= 0:
+        raise ValueError(
+            f"Target size of {target_size} bytes is too small for {duration:.1f}s of video"
+        )
+
+    return video_bitrate, audio_bitrate
+
+
+def write_target_size(clip, cropped_video_path, settings, ext, target_size, temp_audio_path):
+    output_path = os.path.dirname(cropped_video_path)
+    passlog_path = f"{output_path}/ffmpeg2pass"
+
+    video_bitrate, audio_bitrate = get_target_bitrates(
+        target_size, clip.duration, clip.audio is not None
+    )
+
+    # Bitrate-driven encode: CRF would override the bitrate we computed
+    settings = dict(settings, crf=None)
+    if audio_bitrate:
+        settings["audio_bitrate"] = f"{audio_bitrate // 1000}k"
+
+    print(
+        f"Targeting {target_size} bytes over {clip.duration:.1f}s: "
+        f"video {video_bitrate // 1000}k, audio {audio_bitrate // 1000}k"
+    )
+
     try:
-        # Ensure dimensions are even numbers (required for H.264)
+        # First pass only gathers statistics: no audio, and the encoded video
+        # goes to the null muxer instead of a file
+        settings["bitrate"] = f"{video_bitrate // 1000}k"
+        write_options = get_write_options(settings, ext)
+        write_options["ffmpeg_params"] += [
+            "-pass",
+            "1",
+            "-passlogfile",
+            passlog_path,
+            "-an",
+            "-f",
+            "null",
+        ]
+        clip.write_videofile(os.devnull, audio=False, **write_options)
+
+        for attempt in range(1, config.TARGET_SIZE_MAX_ATTEMPTS + 1):
+            settings["bitrate"] = f"{video_bitrate // 1000}k"
+            write_options = get_write_options(settings, ext)
+            write_options["ffmpeg_params"] += ["-pass", "2", "-passlogfile", passlog_path]
+            clip.write_videofile(
+                cropped_video_path,
+                temp_audiofile=temp_audio_path,
+                remove_temp=not runtime_config.keep_temp_files,
+                **write_options,
+            )
+
+            # Check the result and retry with a proportionally lower bitrate if over
+            actual_size = os.path.getsize(cropped_video_path)
+            if actual_size <= target_size:
+                print(f"Output is {actual_size} bytes (target {target_size} bytes)")
+                return True
+
+            print(
+                f"Attempt {attempt}: output is {actual_size} bytes, "
+                f"over the {target_size} byte target"
+            )
+            video_bitrate = round(video_bitrate * target_size / actual_size * 0.97)
+
+        print("Warning: could not reach the target size, keeping the last attempt")
+        return False
+
+    finally:
+        # Remove the encoder statistics
+        if not runtime_config.keep_temp_files:
+            for leftover in glob.glob(f"{glob.escape(passlog_path)}*"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+
+def crop_video(
+    video_path,
+    output_path,
+    x,
+    y,
+    width,
+    height,
+    encoding_profile=None,
+    target_size=None,
+    media_info=None,
+    crop_path=None,
+):
+    try:
+        # Ensure dimensions are even numbers (required for 4:2:0 chroma subsampling)
         if width % 2 == 1:
             width -= 1
-            print(f"Adjusted width to {width} (must be even for H.264)")
+            print(f"Adjusted width to {width} (must be even for 4:2:0 video)")
         if height % 2 == 1:
             height -= 1
-            print(f"Adjusted height to {height} (must be even for H.264)")
+            print(f"Adjusted height to {height} (must be even for 4:2:0 video)")
 
-        print(
-            f"Cropping video with coordinates: X={x}, Y={y}, Width={width}, Height={height}"
-        )
+        if crop_path:
+            print(f"Cropping video along a path of {len(crop_path)} keyframes")
+        else:
+            print(
+                f"Cropping video with coordinates: X={x}, Y={y}, Width={width}, Height={height}"
+            )
 
         if not video_path:
             print("No video path provided - cannot crop video")
             return
 
-        # Load the video
-        clip = VideoFileClip(video_path)
-
-        # Crop the video
-        crop_effect = Crop(x1=x, y1=y, x2=x + width, y2=y + height)
-        cropped_clip = clip.with_effects([crop_effect])
-
-        # Generate output filename using the same extension as the input
+        # Generate output filename using the same extension as the input,
+        # or the one its content was recognized as
         _, original_ext = os.path.splitext(video_path)
-        # Default to .mp4 if no extension found, since we're using H.264/AAC codecs
-        ext = original_ext if original_ext else ".mp4"
+        if media_info:
+            original_ext = media_info["ext"]
+        # Default to the default container if no extension found
+        ext = original_ext if original_ext else config.DEFAULT_CONTAINER
         cropped_video_path = f"{output_path}/cropped{ext}"
 
+        # Pick codecs and encoder settings for the output container
+        settings = get_encoding_settings(ext, encoding_profile)
+        write_options = get_write_options(settings, ext)
+        print(
+            f"Encoding profile: {settings['name']} "
+            f"({settings['codec']}, preset {settings['preset']})"
+        )
+
         print(f"Saving cropped video to: {format_path(cropped_video_path)}")
 
         # Create temp audio file path in the same directory as output
-        temp_audio_path = f"{output_path}/temp-audio.m4a"
-
-        # Write the cropped video with Windows-compatible settings
-        cropped_clip.write_videofile(
-            cropped_video_path,
-            codec="libx264",
-            audio_codec="aac",
-            temp_audiofile=temp_audio_path,
-            remove_temp=not runtime_config.keep_temp_files,
-        )
+        audio_ext = AUDIO_CODEC_EXTENSIONS.get(settings["audio_codec"], "mka")
+        temp_audio_path = f"{output_path}/temp-audio.{audio_ext}"
+
+        # The source closes the reader even if encoding fails
+        with report.span("encode", media="video") as span, MediaSource(
+            video_path
+        ) as source:
+            # Crop the video, following the keyframed path if there is one
+            if crop_path:
+                cropped_clip = apply_crop_path(source.clip(), crop_path)
+            else:
+                crop_effect = Crop(x1=x, y1=y, x2=x + width, y2=y + height)
+                cropped_clip = source.clip().with_effects([crop_effect])
+
+            # Write the cropped video with the selected encoding profile
+            if target_size:
+                # Duration comes from the clip actually being encoded
+                write_target_size(
+                    cropped_clip,
+                    cropped_video_path,
+                    settings,
+                    ext,
+                    target_size,
+                    temp_audio_path,
+                )
+            else:
+                cropped_clip.write_videofile(
+                    cropped_video_path,
+                    temp_audiofile=temp_audio_path,
+                    remove_temp=not runtime_config.keep_temp_files,
+                    **write_options,
+                )
 
-        # Clean up
-        cropped_clip.close()
-        clip.close()
+            span["frames"] = round(cropped_clip.duration * cropped_clip.fps)
+            span["bytes_in"] = os.path.getsize(video_path)
+            span["bytes"] = os.path.getsize(cropped_video_path)
 
         print(
             f"Video cropping completed! Output saved to: {format_path(cropped_video_path)}"
         )
 
-    except ValueError:
-        print("Please enter valid integer values for cropping coordinates.")
+        return cropped_video_path
+
+    except ValueError as e:
+        print(f"Invalid crop settings: {e}")
     except Exception as e:
         print(f"Error during video cropping: {e}")
 
 
-def crop_image(image_path, output_path, x, y, width, height):
+def render_preview(video_path, output_path, x, y, width, height, crop_path=None):
+    # Quick look at the crop before the full encode: the first
+    # PREVIEW_RENDER_SECONDS (or the whole clip), scaled down, at a low frame
+    # rate, without audio and with the fastest x264 preset
+    try:
+        preview_path = f"{output_path}/preview.mp4"
+        print(f"Rendering crop preview to: {format_path(preview_path)}")
+
+        with report.span("preview", media="video") as span, MediaSource(
+            video_path
+        ) as source:
+            clip = source.clip()
+            if config.PREVIEW_RENDER_SECONDS:
+                seconds = min(clip.duration, config.PREVIEW_RENDER_SECONDS)
+                clip = clip.subclipped(0, seconds)
+
+            if crop_path:
+                clip = apply_crop_path(clip, crop_path)
+            else:
+                clip = clip.with_effects(
+                    [Crop(x1=x, y1=y, x2=x + width, y2=y + height)]
+                )
+
+            # Even dimensions, as 4:2:0 requires
+            preview_width, preview_height = clip.size
+            if preview_height > config.PREVIEW_RENDER_HEIGHT:
+                preview_width = round(
+                    preview_width * config.PREVIEW_RENDER_HEIGHT / preview_height
+                )
+                preview_height = config.PREVIEW_RENDER_HEIGHT
+            preview_size = (
+                max(2, preview_width - preview_width % 2),
+                max(2, preview_height - preview_height % 2),
+            )
+            if tuple(clip.size) != preview_size:
+                clip = clip.with_effects([Resize(preview_size)])
+
+            clip.write_videofile(
+                preview_path,
+                fps=min(clip.fps, config.PREVIEW_RENDER_FPS),
+                codec="libx264",
+                preset="ultrafast",
+                audio=False,
+                ffmpeg_params=["-crf", "30", "-pix_fmt", "yuv420p"],
+                logger=None,
+            )
+            span["bytes"] = os.path.getsize(preview_path)
+
+        print("Crop preview ready")
+        return preview_path
+
+    except Exception as e:
+        print(f"Error rendering crop preview: {e}")
+
+
+def crop_image(image_path, output_path, x, y, width, height, media_info=None):
     try:
         print(
             f"Cropping image with coordinates: X={x}, Y={y}, Width={width}, Height={height}"
@@ -210,24 +641,43 @@ def crop_image(image_path, output_path, x, y, width, height):
             print("No image path provided - cannot crop image")
             return
 
-        # Open the image
-        with Image.open(image_path) as img:
+        with report.span("encode", media="image") as span:
             # Define the crop box (left, top, right, bottom)
             crop_box = (x, y, x + width, y + height)
-            
-            # Crop the image
-            cropped_img = img.crop(crop_box)
-            
-            # Generate output filename using the same extension as the input
+
+            # Generate output filename using the same extension as the input,
+            # or the one its content was recognized as
             _, original_ext = os.path.splitext(image_path)
+            if media_info:
+                original_ext = media_info["ext"]
             # Default to .png if no extension found
             ext = original_ext if original_ext else ".png"
             cropped_image_path = f"{output_path}/cropped{ext}"
             
             print(f"Saving cropped image to: {format_path(cropped_image_path)}")
-            
-            # Save the cropped image
-            cropped_img.save(cropped_image_path)
+
+            if media_info:
+                animated = media_info.get("animated", False)
+            else:
+                animated = is_animated(image_path)
+
+            if animated:
+                # Every frame is cropped, one decoded frame at a time
+                span["method"] = "animated"
+                span["frames"] = crop_animation(
+                    image_path, cropped_image_path, crop_box
+                )
+                print(f"Cropped {span['frames']} animation frames")
+            elif ext.lower() in JPEG_EXTENSIONS:
+                # JPEGs are cropped without a generation loss where possible
+                span["method"] = crop_jpeg(image_path, cropped_image_path, crop_box)
+                print(f"JPEG crop method: {span['method']}")
+            else:
+                # Decode only the part of the image under the crop box
+                cropped_img = read_region(image_path, crop_box)
+                cropped_img.save(cropped_image_path)
+            span["bytes_in"] = os.path.getsize(image_path)
+            span["bytes"] = os.path.getsize(cropped_image_path)
             
             print(
                 f"Image cropping completed! Output saved to: {format_path(cropped_image_path)}"
@@ -240,3 +690,44 @@ def crop_image(image_path, output_path, x, y, width, height):
     except Exception as e:
         print(f"Error during image cropping: {e}")
         return None
+
+
+def remove_temp_dir(path, background=False):
+    if background:
+        # Delete from a detached process so the CLI can exit right away
+        command = [
+            sys.executable,
+            "-c",
+            "import shutil, sys; shutil.rmtree(sys.argv[1], ignore_errors=True)",
+            path,
+        ]
+        if os.name == "nt":
+            subprocess.Popen(
+                command,
+                creationflags=subprocess.DETACHED_PROCESS
+                | subprocess.CREATE_NEW_PROCESS_GROUP,
+            )
+        else:
+            subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        return
+
+    def retry_removal(function, failed_path, exc_info):
+        # Clear read-only flags (Windows) and give scanners a moment to let go
+        os.chmod(failed_path, 0o700)
+        for delay in (0.05, 0.2, 0.5):
+            try:
+                function(failed_path)
+                return
+            except FileNotFoundError:
+                return
+            except PermissionError:
+                time.sleep(delay)
+        function(failed_path)
+
+    shutil.rmtree(path, onerror=retry_removal)